@@ -1,91 +1,131 @@
-from datetime import datetime, timedelta
+import numpy as np
 import random
-from pytz import timezone
 
-from . import common_fields 
-from .device_event import suspend_pump, make_status_event 
-from .pump_settings import make_pump_settings
+from . import common_fields
+from .device_event import make_status_event
+from .pump_settings import PumpSettings
+from .timezones import zone_table
 from . import tools
 
-def scheduled_basal(start_time, num_days, zonename, pump_name):
+def scheduled_basal(start_time, num_days, zonename, pump_name, pump_settings=None, rng=random):
     """ Construct basal events based on a basal schedule from settings
+        The schedule is laid out over the whole date range at once, and temp basal and
+        suspend overrides are drawn for every segment in one batch. Events are created at
+        the end, in time order.
         start_time -- a datetime object with a timezone
         num_days -- integer reflecting total number of days over which data is generated
         zonename -- name of timezone in effect
+        pump_settings -- a PumpSettings object shared by every datatype, created if not given
+        rng -- random number generator to draw from
     """
-    basal_data, pump_suspended = [], []  
-    pump_settings = make_pump_settings(start_time, zonename=zonename, pump_name=pump_name)[0]
+    if pump_settings is None:
+        pump_settings = PumpSettings(start_time, zonename=zonename, pump_name=pump_name, rng=rng)
     offset = tools.get_offset(zonename, start_time)
     utc_time = tools.convert_ISO_to_epoch(str(start_time), '%Y-%m-%d %H:%M:%S')
-    next_time = int(utc_time - offset*60)
-    seconds_to_add = num_days * 24 * 60 * 60
-    end_time = next_time + seconds_to_add
-    while next_time < end_time:
-        basal_entry = {}
-        basal_entry = common_fields.add_common_fields('basal', basal_entry, next_time, zonename)
-        basal_entry["deliveryType"] = "scheduled"   
-        basal_entry["scheduleName"] = "standard"
-        
-        #get basal schedule from settings
-        schedule = pump_settings["basalSchedules"]["standard"] 
-        basal_entry["rate"], start, corrected_start, end = tools.get_rate_from_settings(schedule, basal_entry["deviceTime"] , "basalSchedules")
-        duration = (end - start) / 1000 #in seconds
-        zone = timezone(zonename)
-        
-        #localize start and end date to get acurate basal times in local time (not in UTC)
-        start_date, end_date = datetime.fromtimestamp(next_time), datetime.fromtimestamp(next_time + duration)
-        localized_start, localized_end = zone.localize(start_date), zone.localize(end_date)
-        start_offset, end_offset = tools.get_offset(zonename, start_date), tools.get_offset(zonename, end_date)
-        #account for time chance (DST)
-        if start_offset != end_offset:
-            diff = end_offset - start_offset
-            localized_end = localized_end - timedelta(minutes=diff)
-        elapsed_seconds = (localized_end - localized_start).total_seconds()
-        if next_time == int(utc_time - offset*60) or start != corrected_start:
-            basal_entry["duration"] = end - corrected_start 
-        else:
-            basal_entry["duration"] = int(elapsed_seconds * 1000)
-        basal_data.append(basal_entry)
-       
-        #Create temp basal event to override scheduled basal
-        if randomize_temp_basal() and start_offset == end_offset: #avoid temp basal during DST change
-            randomize_start = random.randrange(300000, 3000000, 60000) #randomize start of temp basal in ms  
-            start_temp = next_time + randomize_start/1000 
-            temp_entry, temp_duration = temp_basal(basal_entry, start_temp, zonename=zonename)
-            diff = basal_entry["duration"] - randomize_start
-            basal_entry["duration"] -= diff
-            basal_data.append(temp_entry)
-            next_time += (basal_entry["duration"] / 1000) + (temp_duration / 1000)
-        #Create suspened basal event to override scheduled basal
-        elif suspend_pump() and start_offset == end_offset:
-            basal_entry["deliveryType"] = "suspend" 
-            del basal_entry["rate"]
+    first_time = int(utc_time - offset*60)
+    end_time = first_time + num_days * 24 * 60 * 60
+    schedule = pump_settings.basal_schedule
+    starts, ends, rates = tile_schedule(schedule, zonename, first_time, end_time)
+    #no overrides across a time change (DST)
+    table = zone_table(zonename)
+    same_offset = (table.utc_offsets(starts) == table.utc_offsets(ends)).tolist()
+    starts, ends, rates = starts.tolist(), ends.tolist(), rates.tolist()
+    #a segment is split in pieces by the overrides ending in it, each piece gets its own draw
+    overrides = draw_overrides(2 * len(starts), rng)
+
+    events, pump_suspended = [], []
+    next_time, index = first_time, 0
+    while next_time < end_time and index < len(starts):
+        segment_end = ends[index]
+        if segment_end <= next_time: #covered by an override
+            index += 1
+            continue
+        if not overrides:
+            overrides = draw_overrides(len(starts), rng)
+        temp, suspend, temp_start, temp_duration, percent, suspend_duration = overrides.pop()
+        rate = rates[index]
+        scheduled = {"deliveryType": "scheduled", "scheduleName": "standard", "rate": rate,
+                     "duration": int(round((segment_end - next_time) * 1000))}
+        events.append(('basal', next_time, scheduled))
+        if temp and same_offset[index]:
+            scheduled["duration"] = temp_start
+            start_temp = next_time + temp_start / 1000
+            temp_entry = {"deliveryType": "temp", "duration": temp_duration, "percent": percent,
+                          "rate": rate * percent, "suppressed": scheduled}
+            events.append(('basal', start_temp, temp_entry))
+            next_time = start_temp + temp_duration / 1000
+        elif suspend and same_offset[index]:
+            scheduled["deliveryType"] = "suspend"
+            del scheduled["rate"]
+            scheduled["duration"] = suspend_duration
             #add device meta pump suspend and resume event
-            suspend_event = make_status_event('suspend', next_time, zonename)
-            suspend_duration = suspend_event['duration']
-            resume_event = make_status_event('resume', next_time + suspend_duration/1000, zonename)
-            basal_data.append(suspend_event)
-            basal_data.append(resume_event)
-            basal_entry["duration"] = suspend_duration
-            pump_suspended.append([next_time, next_time + basal_entry["duration"]/1000]) #track start/end times for suspension 
-            next_time += basal_entry["duration"] / 1000 
-        #update time to generate next basal
+            resume_time = next_time + suspend_duration / 1000
+            events.append(('suspend', next_time, suspend_duration))
+            events.append(('resume', resume_time, None))
+            pump_suspended.append([next_time, resume_time]) #track start/end times for suspension
+            next_time = resume_time
         else:
-            next_time += basal_entry["duration"] / 1000
-    return basal_data, pump_suspended
+            next_time = segment_end
+    return make_basal_events(events, zonename, rng), pump_suspended
 
-def temp_basal(scheduled_basal, start_time, zonename):
-    basal_entry = {}
-    basal_entry = (common_fields.add_common_fields('basal', basal_entry, start_time, zonename)) 
-    basal_entry["deliveryType"] = "temp"
-    basal_entry["duration"] = random.randrange(1200000, 21600000, 600000) #20min-6hrs
-    basal_entry["percent"] = random.randrange(5, 195, 10) / 100
-    basal_entry["rate"] = scheduled_basal["rate"] * basal_entry["percent"]
-    basal_entry["suppressed"] = scheduled_basal
-    return basal_entry, basal_entry["duration"]
+def tile_schedule(schedule, zonename, first_time, end_time):
+    """ Lay a daily schedule out over a range of epoch times
+        Segment boundaries are placed at their local time on every day, and converted to utc
+        with the transition table of the timezone, so days with a time change are shorter
+        or longer.
+        schedule -- a tools.Schedule
+        Returns numpy arrays of start times, end times and values of the segments in effect
+        from first_time until end_time, the first segment starts at first_time.
+    """
+    table = zone_table(zonename)
+    first_local = first_time + table.utc_offset(first_time) * 60
+    last_local = end_time + table.utc_offset(end_time) * 60
+    days = np.arange(first_local // 86400 - 1, last_local // 86400 + 2)
+    local_starts = (days[:, np.newaxis] * 86400 + np.array(schedule.starts) / 1000).ravel()
+    values = np.tile(schedule.values, len(days))
+    boundaries = local_starts - table.local_offsets(local_starts) * 60
+    #keep the segment in effect at first_time and every segment starting before end_time
+    first = max(np.searchsorted(boundaries, first_time, side='right') - 1, 0)
+    last = np.searchsorted(boundaries, end_time, side='left')
+    starts = boundaries[first:last].copy()
+    starts[0] = first_time
+    return starts, boundaries[first + 1:last + 1], values[first:last]
 
-def randomize_temp_basal():
-    decision = random.randint(0,9) #1 in 10 scheduled basals is overridden with a temp basal
-    if decision == 2:
-        return True
-    return False
+def draw_overrides(count, rng=random):
+    """ Draw the temp basal and suspend overrides of count pieces of schedule segments at once
+        1 in 10 scheduled basals is overridden with a temp basal, and 1 in 50 of the others
+        with a pump suspension.
+        Returns a list with a tuple for each piece: whether it has a temp basal, whether
+        the pump is suspended, the start of the temp basal (ms after the piece), its duration
+        (ms) and percent of the scheduled rate, and the duration of the suspension (ms).
+    """
+    draws = np.random.RandomState(rng.getrandbits(32))
+    temp = draws.randint(0, 10, count) == 2
+    suspend = ~temp & (draws.randint(0, 50, count) == 2)
+    temp_start = draws.randint(0, 45, count) * 60000 + 300000 #5-50min
+    temp_duration = draws.randint(0, 34, count) * 600000 + 1200000 #20min-6hrs
+    percent = (draws.randint(0, 19, count) * 10 + 5) / 100
+    suspend_duration = draws.randint(0, 6, count) * 1800000 + 3600000 #1-3.5hrs
+    return list(zip(temp.tolist(), suspend.tolist(), temp_start.tolist(), temp_duration.tolist(),
+                    percent.tolist(), suspend_duration.tolist()))
+
+def make_basal_events(events, zonename, rng=random):
+    """ Create basal and device meta status events
+        events -- a list of (kind, timestamp, details) tuples, kind is 'basal' with the basal
+                  fields as details, or 'suspend' with the duration of the suspension, or 'resume'
+        The suppressed scheduled basal of a temp basal is replaced by its complete event.
+    """
+    offsets = zone_table(zonename).utc_offsets([timestamp for kind, timestamp, details in events])
+    basal_data, basal_events = [], {}
+    for (kind, timestamp, details), offset in zip(events, offsets.tolist()):
+        if kind == 'basal':
+            basal_entry = common_fields.fill_common_fields('basal', {}, timestamp, offset, rng)
+            basal_entry.update(details)
+            if "suppressed" in details:
+                basal_entry["suppressed"] = basal_events[id(details["suppressed"])]
+            basal_events[id(details)] = basal_entry
+            basal_data.append(basal_entry)
+        else:
+            status_event = make_status_event(kind, timestamp, zonename, rng, duration=details)
+            basal_data.append(status_event)
+    return basal_data
@@ -2,6 +2,8 @@ import numpy as np
 from scipy.integrate import odeint 
 import random
 
+MODEL_VERSION = 1 #increase when a change to the model changes simulated values, see solution_cache
+
 def simulator(initial_carbs, initial_sugar, digestion_rate, insulin_rate, total_minutes, start_time):
     """Constructs a blood glucose equation using the following initial paremeters:
         initial_carbs -- the intake amount of carbs 
@@ -19,71 +21,153 @@ def simulator(initial_carbs, initial_sugar, digestion_rate, insulin_rate, total_
         return [f0, f1]
 
     y0 = [initial_carbs, initial_sugar]
-    t = np.linspace(start_time, start_time + total_minutes, total_minutes / 5) #timestep every 5 minutes 
+    t = np.linspace(start_time, start_time + total_minutes, int(total_minutes / 5)) #timestep every 5 minutes
+    if len(t) == 0:
+        return np.empty((0, 3))
     carb_gluc = odeint(model_func, y0, t)
-    cgt = zip(carb_gluc, t)
-    carb_gluc_time = []
-    for elem in cgt:
-        carb = elem[0][0]
-        gluc = elem[0][1]
-        time = elem[1]
-        carb_gluc_time.append([carb, gluc, time])
-    np_cgt = np.array(carb_gluc_time)
+    return np.column_stack((carb_gluc, t))
+
+def glucose_at(initial_carbs, initial_sugar, digestion_rate, insulin_rate, minutes):
+    """ Closed-form solution of the glucose equation solved by simulator()
+        Returns the glucose value (mg/dL) a number of minutes after the start of a simulation.
+        Accepts scalars or equally shaped numpy arrays.
+    """
+    rate_diff = np.subtract(insulin_rate, digestion_rate)
+    same_rate = np.abs(rate_diff) < 1e-12 #the general solution divides by the rate difference
+    digested = np.exp(np.multiply(-digestion_rate, minutes))
+    absorbed = np.exp(np.multiply(-insulin_rate, minutes))
+    decay = np.where(same_rate, np.multiply(minutes, digested),
+                     (digested - absorbed) / np.where(same_rate, 1.0, rate_diff))
+    return initial_sugar + np.multiply(digestion_rate, initial_carbs) * decay
+
+def batch_simulator(segments):
+    """ Builds the carb-glucose-time solution for many consecutive simulations at once
+        segments -- a numpy array with one row per simulation, containing the simulator() arguments
+                    in order: initial_carbs, initial_sugar, digestion_rate, insulin_rate,
+                    total_minutes and start_time
+        Returns the same rows simulator() would return for each segment, stitched together.
+    """
+    segments = np.asarray(segments, dtype=float).reshape(-1, 6)
+    carbs, sugar, digestion, insulin_rate, total_minutes, start_time = segments.T
+    counts = (total_minutes / 5).astype(int) #same number of points as np.linspace in simulator()
+    first_rows = np.cumsum(counts) - counts
+    segment_index = np.repeat(np.arange(len(segments)), counts)
+    steps = np.where(counts > 1, total_minutes / np.maximum(counts - 1, 1), 0)
+    minutes = (np.arange(counts.sum()) - first_rows[segment_index]) * steps[segment_index]
+    #like np.linspace, end each segment exactly on its stop time
+    multi_point = counts > 1
+    minutes[first_rows[multi_point] + counts[multi_point] - 1] = total_minutes[multi_point]
+
+    np_cgt = np.empty((len(minutes), 3))
+    np_cgt[:, 0] = carbs[segment_index] * np.exp(-digestion[segment_index] * minutes)
+    np_cgt[:, 1] = glucose_at(carbs[segment_index], sugar[segment_index], digestion[segment_index],
+                              insulin_rate[segment_index], minutes)
+    np_cgt[:, 2] = start_time[segment_index] + minutes
     return np_cgt
 
-def assign_carbs(sugar, last_carbs, sugar_in_range):
+def assign_carbs(sugar, last_carbs, sugar_in_range, rng=random):
     """ Assign next 'meal' event based on:
         sugar -- the current glucose level 
         last_carb -- the previous carb value
         sugar_in_range -- list of previous consecutive 'in range' sugar events 
+        rng -- random number generator to draw from
     """
     if sugar >= 240:
-        carbs = random.uniform(-300, -290)
+        carbs = rng.uniform(-300, -290)
     elif sugar >= 200:
-        carbs = random.triangular(-250, -180, -220)
+        carbs = rng.triangular(-250, -180, -220)
     elif len(sugar_in_range) >= 3:
-        high_or_low = random.randint(0,1) #if sugar in range, randomley generate high or low event
+        high_or_low = rng.randint(0,1) #if sugar in range, randomley generate high or low event
         if high_or_low == 0:
-            carbs = random.uniform(230, 250)
+            carbs = rng.uniform(230, 250)
         else:
-            carbs = random.uniform(-250, 250)
+            carbs = rng.uniform(-250, 250)
     elif sugar <= 50:
-        carbs = random.triangular(270, 300, 290)
+        carbs = rng.triangular(270, 300, 290)
     elif sugar <= 80:
-        carbs = random.triangular(200, 250, 230)
+        carbs = rng.triangular(200, 250, 230)
     elif last_carbs > 50:
-        carbs = random.uniform(-190, -170)
+        carbs = rng.uniform(-190, -170)
     else:
-        carbs = random.triangular(-50, 100, 60)
+        carbs = rng.triangular(-50, 100, 60)
     return carbs
 
-def simulate(num_days):
+def segment_end_sugar(initial_carbs, initial_sugar, digestion_rate, insulin_rate, total_minutes, start_time):
+    """ Returns the glucose value at the last point of a simulation, from the closed-form solution"""
+    points = int(total_minutes / 5)
+    if points == 0:
+        return initial_sugar
+    elif points == 1: #a single point is taken at the start time
+        total_minutes = 0
+    return float(glucose_at(initial_carbs, initial_sugar, digestion_rate, insulin_rate, total_minutes))
+
+def simulate(num_days, method='analytic', initial_state=None, rng=random):
+    """ Simulate carb and glucose values every 5 minutes over the course of num_days
+        num_days -- number of days to simulate
+        method -- 'analytic' builds the whole timeline at once from the closed-form solution
+                  of the glucose equation, 'odeint' numerically integrates each simulation
+                  Both methods produce the same curves.
+        initial_state -- state returned by simulate_state() to continue a previous simulation,
+                         a random starting point is used if not given
+        rng -- random number generator to draw from
+    """
+    if method == 'analytic':
+        segments = []
+        def run_segment(*args):
+            segments.append(args)
+            return segment_end_sugar(*args)
+        simulate_segments(num_days, run_segment, initial_state, rng)
+        return batch_simulator(segments)
+    elif method == 'odeint':
+        simulator_data = []
+        def run_segment(*args):
+            result = simulator(*args)
+            simulator_data.append(result)
+            if len(result) == 0:
+                return args[1]
+            return result[-1][1]
+        simulate_segments(num_days, run_segment, initial_state, rng)
+        if not simulator_data:
+            return np.empty((0, 3))
+        return np.concatenate(simulator_data)
+    raise ValueError('Unknown simulation method: {:s}'.format(method))
+
+def simulate_state(num_days, initial_state=None, rng=random):
+    """ Returns the state at the end of simulate(num_days), without building the solution
+        The state can be passed to simulate() to continue the simulation. Both functions draw
+        the same random numbers, so the state matches the one simulate() ends in.
+    """
+    return simulate_segments(num_days, segment_end_sugar, initial_state, rng)
+
+def simulate_segments(num_days, run_segment, initial_state=None, rng=random):
+    """ Randomly generate consecutive simulations over the course of num_days
+        run_segment -- called with the simulator() arguments of each simulation,
+                       returns the glucose value at the end of that simulation
+        initial_state -- a (sugar, last_carbs, sugar_in_range) tuple to start from
+        Returns the state at the end of the last simulation.
+    """
     days_in_minutes = num_days * 24 * 60
-    sugar = random.uniform(80, 180) #start with random sugar level
-    last_carbs = random.uniform(-60, 300)
+    if initial_state is None:
+        sugar = rng.uniform(80, 180) #start with random sugar level
+        last_carbs = rng.uniform(-60, 300)
+        sugar_in_range = []
+    else:
+        sugar, last_carbs, sugar_in_range = initial_state
+        sugar_in_range = list(sugar_in_range)
     next_time = 0
-    sugar_in_range = []
-    simulator_data = []
     while next_time < days_in_minutes:
         if int(sugar) in range(80, 195):
             sugar_in_range.append(sugar)
         else:
             sugar_in_range = []         
-        carbs = assign_carbs(sugar, last_carbs, sugar_in_range)
-        digestion = random.uniform(0.04, 0.08)
-        insulin_rate = random.uniform(0.002, 0.05)
-        total_minutes = random.randint(100, 200) #total minutes for a single simulation
+        carbs = assign_carbs(sugar, last_carbs, sugar_in_range, rng)
+        digestion = rng.uniform(0.04, 0.08)
+        insulin_rate = rng.uniform(0.002, 0.05)
+        total_minutes = rng.randint(100, 200) #total minutes for a single simulation
         #make sure total minutes does not exceed max num_days
         if total_minutes + next_time > days_in_minutes:
             total_minutes = days_in_minutes - next_time
-        result = simulator(carbs, sugar, digestion, insulin_rate, total_minutes, next_time)
-        simulator_data.append(result)       
-        sugar = result[-1][1]
+        sugar = run_segment(carbs, sugar, digestion, insulin_rate, total_minutes, next_time)
         next_time += total_minutes + 5 #add 5 extra minutes to avoid duplicates 
         last_carbs = carbs
-    stitched = []
-    for array in simulator_data:
-        for cgt_val in array:
-            stitched.append(cgt_val)
-    np_stitched = np.array(stitched)
-    return np_stitched
\ No newline at end of file
+    return sugar, last_carbs, sugar_in_range
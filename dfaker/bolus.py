@@ -1,35 +1,26 @@
 from datetime import datetime
 import numpy as np
 import random
-import pytz
 
 from . import common_fields
-from .pump_settings import make_pump_settings
+from .intervals import IntervalIndex
+from .pump_settings import PumpSettings
 from . import tools
 
-def generate_boluses(solution, start_time, zonename, zone_offset):
+def generate_boluses(solution, start_time, zonename, zone_offset, rng=random):
     """ Generates events for both bolus entries and wizard entries.
         Returns carb, time and glucose values for each event
+        rng -- random number generator to draw from
     """
-    all_carbs = solution[:, 0]
-    glucose = solution[:,1]
-    time = solution[:, 2]
     ts = tools.make_timesteps(start_time, zone_offset, solution[:,2])
-    positives = []
-    for row in zip(all_carbs, ts, glucose): #keep significant carb events
-        if row[0] > 10:
-            positives.append(row)
-    np_pos = np.array(clean_up_boluses(positives))
-    cleaned = remove_night_boluses(np_pos, zonename)
-
-    for row in cleaned: #find carb values that are too high and reduce them
-        carb_val = row[0]
-        if carb_val > 120:
-            row[0] = carb_val / 2   
-        elif carb_val > 30:
-            row[0] = carb_val * 0.75
-    bolus, wizard = bolus_or_wizard(cleaned)
-    np_bolus, np_wizard = np.array(bolus), np.array(wizard)
+    carb_time_gluc = np.column_stack((solution[:, 0], ts, solution[:, 1]))
+    positives = carb_time_gluc[carb_time_gluc[:, 0] > 10] #keep significant carb events
+    cleaned = remove_night_boluses(clean_up_boluses(positives), zonename)
+
+    #find carb values that are too high and reduce them
+    carbs = cleaned[:, 0]
+    cleaned[:, 0] = np.where(carbs > 120, carbs / 2, np.where(carbs > 30, carbs * 0.75, carbs))
+    np_bolus, np_wizard = bolus_or_wizard(cleaned, rng)
     b_carbs, b_ts  = np_bolus[:, 0], np_bolus[:, 1]
     w_card, w_ts, w_gluc = np_wizard[:, 0], np_wizard[:, 1], np_wizard[:,2]
     return b_carbs, b_ts, w_card, w_ts, w_gluc
@@ -44,147 +35,249 @@ def clean_up_boluses(carb_time_gluc, filter_rate=7):
     return carb_time_gluc[::filter_rate]
 
 def remove_night_boluses(carb_time_gluc, zonename):
-    """Removes night boluses excpet for events with high glucose""" 
-    keep = []
-    for row in carb_time_gluc:
-        carb_val = row[0]
-        time_val = row[1]
-        gluc_val = row[2]
-        hour = datetime.fromtimestamp(time_val, pytz.timezone(zonename)).hour
-        if hour > 6 and hour < 23:
-            keep.append(row)
-        #keep if glucose level is high and a high enough insuling dose is given
-        elif int(gluc_val) not in range(0,250) and carb_val > 25:
-            keep.append(row)
-    np_keep = np.array(keep)
-    return np_keep
-
-def bolus_or_wizard(solution):
+    """Removes night boluses excpet for events with high glucose
+       carb_time_gluc -- a numpy array, or a list of lists, of carb, epoch time and glucose values
+       The local hour of every event is found from the timezone offsets of all times at once.
+    """
+    carb_time_gluc = np.asarray(carb_time_gluc, dtype=float).reshape(-1, 3)
+    carb_val, time_val, gluc_val = carb_time_gluc[:, 0], carb_time_gluc[:, 1], carb_time_gluc[:, 2]
+    offsets = common_fields.get_offsets(time_val, zonename)
+    hour = np.floor(time_val + offsets * 60) % 86400 // 3600
+    day = (hour > 6) & (hour < 23)
+    #keep if glucose level is high and a high enough insuling dose is given
+    high = (np.trunc(gluc_val) >= 250) | (np.trunc(gluc_val) < 0)
+    return carb_time_gluc[day | (high & (carb_val > 25))]
+
+def bolus_or_wizard(solution, rng=random):
     """Randomly decide when to generte wizards events that are linked with boluses 
        and when to have plain boluses.
        About 2 out of 6 events will be plain boluses
+       Returns two numpy arrays, with the rows of solution for bolus and for wizard events.
     """
-    bolus_events, wizard_events = [], []
-    for row in solution:
-        bolus_or_wizard = random.randint(0, 5)
-        if bolus_or_wizard == 2 or bolus_or_wizard == 4:
-            bolus_events.append(row)
-        else:
-            wizard_events.append(row)
-    return bolus_events, wizard_events
+    solution = np.asarray(solution, dtype=float).reshape(-1, 3)
+    draws = np.random.RandomState(rng.getrandbits(32))
+    decision = draws.randint(0, 6, len(solution))
+    plain = (decision == 2) | (decision == 4)
+    return solution[plain], solution[~plain]
 
-def get_carb_ratio(start_time, curr_time, zonename, pump_name):
+def get_carb_ratio(start_time, curr_time, zonename, pump_name, pump_settings=None):
     """ Get carb ratio from settings
         start_time -- a datetime object in this format: YYYY-MM-DD HH:MM:SS
         curr_time -- a string representation of time in deviceTime format: YYYY-MM-DDTHH:MM:MS
         zonename -- ame of timezone in effect 
+        pump_settings -- a PumpSettings object shared by every datatype, created if not given
     """
-    pump_settings = make_pump_settings(start_time, zonename, pump_name)[0]
-    if pump_name == 'Tandem':
-        carb_ratio_sched = pump_settings["carbRatios"]["standard"]
-        carb_ratio = tools.get_rate_from_settings(carb_ratio_sched, curr_time, "carbRatio")
-        return carb_ratio
-    carb_ratio_sched = pump_settings["carbRatio"]
-    carb_ratio = tools.get_rate_from_settings(carb_ratio_sched, curr_time, "carbRatio")
-    return carb_ratio
+    if pump_settings is None:
+        pump_settings = PumpSettings(start_time, zonename, pump_name)
+    t = datetime.strptime(curr_time, '%Y-%m-%dT%H:%M:%S')
+    ms_since_midnight = t.hour*60*60*1000 + t.minute*60*1000 + t.second*1000
+    return pump_settings.carb_ratio_schedule.value_at(ms_since_midnight)
 
 def check_bolus_time(timestamp, no_bolus):
     """ Remove any bolus that whose time is within the no_bolus range
-        no_bolus -- a list of lists of start and end times during which there should be no bolus events
-                    for example, when the pump was suspended 
+        no_bolus -- an IntervalIndex, or a list of lists of start and end times, during which there
+                    should be no bolus events, for example, when the pump was suspended
     """
-    keep = []
-    for duration in no_bolus:
-        if int(timestamp) in range(int(duration[0]), int(duration[1]) + 1):
-            return False
-    return True 
+    if not isinstance(no_bolus, IntervalIndex):
+        no_bolus = IntervalIndex(no_bolus)
+    return not no_bolus.contains(timestamp)
 
-def bolus(start_time, carbs, timesteps, no_bolus, zonename, pump_name):
+BOLUS_SUBTYPES = ("normal", "dual/square", "square")
+NORMAL, DUAL_SQUARE, SQUARE = range(3)
+
+def bolus(start_time, carbs, timesteps, no_bolus, zonename, pump_name, pump_settings=None, rng=random):
     """ Construct bolus events 
         start_time -- a datetime object with a timezone
         carbs -- a list of carb events at each timestep
         timesteps -- a list of epoch times 
-        no_bolus -- a list of lists of start and end times during which there should be no bolus events
-                    for example, when the pump was suspended 
+        no_bolus -- an IntervalIndex of times during which there should be no bolus events
+                    for example, when the pump was suspended, or a list of lists of start and end times
         zonename -- name of timezone in effect
+        pump_settings -- a PumpSettings object shared by every datatype, created if not given
+        rng -- random number generator to draw from
+    """
+    if pump_settings is None:
+        pump_settings = PumpSettings(start_time, zonename, pump_name, rng)
+    if not isinstance(no_bolus, IntervalIndex):
+        no_bolus = IntervalIndex(no_bolus)
+    timesteps = np.asarray(timesteps, dtype=float)
+    keep = ~no_bolus.mask(timesteps)
+    return make_boluses(np.asarray(carbs, dtype=float)[keep], timesteps[keep], zonename,
+                        pump_settings, rng)
+
+def draw_subtypes(count, draws):
+    """ Draw an index into BOLUS_SUBTYPES for count boluses
+        2 in 10 are dual square, 1 in 10 is a square bolus and 7 in 10 are normal boluses
+        draws -- a numpy RandomState
+    """
+    decision = draws.randint(0, 10, count)
+    subtypes = np.full(count, NORMAL)
+    subtypes[(decision == 1) | (decision == 2)] = DUAL_SQUARE
+    subtypes[decision == 3] = SQUARE
+    return subtypes
+
+def make_boluses(carbs, timestamps, zonename, pump_settings, rng=random, subtypes=None):
+    """ Construct the bolus events of arrays of carb values and times in one batch
+        Bolus types, interruptions and durations are drawn for every event at once, and the
+        carb ratios of all times are found in a single lookup.
+        carbs -- a numpy array of carb values
+        timestamps -- a numpy array of epoch times
+        zonename -- name of timezone in effect
+        pump_settings -- a PumpSettings object shared by every datatype
+        rng -- random number generator to draw from
+        subtypes -- a numpy array with an index into BOLUS_SUBTYPES for each event, drawn if not given
+        Returns a list of bolus events.
+    """
+    count = len(timestamps)
+    draws = np.random.RandomState(rng.getrandbits(32))
+    if subtypes is None:
+        subtypes = draw_subtypes(count, draws)
+    offsets = common_fields.get_offsets(timestamps, zonename)
+    carb_ratios = pump_settings.carb_ratio_schedule.values_at(tools.ms_since_midnight(timestamps, offsets))
+    insulin = np.trunc(carbs) / carb_ratios
+
+    interrupted = (draws.randint(0, 10, count) == 1) & (subtypes != SQUARE) #interrupt 1 in 10 boluses
+    interrupt_normal = draws.randint(0, 2, count) == 1 #dual square boluses stop during the normal part
+    duration = draws.randint(0, 12, count) * 300000 + 1800000 #in ms
+    split = draws.uniform(0, 1, count)
+    delivered_fraction = draws.uniform(0, 1, count)
+    #an interrupted square part stops at a multiple of 5 minutes before its end
+    interruption_time = (np.floor(draws.uniform(0, 1, count) * (duration // 300000 - 1)) + 1) * 300000
+    interruption_time = interruption_time.astype(np.int64)
+    normal, extended, delivered, delivered_extended = bolus_amounts(insulin, subtypes, split, delivered_fraction,
+                                                                    duration, interruption_time)
+
+    columns = [subtypes, interrupted, interrupt_normal, duration, normal, extended, delivered,
+               interruption_time, delivered_extended]
+    events = common_fields.iter_common_fields('bolus', timestamps, offsets, rng)
+    return [fill_bolus(bolus_entry, *row)
+            for bolus_entry, row in zip(events, zip(*[column.tolist() for column in columns]))]
+
+def bolus_amounts(insulin, subtypes, split, delivered_fraction, duration, interruption_time):
+    """ Compute the insulin amounts of arrays of boluses, as the single-event functions do
+        insulin -- a numpy array of insulin doses, carbs over carb ratio
+        subtypes -- a numpy array with an index into BOLUS_SUBTYPES for each bolus
+        split -- uniform draws in [0, 1) placing the normal part of a dual square bolus
+                 between a third and half of the dose
+        delivered_fraction -- uniform draws in [0, 1), the part of the normal dose that was not
+                              delivered when a bolus is interrupted
+        duration -- a numpy array of durations in ms
+        interruption_time -- a numpy array of times in ms when an extended delivery is interrupted
+        Returns numpy arrays of the normal and extended amounts, the normal amount delivered
+        by an interrupted bolus and the extended amount delivered by an interrupted square part.
+    """
+    dual_normal = insulin / 3 + (insulin / 2 - insulin / 3) * split
+    normal = tools.round_to(np.where(subtypes == DUAL_SQUARE, dual_normal, insulin))
+    extended = np.where(subtypes == DUAL_SQUARE, tools.round_to(insulin - normal), normal)
+    delivered = tools.round_to(normal - normal * delivered_fraction)
+    #only boluses with an extended part have a duration
+    delivered_extended = tools.round_to(extended / np.maximum(duration, 1) * interruption_time)
+    return normal, extended, delivered, delivered_extended
+
+def fill_bolus(bolus_entry, subtype, interrupted, interrupt_normal, duration, normal, extended, delivered,
+               interruption_time, delivered_extended):
+    """ Add the fields of a bolus to a dictionary populated with common fields
+        See bolus_amounts for the amounts, and make_boluses for the other arguments
     """
-    bolus_data = []
-    for value, timestamp in zip(carbs, timesteps):      
-        normal_or_square = random.randint(0, 9) 
-        if normal_or_square == 1 or normal_or_square == 2: #2 in 10 are dual square
-            result = dual_square_bolus(value, timestamp, start_time, no_bolus, zonename, pump_name)
-        elif normal_or_square == 3: #1 in 10 is a sqaure bolus
-            result = square_bolus(value, timestamp, start_time, no_bolus, zonename, pump_name)
-        else: #8 of 10 are normal boluses 
-            result = normal_bolus(value, timestamp, start_time, no_bolus, zonename, pump_name)
-        if result: 
-            bolus_data.append(result)
-    return bolus_data
-
-def dual_square_bolus(value, timestamp, start_time, no_bolus, zonename, pump_name):
+    bolus_entry["subType"] = BOLUS_SUBTYPES[subtype]
+    if subtype == NORMAL:
+        if interrupted:
+            bolus_entry["expectedNormal"] = normal
+            bolus_entry["normal"] = delivered
+        else:
+            bolus_entry["normal"] = normal
+    elif subtype == SQUARE:
+        bolus_entry["duration"] = duration
+        bolus_entry["extended"] = extended
+    elif not interrupted:
+        bolus_entry["normal"] = normal
+        bolus_entry["extended"] = extended
+        bolus_entry["duration"] = duration
+    elif interrupt_normal:
+        bolus_entry["expectedNormal"] = normal
+        bolus_entry["normal"] = delivered
+        bolus_entry["extended"] = 0
+        bolus_entry["duration"] = 0
+        bolus_entry["expectedDuration"] = duration
+        bolus_entry["expectedExtended"] = extended
+    else:
+        bolus_entry["normal"] = normal
+        bolus_entry["expectedDuration"] = duration
+        bolus_entry["expectedExtended"] = extended
+        bolus_entry["extended"] = delivered_extended
+        bolus_entry["duration"] = interruption_time
+    return bolus_entry
+
+def dual_square_bolus(value, timestamp, start_time, no_bolus, zonename, pump_name, pump_settings=None, rng=random):
     if check_bolus_time(timestamp, no_bolus):
+        if pump_settings is None:
+            pump_settings = PumpSettings(start_time, zonename, pump_name, rng)
         bolus_entry = {}
-        bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename)
+        bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename, rng)
         bolus_entry["subType"] = "dual/square"
-        carb_ratio = get_carb_ratio(start_time, bolus_entry["deviceTime"], zonename, pump_name)
+        carb_ratio = pump_settings.carb_ratio(timestamp, bolus_entry["timezoneOffset"])
         insulin = int(value) / carb_ratio
-        bolus_entry["normal"] = tools.round_to(random.uniform(insulin / 3, insulin / 2)) 
+        bolus_entry["normal"] = tools.round_to(rng.uniform(insulin / 3, insulin / 2)) 
         bolus_entry["extended"] = tools.round_to(insulin - bolus_entry["normal"]) 
-        bolus_entry["duration"] = random.randrange(1800000, 5400000, 300000) #in ms
+        bolus_entry["duration"] = rng.randrange(1800000, 5400000, 300000) #in ms
         
-        interrupt = random.randint(0,9) #interrupt 1 in 10 boluses
+        interrupt = rng.randint(0,9) #interrupt 1 in 10 boluses
         if interrupt == 1:
             bolus_entry = (interrupted_dual_square_bolus(bolus_entry["normal"], 
-                           bolus_entry["extended"], bolus_entry["duration"], timestamp, zonename))
+                           bolus_entry["extended"], bolus_entry["duration"], timestamp, zonename, rng))
         return bolus_entry  
 
-def square_bolus(value, timestamp, start_time, no_bolus, zonename, pump_name):
+def square_bolus(value, timestamp, start_time, no_bolus, zonename, pump_name, pump_settings=None, rng=random):
     if check_bolus_time(timestamp, no_bolus):
+        if pump_settings is None:
+            pump_settings = PumpSettings(start_time, zonename, pump_name, rng)
         bolus_entry = {}
-        bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename)
+        bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename, rng)
         bolus_entry["subType"] = "square"
-        bolus_entry["duration"] = random.randrange(1800000, 5400000, 300000)
-        carb_ratio = get_carb_ratio(start_time, bolus_entry["deviceTime"], zonename, pump_name)
+        bolus_entry["duration"] = rng.randrange(1800000, 5400000, 300000)
+        carb_ratio = pump_settings.carb_ratio(timestamp, bolus_entry["timezoneOffset"])
         insulin = tools.round_to(int(value) / carb_ratio)
         bolus_entry["extended"] = insulin
         return bolus_entry
 
-def normal_bolus(value, timestamp, start_time, no_bolus, zonename, pump_name):
+def normal_bolus(value, timestamp, start_time, no_bolus, zonename, pump_name, pump_settings=None, rng=random):
     if check_bolus_time(timestamp, no_bolus):
+        if pump_settings is None:
+            pump_settings = PumpSettings(start_time, zonename, pump_name, rng)
         bolus_entry = {}
-        bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename)
+        bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename, rng)
         bolus_entry["subType"] = "normal"
-        carb_ratio = get_carb_ratio(start_time, bolus_entry["deviceTime"], zonename, pump_name)
+        carb_ratio = pump_settings.carb_ratio(timestamp, bolus_entry["timezoneOffset"])
         insulin = tools.round_to(int(value) / carb_ratio)
         bolus_entry["normal"] = insulin
 
-        interrupt = random.randint(0,9) #interrupt 1 in 10 boluses
+        interrupt = rng.randint(0,9) #interrupt 1 in 10 boluses
         if interrupt == 1:
-            bolus_entry = interrupted_bolus(insulin, timestamp, zonename)
+            bolus_entry = interrupted_bolus(insulin, timestamp, zonename, rng)
         return bolus_entry
 
-def interrupted_bolus(value, timestamp, zonename):
+def interrupted_bolus(value, timestamp, zonename, rng=random):
     bolus_entry = {}
-    bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename)
+    bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename, rng)
     bolus_entry["subType"] = "normal"
     bolus_entry["expectedNormal"] = value
-    bolus_entry["normal"] = tools.round_to(value - random.uniform(0, value))
+    bolus_entry["normal"] = tools.round_to(value - rng.uniform(0, value))
     return bolus_entry
 
-def interrupted_dual_square_bolus(normal, extended, duration, timestamp, zonename):
-    interrupt_normal = random.randint(0,1)
+def interrupted_dual_square_bolus(normal, extended, duration, timestamp, zonename, rng=random):
+    interrupt_normal = rng.randint(0,1)
     bolus_entry = {}
-    bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename)
+    bolus_entry = common_fields.add_common_fields('bolus', bolus_entry, timestamp, zonename, rng)
     bolus_entry["subType"] = "dual/square"
     if interrupt_normal:
         bolus_entry["expectedNormal"] = normal
-        bolus_entry["normal"] = tools.round_to(normal - random.uniform(0, normal))
+        bolus_entry["normal"] = tools.round_to(normal - rng.uniform(0, normal))
         bolus_entry["extended"] = 0
         bolus_entry["duration"] = 0
         bolus_entry["expectedDuration"] = duration
         bolus_entry["expectedExtended"] = extended
     else:
-        interruption_time = random.randrange(300000, duration, 300000)
+        interruption_time = rng.randrange(300000, duration, 300000)
         rate = extended / duration 
         bolus_entry["normal"] = normal
         bolus_entry["expectedDuration"] = duration
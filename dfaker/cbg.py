@@ -1,53 +1,81 @@
+import numpy as np
+import random
 import statsmodels.api as sm
 
 from . import common_fields
 from . import make_gaps
+from . import smoothing
 from . import tools
-from .device_event import make_alarm_event 
+from .device_event import make_alarm_table
+from .event_table import EventTable, MergedTables
 
-def apply_loess(solution, num_days, gaps):
+#annotation codes for out of range readings
+HIGH, LOW = 1, 2
+ANNOTATIONS = [None,
+               [{"code": "bg/out-of-range", "threshold": 400, "value": "high"}],
+               [{"code": "bg/out-of-range", "threshold": 40, "value": "low"}]]
+
+def apply_loess(solution, num_days, gaps, rng=random, gap_model=None, smoother='windowed'):
     """Solves the blood glucose equation over specified period of days 
         and applies a loess smoothing regression to the data 
         Returns numpy arrays for glucose and time values 
+        rng -- random number generator the gaps are drawn from
+        gap_model -- a make_gaps.GapModel to draw the gaps from
+        smoother -- 'windowed' fits lowess over the neighbors of each point (see smoothing.py),
+                    'lowess' runs the statsmodels lowess over the whole data, with the same result,
+                    'kernel' uses a faster tricube kernel smoother instead of local regressions
     """
     #solving for smbg valuesn
     smbg_gluc = solution[:, 1]
     smbg_time = solution[:, 2]
 
     #make gaps in cbg data, if needed
-    solution = make_gaps.gaps(solution, num_days=num_days, gaps=gaps)
+    solution = make_gaps.gaps(solution, num_days=num_days, gaps=gaps, rng=rng, gap_model=gap_model)
     #solving for cbg values 
     cbg_gluc = solution[:, 1]
     cbg_time = solution[:, 2]
     #smoothing blood glucose eqn
-    lowess = sm.nonparametric.lowess
     smoothing_distance = 1.5 #1.5 minutes
     fraction = (smoothing_distance / (num_days * 60 * 24)) * 100
-    result = lowess(cbg_gluc, cbg_time, frac=fraction, is_sorted=True)
+    if smoother == 'windowed':
+        result = smoothing.windowed_lowess(cbg_gluc, cbg_time, frac=fraction)
+    elif smoother == 'lowess':
+        lowess = sm.nonparametric.lowess
+        result = lowess(cbg_gluc, cbg_time, frac=fraction, is_sorted=True)
+    elif smoother == 'kernel':
+        result = smoothing.kernel_smooth(cbg_gluc, cbg_time, frac=fraction)
+    else:
+        raise ValueError('Unknown smoother: {:s}'.format(smoother))
     smoothed_cbg_time = result[:, 0]
     smoothed_cbg_gluc = result[:, 1]
     return smoothed_cbg_gluc, smoothed_cbg_time, smbg_gluc, smbg_time
 
-def cbg(gluc, timesteps, zonename):
+def cbg(gluc, timesteps, zonename, rng=random):
     """ construct cbg events
         gluc -- a list of glucose values at each timestep
         timesteps -- a list of epoch times 
         zonename -- name of timezone in effect 
+        rng -- random number generator the ids are drawn from
+    """
+    return cbg_table(gluc, timesteps, zonename, rng).to_list()
+
+def cbg_table(gluc, timesteps, zonename, rng=random):
+    """ construct cbg events in columnar form, along with device meta alarms for low readings
+        gluc -- a list of glucose values at each timestep
+        timesteps -- a list of epoch times 
+        zonename -- name of timezone in effect 
+        rng -- random number generator the ids are drawn from
     """
-    cbg_data = []
-    for value, timestamp in zip(gluc, timesteps):
-        cbg_reading = {}
-        cbg_reading = common_fields.add_common_fields('cbg', cbg_reading, timestamp, zonename)
-        cbg_reading["value"] = tools.convert_to_mmol(value)
-        cbg_reading["units"] = "mmol/L"
-        if value > 400:
-            cbg_reading["annotation"] = [{"code": "bg/out-of-range", "threshold": 400, "value": "high"}]
-            cbg_reading["value"] = tools.convert_to_mmol(401)
-        elif value < 40:
-            cbg_reading["annotation"] = [{"code": "bg/out-of-range", "threshold": 40, "value": "low"}]
-            cbg_reading["value"] = tools.convert_to_mmol(39)
-            #add a device meta alarm for low insulin reading
-            meta_alarm = make_alarm_event(timestamp, zonename)
-            cbg_data.append(meta_alarm)
-        cbg_data.append(cbg_reading)
-    return cbg_data
+    gluc = np.asarray(gluc, dtype=float)
+    timesteps = np.asarray(timesteps)
+    high, low = gluc > 400, gluc < 40
+    #out of range readings are reported at the threshold, just past it
+    values = tools.convert_to_mmol(np.where(high, 401.0, np.where(low, 39.0, gluc)))
+    annotations = np.where(high, HIGH, np.where(low, LOW, 0)).astype(np.int8)
+    #add a device meta alarm for low insulin reading
+    alarm_timesteps = timesteps[low]
+    cbg_readings = EventTable('cbg', timesteps, zonename, columns={"value": values},
+                              constants={"units": "mmol/L"}, rng=rng)
+    cbg_readings.add_category("annotation", annotations, ANNOTATIONS)
+    alarms = make_alarm_table(alarm_timesteps, zonename, rng)
+    return MergedTables(alarms, cbg_readings)
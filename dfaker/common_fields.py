@@ -1,28 +1,98 @@
-from datetime import datetime
+import numpy as np
+import random
 import time
-import uuid
 
-from . import tools
+from .streams import make_id
+from .timezones import zone_table
 
+#fields that hold the same value for every event
+CONSTANT_FIELDS = {
+    "deviceId": "DemoData-123456789",
+    "uploadId": "upid_abcdefghijklmnop",
+    "conversionOffset": 0,
+}
 
-def add_common_fields(name, datatype, timestamp, zonename):
+def add_common_fields(name, datatype, timestamp, zonename, rng=random):
     """ Populate common fields applicable to all datatypes
         name -- name of datatype
         datatype -- a dictionary for a specific data type
         timestamp -- an epoch time in utc
         zonename -- name of timezone in effect
+        rng -- random number generator the id is drawn from
+    """
+    offset = zone_table(zonename).utc_offset(timestamp)
+    return fill_common_fields(name, datatype, timestamp, offset, rng)
+
+def fill_common_fields(name, datatype, timestamp, offset, rng=random):
+    """ Populate common fields once the timezone offset of an event is known
+        name -- name of datatype
+        datatype -- a dictionary for a specific data type
+        timestamp -- an epoch time in utc
+        offset -- timezone offset in minutes
+        rng -- random number generator the id is drawn from
     """
     datatype["type"] = name
-    datatype["deviceId"] = "DemoData-123456789"
-    datatype["uploadId"] = "upid_abcdefghijklmnop"
-    datatype["id"] = str(uuid.uuid4())
-    local_datetime = datetime.fromtimestamp(timestamp)
-    datatype["timezoneOffset"] = tools.get_offset(zonename, local_datetime)
-    offset_time_seconds = datatype["timezoneOffset"] * 60
+    datatype.update(CONSTANT_FIELDS)
+    datatype["id"] = make_id(rng)
+    datatype["timezoneOffset"] = offset
+    offset_time_seconds = offset * 60
     offset_time_struct_utc = time.gmtime(timestamp + offset_time_seconds)
     datatype["deviceTime"] = time.strftime('%Y-%m-%dT%H:%M:%S',
                                            offset_time_struct_utc)
     time_struct_utc = time.gmtime(timestamp)
     datatype["time"] = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time_struct_utc)
-    datatype["conversionOffset"] = 0
     return datatype
+
+def iter_common_fields(name, timestamps, offsets, rng=random):
+    """ Yield a new dictionary populated with common fields for each timestamp
+        name -- name of datatype
+        timestamps -- a numpy array of epoch times in utc
+        offsets -- a numpy array of timezone offsets in minutes, as returned by get_offsets
+        rng -- random number generator the ids are drawn from
+    """
+    times = format_times(timestamps).tolist()
+    device_times = format_device_times(timestamps, offsets).tolist()
+    for offset, device_time, utc_time in zip(offsets.tolist(), device_times, times):
+        datatype = {"type": name, "id": make_id(rng), "timezoneOffset": offset,
+                    "deviceTime": device_time, "time": utc_time}
+        datatype.update(CONSTANT_FIELDS)
+        yield datatype
+
+def make_common_fields(name, timestamps, offsets, ids):
+    """ Return a list of dictionaries populated with common fields, as fill_common_fields would
+        name -- name of datatype
+        timestamps -- a numpy array of epoch times in utc
+        offsets -- a numpy array of timezone offsets in minutes, as returned by get_offsets
+        ids -- a list with the id of each event, drawn beforehand
+    """
+    times = format_times(timestamps).tolist()
+    device_times = format_device_times(timestamps, offsets).tolist()
+    events = []
+    for event_id, offset, device_time, utc_time in zip(ids, offsets.tolist(), device_times, times):
+        datatype = {"type": name}
+        datatype.update(CONSTANT_FIELDS)
+        datatype["id"] = event_id
+        datatype["timezoneOffset"] = offset
+        datatype["deviceTime"] = device_time
+        datatype["time"] = utc_time
+        events.append(datatype)
+    return events
+
+def get_offsets(timestamps, zonename):
+    """ Return a numpy array with the timezone offset (in minutes) of each timestamp
+        timestamps -- a list of epoch times in utc
+        zonename -- name of timezone in effect
+    """
+    return zone_table(zonename).utc_offsets(timestamps)
+
+def format_times(timestamps):
+    """ Return a numpy array of "time" strings for a list of epoch times in utc"""
+    seconds = np.floor(np.asarray(timestamps, dtype=float)).astype(np.int64).astype('datetime64[s]')
+    return np.char.add(np.datetime_as_string(seconds), '.000Z')
+
+def format_device_times(timestamps, offsets):
+    """ Return a numpy array of "deviceTime" strings for lists of epoch times in utc
+        and timezone offsets in minutes
+    """
+    local_seconds = np.asarray(timestamps, dtype=float) + np.asarray(offsets) * 60
+    return np.datetime_as_string(np.floor(local_seconds).astype(np.int64).astype('datetime64[s]'))
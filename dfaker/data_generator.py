@@ -2,36 +2,152 @@ from datetime import datetime
 
 from . import tools
 from . import bg_simulator
+from .streams import stage_rng
 from .bolus import bolus, generate_boluses
 from .wizard import wizard
-from .pump_settings import make_pump_settings
-from .cbg import cbg, apply_loess
-from .smbg import smbg
+from .pump_settings import PumpSettings
+from .cbg import cbg_table, apply_loess
+from .intervals import IntervalIndex
+from .smbg import smbg_table
 from .basal import scheduled_basal
+from .pipeline import Pipeline
 
-def dfaker(num_days, zonename, date_time, gaps, smbg_freq, pump_name):
+def dfaker(num_days, zonename, date_time, gaps, smbg_freq, pump_name, seed=None, solution_cache=None,
+           time_ordered=False):
     """ Generate data for a set num_days within a single timezone
+        seed -- makes the output reproducible, see generate_stages
+        solution_cache -- a SolutionCache to reuse glucose simulations from, see generate_stages
+        time_ordered -- return the events in time order rather than grouped by datatype
     """
-    dfaker = [] 
-    solution = bg_simulator.simulate(num_days)
+    pipeline = make_pipeline(num_days, zonename, date_time, gaps, smbg_freq, pump_name, seed=seed,
+                             solution_cache=solution_cache)
+    if time_ordered:
+        return list(pipeline.iter_time_ordered())
+    return list(pipeline)
 
+def generate_stages(num_days, zonename, date_time, gaps, smbg_freq, pump_name,
+                    pump_settings=None, bg_state=None, seed=None, solution_cache=None, gap_model=None,
+                    smoother='windowed', smbg_profile=None):
+    """ Generate data for a set num_days within a single timezone
+        Yields the output of each datatype as soon as it is generated. Each output is an
+        iterable of events; cbg and smbg events are kept in columnar form until they are
+        iterated over.
+        pump_settings -- a PumpSettings object to use, created if not given
+        bg_state -- glucose simulation state to continue from, see bg_simulator.simulate_state
+        seed -- every stage draws from its own random number generator seeded from seed,
+                so the same seed always produces the same data, ids included.
+                Without a seed, every stage draws from the global random module.
+        solution_cache -- a SolutionCache the glucose simulation of a seeded run is read from,
+                          or stored in, so that runs with the same seed and number of days
+                          (but another pump or timezone) simulate it only once
+        gap_model -- a make_gaps.GapModel describing the gaps added to cbg data when gaps is set
+        smoother -- smoothing method of the cbg data, see cbg.apply_loess
+        smbg_profile -- relative chance of a fingerstick in each local hour, see smbg.stick_times
+    """
+    pipeline = make_pipeline(num_days, zonename, date_time, gaps, smbg_freq, pump_name,
+                             pump_settings=pump_settings, bg_state=bg_state, seed=seed,
+                             solution_cache=solution_cache, gap_model=gap_model, smoother=smoother,
+                             smbg_profile=smbg_profile)
+    for name, events in pipeline.iter_stages():
+        if name != 'simulate': #only prepares the other stages
+            yield events
+
+def make_pipeline(num_days, zonename, date_time, gaps, smbg_freq, pump_name,
+                  pump_settings=None, bg_state=None, seed=None, solution_cache=None, gap_model=None,
+                  smoother='windowed', smbg_profile=None, trim_end=False):
+    """ Build the Pipeline generating data for a set num_days within a single timezone
+        The simulate stage runs the glucose simulation, smoothing and meal extraction used by
+        the other stages, and yields no events. Iterating over the pipeline yields every event,
+        one stage after another, and Pipeline.drain writes them to a json_writer as they are
+        generated. Each stage removes the values it uses from the state of the pipeline, so
+        its inputs are released once it has run. The arguments are those of generate_stages.
+        trim_end -- leave out the readings at the end of the range, the last minute of
+                    num_days, which the next range of days starts with, see parallel.make_tasks
+    """
+    state = {'num_days': num_days, 'zonename': zonename, 'date_time': date_time, 'gaps': gaps,
+             'smbg_freq': smbg_freq, 'pump_name': pump_name, 'pump_settings': pump_settings,
+             'bg_state': bg_state, 'seed': seed, 'solution_cache': solution_cache,
+             'gap_model': gap_model, 'smoother': smoother, 'smbg_profile': smbg_profile,
+             'trim_end': trim_end}
+    pipeline = Pipeline(state)
+    pipeline.add_stage('simulate', simulate_stage)
+    pipeline.add_stage('settings', settings_stage)
+    pipeline.add_stage('basal', basal_stage)
+    pipeline.add_stage('bolus', bolus_stage)
+    pipeline.add_stage('wizard', wizard_stage)
+    pipeline.add_stage('cbg', cbg_stage)
+    pipeline.add_stage('smbg', smbg_stage)
+    return pipeline
+
+def simulate_stage(state):
+    """ Simulate glucose values and meals for the other stages, yields no events
+        The glucose simulation is only kept until the cbg and smbg values and the meals
+        have been taken from it.
+    """
+    num_days, zonename, seed = state['num_days'], state['zonename'], state['seed']
+    if state['solution_cache'] is not None and seed is not None:
+        solution = state['solution_cache'].simulate(num_days, seed, initial_state=state['bg_state'])
+    else:
+        solution = bg_simulator.simulate(num_days, initial_state=state['bg_state'],
+                                         rng=stage_rng(seed, 'simulate'))
+    if state['trim_end']: #the next range starts from the glucose value at this minute
+        solution = solution[solution[:, 2] < num_days * 24 * 60]
+
+    date_time = state['date_time']
     start_time = datetime(date_time.year, date_time.month, date_time.day, date_time.hour, date_time.minute)
     zone_offset = tools.get_offset(zonename, start_time)
+    state['start_time'] = start_time
 
-    cbg_gluc, cbg_time, smbg_gluc, smbg_time = apply_loess(solution, num_days=num_days, gaps=gaps)
-    cbg_timesteps = tools.make_timesteps(start_time, zone_offset, cbg_time)
-    smbg_timesteps = tools.make_timesteps(start_time, zone_offset, smbg_time)
+    cbg_gluc, cbg_time, smbg_gluc, smbg_time = apply_loess(solution, num_days=num_days, gaps=state['gaps'],
+                                                           rng=stage_rng(seed, 'gaps'),
+                                                           gap_model=state['gap_model'],
+                                                           smoother=state['smoother'])
+    state['cbg'] = cbg_gluc, tools.make_timesteps(start_time, zone_offset, cbg_time)
+    state['smbg'] = smbg_gluc, tools.make_timesteps(start_time, zone_offset, smbg_time)
 
     b_carbs, b_carb_timesteps, w_carbs, w_carb_timesteps, w_gluc = (
-            generate_boluses(solution, start_time, zonename=zonename, zone_offset=zone_offset))
-
-    settings_data = make_pump_settings(start_time, zonename=zonename, pump_name=pump_name)
-    basal_data, pump_suspended = scheduled_basal(start_time, num_days=num_days, zonename=zonename, pump_name=pump_name)
-    bolus_data = bolus(start_time, b_carbs, b_carb_timesteps, no_bolus=pump_suspended, zonename=zonename, pump_name=pump_name)
-    wizard_data, iob_data = (wizard(start_time, w_gluc, w_carbs, w_carb_timesteps, bolus_data=bolus_data,
-                         no_wizard=pump_suspended, zonename=zonename, pump_name=pump_name))
-    cbg_data = cbg(cbg_gluc, cbg_timesteps, zonename=zonename)
-    smbg_data = smbg(smbg_gluc, smbg_timesteps, stick_freq=smbg_freq, zonename=zonename)
-
-    dfaker = dfaker + settings_data + basal_data + bolus_data + wizard_data + cbg_data + smbg_data
-    return dfaker
+            generate_boluses(solution, start_time, zonename=zonename, zone_offset=zone_offset,
+                             rng=stage_rng(seed, 'meals')))
+    state['bolus_meals'] = b_carbs, b_carb_timesteps
+    state['wizard_meals'] = w_gluc, w_carbs, w_carb_timesteps
+    return []
+
+def settings_stage(state):
+    if state['pump_settings'] is None:
+        state['pump_settings'] = PumpSettings(state['start_time'], zonename=state['zonename'],
+                                              pump_name=state['pump_name'],
+                                              rng=stage_rng(state['seed'], 'settings'))
+    return state['pump_settings'].settings_data
+
+def basal_stage(state):
+    basal_data, pump_suspended = scheduled_basal(state['start_time'], num_days=state['num_days'],
+                                                 zonename=state['zonename'], pump_name=state['pump_name'],
+                                                 pump_settings=state['pump_settings'],
+                                                 rng=stage_rng(state['seed'], 'basal'))
+    state['no_delivery'] = IntervalIndex(pump_suspended)
+    return basal_data
+
+def bolus_stage(state):
+    b_carbs, b_carb_timesteps = state.pop('bolus_meals')
+    bolus_data = bolus(state['start_time'], b_carbs, b_carb_timesteps, no_bolus=state['no_delivery'],
+                       zonename=state['zonename'], pump_name=state['pump_name'],
+                       pump_settings=state['pump_settings'], rng=stage_rng(state['seed'], 'bolus'))
+    state['bolus_data'] = bolus_data #insulin on board of the wizard
+    return bolus_data
+
+def wizard_stage(state):
+    w_gluc, w_carbs, w_carb_timesteps = state.pop('wizard_meals')
+    wizard_data, iob_data = wizard(state['start_time'], w_gluc, w_carbs, w_carb_timesteps,
+                                   bolus_data=state.pop('bolus_data'), no_wizard=state.pop('no_delivery'),
+                                   zonename=state['zonename'], pump_name=state['pump_name'],
+                                   pump_settings=state['pump_settings'], rng=stage_rng(state['seed'], 'wizard'))
+    return wizard_data
+
+def cbg_stage(state):
+    cbg_gluc, cbg_timesteps = state.pop('cbg')
+    return cbg_table(cbg_gluc, cbg_timesteps, zonename=state['zonename'], rng=stage_rng(state['seed'], 'cbg'))
+
+def smbg_stage(state):
+    smbg_gluc, smbg_timesteps = state.pop('smbg')
+    return smbg_table(smbg_gluc, smbg_timesteps, stick_freq=state['smbg_freq'], zonename=state['zonename'],
+                      rng=stage_rng(state['seed'], 'smbg'), profile=state['smbg_profile'])
@@ -1,14 +1,15 @@
 import random
 
 from . import common_fields
+from .event_table import EventTable
 
 class Constants:
     FIELD_NAME = 'deviceEvent'
 
-def make_time_change_event(timestamp, zonename, time_before_change, time_after_change, new_zone):
+def make_time_change_event(timestamp, zonename, time_before_change, time_after_change, new_zone, rng=random):
     """ Generate a time change event for traveling purposes"""
     event = {}
-    event = common_fields.add_common_fields(Constants.FIELD_NAME, event, timestamp, zonename)
+    event = common_fields.add_common_fields(Constants.FIELD_NAME, event, timestamp, zonename, rng)
     event["change"] = {}
     event["change"]["agent"] = "manual"
     event["change"]["from"] = str(time_before_change)[:10] + 'T' + str(time_before_change)[11:]
@@ -18,26 +19,35 @@ def make_time_change_event(timestamp, zonename, time_before_change, time_after_c
     event["subType"] = "timeChange"
     return event
 
-def make_alarm_event(timestamp, zonename):
+def make_alarm_event(timestamp, zonename, rng=random):
     """ Generate an alarm device event"""
     event = {}
-    event = common_fields.add_common_fields(Constants.FIELD_NAME, event, timestamp, zonename)
+    event = common_fields.add_common_fields(Constants.FIELD_NAME, event, timestamp, zonename, rng)
     event["subType"] = "alarm"
     event["alarmType"] = "low_insulin"
     return event 
 
-def make_status_event(status, timestamp, zone_name):
-    """ Generate a status event"""
+def make_alarm_table(timesteps, zonename, rng=random):
+    """ Generate alarm device events for a list of timestamps in columnar form"""
+    return EventTable(Constants.FIELD_NAME, timesteps, zonename,
+                      constants={"subType": "alarm", "alarmType": "low_insulin"}, rng=rng)
+
+def make_status_event(status, timestamp, zone_name, rng=random, duration=None):
+    """ Generate a status event
+        duration -- duration of a suspension in ms, drawn at random if not given
+    """
     event = {}
     event = common_fields.add_common_fields(Constants.FIELD_NAME, event,
-                                            timestamp, zone_name)
+                                            timestamp, zone_name, rng)
     event["subType"] = "status"
     if status == 'suspend':
         event["status"] = "suspended"  
         event["reason"] = {
             "suspended": "manual"
         }
-        event["duration"] = random.randrange(3600000, 14400000, 1800000)
+        if duration is None:
+            duration = rng.randrange(3600000, 14400000, 1800000)
+        event["duration"] = duration
     elif status == 'resume':
         event["status"] = "resumed"
         event["reason"] = {
@@ -45,8 +55,8 @@ def make_status_event(status, timestamp, zone_name):
         }
     return event
 
-def suspend_pump():
-    decision = random.randint(0,49) #for 1 in 50 instances, the pump will be suspended 
+def suspend_pump(rng=random):
+    decision = rng.randint(0,49) #for 1 in 50 instances, the pump will be suspended 
     if decision == 2:
         return True
     return False
@@ -0,0 +1,86 @@
+import copy
+import heapq
+import numpy as np
+import random
+
+from . import common_fields
+
+CHUNK_SIZE = 4096 #number of events whose common fields are formatted at once
+
+class EventTable(object):
+    """ Columnar storage for the events of a single datatype
+        Timestamps, timezone offsets and numeric fields are kept in numpy arrays, and fields
+        shared by every event are stored once. Event dictionaries are only built while
+        iterating over the table, at the output boundary, so each iteration creates new ids.
+        name -- name of datatype
+        timestamps -- a list of epoch times in utc
+        zonename -- name of timezone in effect
+        columns -- a dictionary of field names and lists with a numeric value for each event
+        constants -- a dictionary of fields that hold the same value for every event
+        rng -- random number generator the ids are drawn from
+    """
+    def __init__(self, name, timestamps, zonename, columns=None, constants=None, rng=random):
+        self.name = name
+        self.rng = rng
+        self.zonename = zonename
+        self.timestamps = np.asarray(timestamps)
+        self.offsets = common_fields.get_offsets(self.timestamps, zonename)
+        self.columns = {}
+        for field, values in (columns or {}).items():
+            self.columns[field] = np.asarray(values)
+        self.constants = constants or {}
+        self.categories = {}
+
+    def add_category(self, field, codes, choices):
+        """ Add a field that takes one of a few values
+            codes -- a list with an index into choices for each event
+            choices -- the possible values of the field, None leaves the field out of an event
+        """
+        self.categories[field] = (np.asarray(codes, dtype=np.int8), choices)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        for start in range(0, len(self), CHUNK_SIZE):
+            chunk = slice(start, start + CHUNK_SIZE)
+            columns = [(field, values[chunk].tolist()) for field, values in self.columns.items()]
+            categories = [(field, codes[chunk].tolist(), choices)
+                          for field, (codes, choices) in self.categories.items()]
+            events = common_fields.iter_common_fields(self.name, self.timestamps[chunk],
+                                                      self.offsets[chunk], self.rng)
+            for index, datatype in enumerate(events):
+                datatype.update(self.constants)
+                for field, values in columns:
+                    datatype[field] = values[index]
+                for field, codes, choices in categories:
+                    choice = choices[codes[index]]
+                    if choice is not None:
+                        datatype[field] = copy.deepcopy(choice)
+                yield datatype
+
+    def to_list(self):
+        return list(self)
+
+
+class MergedTables(object):
+    """ Events of several tables in time order
+        Each table must be sorted by time. Events with the same timestamp keep the order
+        in which their tables are given.
+    """
+    def __init__(self, *tables):
+        self.tables = tables
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables)
+
+    def __iter__(self):
+        def keyed(rank, table):
+            for index, (timestamp, event) in enumerate(zip(table.timestamps.tolist(), table)):
+                yield timestamp, rank, index, event
+        merged = heapq.merge(*[keyed(rank, table) for rank, table in enumerate(self.tables)])
+        for timestamp, rank, index, event in merged:
+            yield event
+
+    def to_list(self):
+        return list(self)
@@ -1,30 +1,41 @@
+from bisect import bisect_right
+import math
+import numpy as np
+
 from . import tools
-import datetime
 
-def format_bolus_for_iob_calc(bolus_data):
-    """ Retrieve rates, times and duration values from bolus data to generate IOB values
-        Returns a list of time-bolus lists
-    """ 
-    time_vals = []
+PULSE_INTERVAL = 60 #an extended bolus gives a dose every minute, in seconds
+
+def format_bolus_deliveries(bolus_data):
+    """ Retrieve the insulin deliveries of bolus data to generate IOB values
+        A normal bolus is a single dose. The extended part of a bolus gives the same dose
+        every minute over its duration, and is kept as a single delivery.
+        Returns a list of [timestamp, dose, pulses] lists, pulses doses given a minute apart
+    """
+    deliveries = []
     for bolus_entry in bolus_data:
         str_time = bolus_entry["time"]
         timestamp = tools.convert_ISO_to_epoch(str_time, '%Y-%m-%dT%H:%M:%S.000Z')
         if bolus_entry['subType'] == "normal":
-            initial_insulin = bolus_entry["normal"]
-            time_vals.append([timestamp, initial_insulin])
+            deliveries.append([timestamp, bolus_entry["normal"], 1])
         else:
             duration = bolus_entry["duration"]/1000/60 #in minutes
             if duration > 0:
                 extended_insulin = bolus_entry["extended"]
                 insulin_per_segment = extended_insulin / duration
                 if bolus_entry['subType'] == "dual/square":
-                    initial_insulin = bolus_entry["normal"]
-                    time_vals.append([timestamp, initial_insulin])
-                next_time = timestamp 
-                end_time = next_time + duration*60 #duration in seconds
-                while next_time < end_time:
-                    time_vals.append([next_time, insulin_per_segment])
-                    next_time += 60 #1 minutes
+                    deliveries.append([timestamp, bolus_entry["normal"], 1])
+                deliveries.append([timestamp, insulin_per_segment, math.ceil(duration)])
+    return deliveries
+
+def format_bolus_for_iob_calc(bolus_data):
+    """ Retrieve rates, times and duration values from bolus data to generate IOB values
+        Returns a list of time-bolus lists, with an entry for every minute of an extended bolus
+    """ 
+    time_vals = []
+    for timestamp, dose, pulses in format_bolus_deliveries(bolus_data):
+        for pulse in range(pulses):
+            time_vals.append([timestamp + pulse * PULSE_INTERVAL, dose])
     return time_vals            
         
 def create_iob_dict(bolus_data, action_time):
@@ -89,4 +100,98 @@ def insulin_on_board(iob_dict, timestamp):
         closest_timestamp = min(iob_dict.keys(), key=lambda k: abs(k-timestamp))
         if abs(timestamp - closest_timestamp) <= 300: #approximate to 5 minutes max
             return iob_dict[closest_timestamp]
-    return 0
\ No newline at end of file
+    return 0
+
+class IOBIndex(object):
+    """ Insulin on board kept as a sorted index of insulin deliveries
+        Each dose decays linearly to zero over action_time, so insulin on board can be
+        computed at any timestamp from the deliveries started within the last action_time
+        (and the length of the longest extended bolus), which are found with a binary search.
+        The doses an extended bolus gives every minute form an arithmetic series, which is
+        summed in closed form, so a query costs the same whatever the duration of the bolus.
+        bolus_data -- a list of dict enteries generated when running the bolus module
+        action_time -- an integer representing number of hours it takes insulin to leave the body
+    """
+    def __init__(self, bolus_data, action_time):
+        self.action_time = action_time
+        self._duration = action_time * 60 * 60 #in seconds
+        self._times, self._doses, self._pulses, self._sources = [], [], [], []
+        self._max_span = 0 #time between the first and last dose of the longest delivery
+        self.add_boluses(bolus_data)
+
+    def add_boluses(self, bolus_data, sources=None):
+        """ Add the insulin given by a list of bolus dict enteries
+            Deliveries are merged in one sort, which is stable, so deliveries starting at the
+            same time keep the order in which they are added, as with add_dose.
+            sources -- a list with a tag for the deliveries of each bolus, see insulin_on_board_many
+        """
+        if sources is None:
+            sources = [None] * len(bolus_data)
+        new_deliveries = [(timestamp, dose, pulses, source) for bolus_entry, source in zip(bolus_data, sources)
+                          for timestamp, dose, pulses in format_bolus_deliveries([bolus_entry])]
+        deliveries = sorted(list(zip(self._times, self._doses, self._pulses, self._sources)) + new_deliveries,
+                            key=lambda delivery: delivery[0])
+        self._times = [delivery[0] for delivery in deliveries]
+        self._doses = [delivery[1] for delivery in deliveries]
+        self._pulses = [delivery[2] for delivery in deliveries]
+        self._sources = [delivery[3] for delivery in deliveries]
+        self._max_span = max([self._max_span] + [(pulses - 1) * PULSE_INTERVAL for pulses in self._pulses])
+
+    def add_dose(self, timestamp, dose, source=None, pulses=1):
+        """ Add a single insulin dose given at timestamp, or pulses doses a minute apart
+            The position is found with a binary search, in O(log n), but inserting into the
+            sorted lists moves the deliveries after it, so an insert is O(n). Many doses
+            should be added at once with add_boluses, which merges them in a single sort.
+        """
+        index = bisect_right(self._times, timestamp)
+        self._times.insert(index, timestamp)
+        self._doses.insert(index, dose)
+        self._pulses.insert(index, pulses)
+        self._sources.insert(index, source)
+        self._max_span = max(self._max_span, (pulses - 1) * PULSE_INTERVAL)
+
+    def __len__(self):
+        return len(self._times)
+
+    def insulin_on_board(self, timestamp):
+        """ Return insulin on board at a particular timestamp"""
+        first = bisect_right(self._times, timestamp - self._duration - self._max_span)
+        last = bisect_right(self._times, timestamp)
+        iob = 0
+        for time, dose, pulses in zip(self._times[first:last], self._doses[first:last], self._pulses[first:last]):
+            #pulses still acting on timestamp
+            last_pulse = min(pulses - 1, (timestamp - time) // PULSE_INTERVAL)
+            first_pulse = max(0, (timestamp - self._duration - time) // PULSE_INTERVAL + 1)
+            count = last_pulse - first_pulse + 1
+            if count > 0:
+                slope = dose / self.action_time
+                elapsed = count * (timestamp - time) - PULSE_INTERVAL * (first_pulse + last_pulse) * count / 2
+                iob += count * dose - slope * elapsed / 3600 #linear decay equation, summed over pulses
+        return iob
+
+    def insulin_on_board_many(self, timestamps, sources=None):
+        """ Return a numpy array of insulin on board values for a list of timestamps
+            sources -- a list with a number for each timestamp, the deliveries added with the
+                       same or a larger number are left out of its insulin on board, so that each
+                       timestamp only sees the deliveries of the ones numbered before it
+        """
+        timestamps = np.asarray(timestamps, dtype=float)
+        times, doses = np.array(self._times, dtype=float), np.array(self._doses, dtype=float)
+        pulses = np.array(self._pulses, dtype=float)
+        first = np.searchsorted(times, timestamps - self._duration - self._max_span, side='right')
+        counts = np.searchsorted(times, timestamps, side='right') - first
+        #pair every timestamp with each delivery that may still act on it
+        query_index = np.repeat(np.arange(len(timestamps)), counts)
+        dose_index = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) +
+                      np.repeat(first, counts))
+        timestamp, time, dose = timestamps[query_index], times[dose_index], doses[dose_index]
+        last_pulse = np.minimum(pulses[dose_index] - 1, (timestamp - time) // PULSE_INTERVAL)
+        first_pulse = np.maximum(0, (timestamp - self._duration - time) // PULSE_INTERVAL + 1)
+        count = np.maximum(last_pulse - first_pulse + 1, 0)
+        slope = dose / self.action_time
+        elapsed = count * (timestamp - time) - PULSE_INTERVAL * (first_pulse + last_pulse) * count / 2
+        iob = count * dose - slope * elapsed / 3600
+        if sources is not None:
+            dose_sources = np.array([-1 if source is None else source for source in self._sources])
+            iob[dose_sources[dose_index] >= np.asarray(sources)[query_index]] = 0
+        return np.bincount(query_index, weights=iob, minlength=len(timestamps))
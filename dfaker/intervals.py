@@ -0,0 +1,50 @@
+from bisect import bisect_right
+import numpy as np
+
+class IntervalIndex(object):
+    """ Sorted, merged windows of epoch times, such as the periods when the pump is suspended
+        Windows are closed and compared in whole seconds, a time t is within [start, end]
+        when int(start) <= int(t) <= int(end). Overlapping or touching windows are merged, so
+        a time is found with a binary search over the window starts.
+        windows -- a list of [start, end] pairs of epoch times, in any order
+    """
+    def __init__(self, windows=()):
+        merged = []
+        for start, end in sorted((int(start), int(end)) for start, end in windows):
+            if end < start:
+                continue
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self._starts = [start for start, end in merged]
+        self._ends = [end for start, end in merged]
+        self.starts = np.array(self._starts, dtype=np.int64)
+        self.ends = np.array(self._ends, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __iter__(self):
+        return ([start, end] for start, end in zip(self._starts, self._ends))
+
+    def __contains__(self, timestamp):
+        return self.contains(timestamp)
+
+    def contains(self, timestamp):
+        """ Return True if an epoch time is within one of the windows"""
+        timestamp = int(timestamp)
+        index = bisect_right(self._starts, timestamp) - 1
+        return index >= 0 and timestamp <= self._ends[index]
+
+    def mask(self, timestamps):
+        """ Return a numpy array that is True for every epoch time within one of the windows"""
+        timestamps = np.trunc(np.asarray(timestamps, dtype=float)) #as int() does
+        if not len(self):
+            return np.zeros(timestamps.shape, dtype=bool)
+        index = np.searchsorted(self.starts, timestamps, side='right') - 1
+        return (index >= 0) & (timestamps <= self.ends[np.maximum(index, 0)])
+
+    def union(self, windows):
+        """ Return a new IntervalIndex with other windows added, such as another IntervalIndex"""
+        return IntervalIndex(list(self) + list(windows))
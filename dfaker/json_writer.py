@@ -0,0 +1,58 @@
+import json
+
+
+class JSONArrayWriter(object):
+    """ Write events to a file as a json array, one event at a time
+        The output is the same as a single json.dump of the list of events.
+        file_object -- a file opened for writing
+        minify -- write the most compact json, without tabs or spacing
+    """
+    def __init__(self, file_object, minify=False):
+        self._file = file_object
+        self._minify = minify
+        self._count = 0
+
+    def write(self, event):
+        if self._minify:
+            text = json.dumps(event, sort_keys=True, separators=(',', ':'))
+            self._file.write(',' + text if self._count else '[' + text)
+        else:
+            text = json.dumps(event, sort_keys=True, indent=4).replace('\n', '\n    ')
+            self._file.write(',\n    ' + text if self._count else '[\n    ' + text)
+        self._count += 1
+
+    def write_all(self, events):
+        for event in events:
+            self.write(event)
+
+    def close(self):
+        """ End the json array, the file itself is left open"""
+        if not self._count:
+            self._file.write('[]')
+        elif self._minify:
+            self._file.write(']')
+        else:
+            self._file.write('\n]')
+
+
+class NDJSONWriter(object):
+    """ Write events to a file as newline delimited json, one event per line
+        file_object -- a file opened for writing
+        minify -- write the most compact json, without spacing
+    """
+    def __init__(self, file_object, minify=False):
+        self._file = file_object
+        if minify:
+            self._separators = (',', ':')
+        else:
+            self._separators = (', ', ': ')
+
+    def write(self, event):
+        self._file.write(json.dumps(event, sort_keys=True, separators=self._separators) + '\n')
+
+    def write_all(self, events):
+        for event in events:
+            self.write(event)
+
+    def close(self):
+        pass
@@ -1,28 +1,30 @@
 import numpy as np
 import random
 
-def gaps(data, num_days, gaps):
+READINGS_PER_DAY = 24 * 60 / 5 #one reading every 5 minutes
+
+def gaps(data, num_days, gaps, rng=random, gap_model=None):
     """ Create randomized gaps in fake data if user selects the gaps option
-        Returns data with gaps if gaps are selected, otherwise returns full data set 
+        Returns data with gaps if gaps are selected, otherwise returns full data set
+        gap_model -- a GapModel to draw the gaps from, create_gap_list is used if not given
     """
     if gaps:
-        solution_list = data.tolist()
-        gap_list = create_gap_list(data, num_days=num_days)
-        for gap in gap_list:
-            solution_list = remove_gaps(solution_list, gap[0], gap[1])
-        new_solution = np.array(solution_list)
-        return new_solution
+        if gap_model is None:
+            gap_list = create_gap_list(data, num_days=num_days, rng=rng)
+        else:
+            gap_list = gap_model.gap_list(len(data), rng=rng)
+        return data[keep_mask(len(data), gap_list)]
     return data
 
-def create_gap_list(time_gluc, num_days):
+def create_gap_list(time_gluc, num_days, rng=random):
     """ Returns sorted list of lists that represent indecies to be removed.
         Each inner list is a two element list containing a start index and an end index
     """
-    gaps = random.randint(1 * num_days, 3 * num_days) # amount of gaps  
+    gaps = rng.randint(1 * num_days, 3 * num_days) # amount of gaps
     gap_list = []
     for _ in range(gaps):
-        gap_length = random.randint(10, 40) # length of gaps in 5-min segments
-        start_index = random.randint(0, len(time_gluc)) 
+        gap_length = rng.randint(10, 40) # length of gaps in 5-min segments
+        start_index = rng.randint(0, len(time_gluc))
         if start_index + gap_length > len(time_gluc):
             end_index = len(time_gluc) - 5
         else:
@@ -30,7 +32,68 @@ def create_gap_list(time_gluc, num_days):
         gap_list.append([start_index, end_index])
     gap_list.sort()
     gap_list.reverse()
-    return gap_list 
+    return gap_list
+
+def keep_mask(length, gap_list):
+    """ Returns a boolean mask that is False for every index within a gap
+        length -- number of rows in the data
+        gap_list -- a list of [start index, end index] pairs, the end index is not part of the gap.
+                    Gaps may overlap, in which case their union is removed.
+    """
+    if not len(gap_list):
+        return np.ones(length, dtype=bool)
+    bounds = np.clip(np.asarray(gap_list, dtype=int).reshape(-1, 2), 0, length)
+    bounds = bounds[bounds[:, 1] > bounds[:, 0]]
+    depth = np.zeros(length + 1, dtype=int) #number of gaps covering each index
+    np.add.at(depth, bounds[:, 0], 1)
+    np.add.at(depth, bounds[:, 1], -1)
+    return np.cumsum(depth[:-1]) == 0
 
 def remove_gaps(data, start, end):
-    return data[:start] + data[end:]
\ No newline at end of file
+    return data[:start] + data[end:]
+
+
+class GapModel(object):
+    """ Random gaps in sensor data
+        Gaps arrive as a Poisson process, and a gap is also added every time the sensor is
+        replaced, while the new sensor warms up.
+        rate -- average number of gaps per day
+        min_length -- shortest gap, in 5 minute readings
+        max_length -- longest gap, in 5 minute readings
+        length -- a function of a random number generator returning the length of a gap, in
+                  5 minute readings, replaces the uniform length between min_length and max_length
+        sensor_days -- number of days a sensor is worn, None for no warm-up gaps
+        warmup_length -- readings missed while a new sensor warms up, 2 hours by default
+    """
+    def __init__(self, rate=2, min_length=10, max_length=40, length=None,
+                 sensor_days=None, warmup_length=24):
+        self.rate = rate
+        self.min_length = min_length
+        self.max_length = max_length
+        self.length = length
+        self.sensor_days = sensor_days
+        self.warmup_length = warmup_length
+
+    def gap_length(self, rng):
+        if self.length is not None:
+            return int(self.length(rng))
+        return rng.randint(self.min_length, self.max_length)
+
+    def gap_list(self, length, rng=random):
+        """ Returns a list of [start index, end index] pairs, see keep_mask
+            length -- number of readings in the data
+        """
+        gap_list = []
+        if self.rate > 0:
+            readings_between_gaps = READINGS_PER_DAY / self.rate #mean time between arrivals
+            position = rng.expovariate(1 / readings_between_gaps)
+            while position < length:
+                start = int(position)
+                gap_list.append([start, start + self.gap_length(rng)])
+                position += rng.expovariate(1 / readings_between_gaps)
+        if self.sensor_days:
+            readings_per_sensor = int(self.sensor_days * READINGS_PER_DAY)
+            for start in range(0, length, readings_per_sensor):
+                gap_list.append([start, start + self.warmup_length])
+        gap_list.sort()
+        return gap_list
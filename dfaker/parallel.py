@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+import random
+
+from . import bg_simulator
+from .data_generator import make_pipeline
+from .pipeline import merge_by_time
+from .pump_settings import PumpSettings
+from .streams import stage_rng, sub_seed
+from .travel import travel_itinerary
+
+def generate_patients(patients, processes=None, chunk_days=None, seed=None, solution_cache=None):
+    """ Generate data for several patients in parallel
+        patients -- a list of dictionaries with the arguments of dfaker for each patient:
+                    num_days, zonename, date_time, gaps, smbg_freq, pump_name and, optionally,
+                    travel to generate data in multiple timezones and time_ordered to return
+                    the events of the patient in time order
+        processes -- number of worker processes, defaults to the number of cpus
+        chunk_days -- split each patient into contiguous ranges of at most chunk_days days,
+                      generated in parallel (travelling patients are split into the segments
+                      of their itinerary instead)
+        seed -- seed for the random numbers of every patient and day range
+        solution_cache -- a SolutionCache shared by the worker processes
+        Returns a list with the events of each patient.
+    """
+    chunks = [[] for _ in patients]
+    for patient_index, events in iter_patient_events(patients, processes, chunk_days, seed,
+                                                     solution_cache):
+        chunks[patient_index].append(events)
+    results = []
+    for patient, patient_chunks in zip(patients, chunks):
+        if patient.get('time_ordered'): #day ranges and travel segments may overlap in time
+            results.append(list(merge_by_time(patient_chunks)))
+        else:
+            results.append([event for events in patient_chunks for event in events])
+    return results
+
+def iter_patient_events(patients, processes=None, chunk_days=None, seed=None, solution_cache=None):
+    """ Generate data for several patients in parallel, see generate_patients
+        Yields a (patient index, list of events) tuple for each day range, as soon as it is
+        generated. Day ranges come in patient order, and in time order within a patient, but
+        the events of a range are grouped by datatype (settings, basal, bolus, wizard, cbg,
+        then smbg) unless the patient is time_ordered, see pipeline.merge_by_time to merge
+        the ranges.
+    """
+    if seed is None:
+        seed = random.getrandbits(64)
+    tasks = []
+    for patient_index, patient in enumerate(patients):
+        tasks.extend(make_tasks(patient_index, patient, chunk_days, seed, solution_cache))
+    if processes == 1:
+        yield from map(generate_chunk, tasks)
+    else:
+        with Pool(processes) as pool:
+            yield from pool.imap(generate_chunk, tasks)
+
+def make_tasks(patient_index, patient, chunk_days, seed, solution_cache=None):
+    """ Split the generation of one patient into tasks for generate_chunk
+        Each day range starts from the glucose state the previous range ends in, and every
+        range shares the pump settings of the patient. Both are found here, in a cheap pass
+        that draws the same random numbers as the simulation of each range.
+        A patient that is not split is generated exactly as generate_stages would with the
+        seed of the patient, and a travelling patient as travel_stages would, one task for each
+        segment of its itinerary and for each time change.
+    """
+    patient_seed = sub_seed(seed, patient_index)
+    num_days = patient['num_days']
+    if patient.get('travel'):
+        return travel_tasks(patient_index, patient, patient_seed, solution_cache)
+    if not chunk_days or chunk_days >= num_days:
+        return [(patient_index, patient, patient_seed, None, None, True, solution_cache)]
+
+    date_time = patient['date_time']
+    start_time = datetime(date_time.year, date_time.month, date_time.day, date_time.hour, date_time.minute)
+    pump_settings = PumpSettings(start_time, zonename=patient['zonename'], pump_name=patient['pump_name'],
+                                 rng=stage_rng(patient_seed, 'settings'))
+
+    tasks, bg_state, start_day = [], None, 0
+    while start_day < num_days:
+        days = min(chunk_days, num_days - start_day)
+        #every range but the last ends on the minute the next one starts with, dropped from it
+        chunk = dict(patient, num_days=days, date_time=date_time + timedelta(days=start_day),
+                     trim_end=start_day + days < num_days)
+        chunk_seed = sub_seed(patient_seed, len(tasks))
+        tasks.append((patient_index, chunk, chunk_seed, bg_state, pump_settings, not tasks, solution_cache))
+        bg_state = bg_simulator.simulate_state(days, bg_state, rng=stage_rng(chunk_seed, 'simulate'))
+        start_day += days
+    return tasks
+
+def travel_tasks(patient_index, patient, seed, solution_cache=None):
+    """ Split the generation of a travelling patient into the segments of its itinerary
+        Time change events are planned with the itinerary, and passed through as their own task.
+    """
+    tasks = []
+    for kind, details in travel_itinerary(patient['num_days'], patient['date_time'], patient['zonename'], seed):
+        if kind == 'segment':
+            num_days, zonename, start_date, segment_seed = details
+            segment = dict(patient, num_days=num_days, zonename=zonename, date_time=start_date, travel=False)
+            tasks.append((patient_index, segment, segment_seed, None, None, True, solution_cache))
+        else:
+            tasks.append((patient_index, {'events': details}, seed, None, None, True, solution_cache))
+    return tasks
+
+def generate_chunk(task):
+    """ Generate the events of one task made by make_tasks, runs in a worker process"""
+    patient_index, patient, seed, bg_state, pump_settings, include_settings, solution_cache = task
+    if 'events' in patient: #time change events of a travel itinerary
+        return patient_index, patient['events']
+    pipeline = make_pipeline(patient['num_days'], patient['zonename'], patient['date_time'],
+                             patient['gaps'], patient['smbg_freq'], patient['pump_name'],
+                             pump_settings=pump_settings, bg_state=bg_state, seed=seed,
+                             solution_cache=solution_cache, trim_end=patient.get('trim_end', False))
+    stages = []
+    for name, stage in pipeline.iter_stages():
+        if name == 'settings' and not include_settings: #settings are only part of the first range
+            continue
+        stages.append(stage)
+    if patient.get('time_ordered'):
+        return patient_index, list(merge_by_time(stages))
+    return patient_index, [event for stage in stages for event in stage]
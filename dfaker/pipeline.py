@@ -0,0 +1,73 @@
+import heapq
+
+class Pipeline(object):
+    """ Stages of data generation, run lazily one after another
+        Each stage is a function of the state of the pipeline, a dictionary shared by every
+        stage, that returns an iterable of events and may leave values in the state for the
+        stages after it. A stage only runs once the events of the stages before it have been
+        consumed, and the pipeline keeps no events, so the output of a stage is released once
+        it has been consumed, unless a later stage needs it. A stage that builds its whole
+        output at once still holds all of it while it is consumed.
+        state -- a dictionary of values shared by every stage, such as the arguments of dfaker
+    """
+    def __init__(self, state=None):
+        self.state = state if state is not None else {}
+        self._stages = []
+
+    def add_stage(self, name, stage):
+        """ Add a stage after the others and return the pipeline
+            name -- name of the stage, such as the datatype it generates
+            stage -- a function of the state returning an iterable of events
+        """
+        self._stages.append((name, stage))
+        return self
+
+    def names(self):
+        return [name for name, stage in self._stages]
+
+    def iter_stages(self):
+        """ Yields a (name, iterable of events) tuple for each stage, in order
+            Each stage runs when it is reached, so the events of a stage should be consumed
+            before moving on to the next one.
+        """
+        for name, stage in self._stages:
+            yield name, stage(self.state)
+
+    def __iter__(self):
+        for name, events in self.iter_stages():
+            for event in events:
+                yield event
+
+    def iter_time_ordered(self):
+        """ Yields every event in time order, see merge_by_time
+            Every stage runs before the first event is yielded, the events of each stage are
+            then merged as they are iterated over.
+        """
+        return merge_by_time([events for name, events in self.iter_stages()])
+
+    def drain(self, writer, time_ordered=False):
+        """ Write every event to a sink with a write method, such as a json_writer.NDJSONWriter
+            The writer is left open. Returns the number of events written.
+            time_ordered -- write the events in time order rather than one stage after another
+        """
+        count = 0
+        for event in (self.iter_time_ordered() if time_ordered else self):
+            writer.write(event)
+            count += 1
+        return count
+
+
+def merge_by_time(streams):
+    """ Merge iterables of events, each in time order, into a single iterator in time order
+        Events are compared by their 'time' fields, utc ISO 8601 strings of the same format
+        that sort in time order, with a heap holding the next event of each stream. Events
+        with the same time keep the order of their streams, so the output is the same as a
+        stable sort of the streams one after another.
+        streams -- a list of iterables of events, such as the output of each stage
+    """
+    def keyed(rank, events):
+        for index, event in enumerate(events):
+            yield event["time"], rank, index, event
+    merged = heapq.merge(*[keyed(rank, events) for rank, events in enumerate(streams)])
+    for time, rank, index, event in merged:
+        yield event
@@ -3,19 +3,20 @@ import random
 from . import common_fields
 from . import tools
 
-def make_pump_settings(start_time, zonename, pump_name):
+def make_pump_settings(start_time, zonename, pump_name, rng=random):
     """ Construct a settings object
         start_time -- a datetime object with a timezone
         zonename -- name of timezone in effect
+        rng -- random number generator to draw from
     """
     settings_data = []
     settings = {}
     offset = tools.get_offset(zonename, start_time)
     utc_time = tools.convert_ISO_to_epoch(str(start_time), '%Y-%m-%d %H:%M:%S')
     time_in_seconds = int(utc_time - offset*60)
-    settings = common_fields.add_common_fields('pumpSettings', settings, time_in_seconds, zonename)
+    settings = common_fields.add_common_fields('pumpSettings', settings, time_in_seconds, zonename, rng)
     settings["activeSchedule"] = "standard"
-    settings["actionTime"] = random.randint(3,4) #3 or 4 hours for insulin to decay completely
+    settings["actionTime"] = rng.randint(3,4) #3 or 4 hours for insulin to decay completely
     settings["basalSchedules"] =  {"standard": [{"rate": 0.9, "start": 0},
                                                 {"rate": 0.6, "start": 3600000},
                                                 {"rate": 0.65, "start": 10800000},
@@ -27,48 +28,81 @@ def make_pump_settings(start_time, zonename, pump_name):
                                                 {"rate": 0.85, "start": 61200000}]}
     #pump specific settings:
     if pump_name == "Medtronic" or pump_name == "OmniPod":
-        settings["carbRatio"] = [{"amount": random.randint(9, 15), "start": 0},
-                                 {"amount": random.randint(9, 15), "start": 36000000},
-                                 {"amount": random.randint(9, 15), "start": 72000000}]
+        settings["carbRatio"] = [{"amount": rng.randint(9, 15), "start": 0},
+                                 {"amount": rng.randint(9, 15), "start": 36000000},
+                                 {"amount": rng.randint(9, 15), "start": 72000000}]
         settings["insulinSensitivity"] = [{"amount": tools.convert_to_mmol(30), "start": 0},
                                           {"amount": tools.convert_to_mmol(40), "start": 18000000},
                                           {"amount": tools.convert_to_mmol(50), "start": 39600000},
                                           {"amount": tools.convert_to_mmol(35), "start": 68400000}]
         if pump_name == 'Medtronic':
-            settings["bgTarget"] = medtronic_settings()
+            settings["bgTarget"] = medtronic_settings(rng)
         elif pump_name == 'OmniPod':
-            settings["bgTarget"] = omniPod_settings()
+            settings["bgTarget"] = omniPod_settings(rng)
     elif pump_name == 'Tandem':
-        settings["carbRatios"], settings["insulinSensitivities"], settings["bgTargets"] = tandem_settings()
+        settings["carbRatios"], settings["insulinSensitivities"], settings["bgTargets"] = tandem_settings(rng)
     settings["units"] = { "bg": "mg/dL","carb": "grams"}
     settings_data.append(settings)
     return settings_data
 
-def omniPod_settings():
-    target = random.randrange(90, 110, 10)
-    bgTarget_high = random.randrange(target + 10, 140, 10)
+class PumpSettings(object):
+    """ Pump settings for a single run, created once and shared by every datatype
+        Schedules are compiled once, so that the values in effect at any time
+        match the emitted pumpSettings event.
+        start_time -- a datetime object with a timezone
+        zonename -- name of timezone in effect
+        pump_name -- name of the pump
+        rng -- random number generator to draw from
+    """
+    def __init__(self, start_time, zonename, pump_name, rng=random):
+        self.pump_name = pump_name
+        self.settings_data = make_pump_settings(start_time, zonename, pump_name, rng)
+        self.settings = self.settings_data[0]
+        self.action_time = self.settings["actionTime"]
+        self.basal_schedule = tools.Schedule(self.settings["basalSchedules"]["standard"],
+                                             "basalSchedules")
+        if pump_name == 'Tandem':
+            carb_ratio = self.settings["carbRatios"]["standard"]
+            sensitivity = self.settings["insulinSensitivities"]["standard"]
+        else:
+            carb_ratio = self.settings["carbRatio"]
+            sensitivity = self.settings["insulinSensitivity"]
+        self.carb_ratio_schedule = tools.Schedule(carb_ratio, "carbRatio")
+        self.sensitivity_schedule = tools.Schedule(sensitivity, "insulinSensitivity")
+
+    def carb_ratio(self, timestamp, offset):
+        """ Return the carb ratio in effect at an epoch time with a timezone offset in minutes"""
+        return self.carb_ratio_schedule.value_at(tools.ms_since_midnight(timestamp, offset))
+
+    def insulin_sensitivity(self, timestamp, offset):
+        """ Return the insulin sensitivity in effect at an epoch time with a timezone offset in minutes"""
+        return self.sensitivity_schedule.value_at(tools.ms_since_midnight(timestamp, offset))
+
+def omniPod_settings(rng=random):
+    target = rng.randrange(90, 110, 10)
+    bgTarget_high = rng.randrange(target + 10, 140, 10)
     bgTarget = [{"high": tools.convert_to_mmol(bgTarget_high), 
                              "target": tools.convert_to_mmol(target), 
                              "start": 0}]
     return bgTarget
 
-def medtronic_settings():
-    bgTarget_low = random.randrange(80, 120, 10)
-    bgTarget_high = random.randrange(bgTarget_low + 10, 140, 10)
+def medtronic_settings(rng=random):
+    bgTarget_low = rng.randrange(80, 120, 10)
+    bgTarget_high = rng.randrange(bgTarget_low + 10, 140, 10)
     bgTarget = [{"high": tools.convert_to_mmol(bgTarget_high), 
                              "low": tools.convert_to_mmol(bgTarget_low), 
                              "start": 0}]
     return bgTarget
 
-def tandem_settings():
-    carb_ratios = {'standard': [{"amount": random.randint(9, 15), "start": 0},
-                                          {"amount": random.randint(9, 15), "start": 36000000},
-                                          {"amount": random.randint(9, 15), "start": 72000000}]}
+def tandem_settings(rng=random):
+    carb_ratios = {'standard': [{"amount": rng.randint(9, 15), "start": 0},
+                                          {"amount": rng.randint(9, 15), "start": 36000000},
+                                          {"amount": rng.randint(9, 15), "start": 72000000}]}
     insulin_sensitivities = {'standard': [{"amount": tools.convert_to_mmol(30), "start": 0},
                                           {"amount": tools.convert_to_mmol(40), "start": 18000000},
                                           {"amount": tools.convert_to_mmol(50), "start": 39600000},
                                           {"amount": tools.convert_to_mmol(35), "start": 68400000}]}
-    target = random.randrange(90, 110, 10)
+    target = rng.randrange(90, 110, 10)
     bg_targets = {'standard': [{"target": tools.convert_to_mmol(target),
                              "start": 0}]}
     return carb_ratios, insulin_sensitivities, bg_targets
@@ -1,58 +1,85 @@
-from datetime import datetime
+import numpy as np
 import random 
-import pytz
 
-from . import common_fields
 from . import tools
+from .event_table import EventTable
+from .timezones import zone_table
 
-def remove_night_smbg(gluc, timesteps, zonename):
-    """ Remove most smbg night events """
-    keep = []
-    for row in zip(gluc, timesteps):
-        hour = datetime.fromtimestamp(row[1], pytz.timezone(zonename)).hour
-        night_smbg = random.randint(0, 4) #keep some random night smbg events 
-        if hour > 6 and hour < 24:
-            keep.append(row)
-        elif night_smbg == 2:
-            keep.append(row)
-    return keep
-        
-def randomize_smbg(time_gluc, stick_freq):
-    """ Randomize smbg times according to fingerstick frequency """
-    fingersticks_per_day = stick_freq
-    total = (24 * 60) / 5 
-    increment = int(total / fingersticks_per_day)
-    start, keep = 0, []
-    while start < len(time_gluc):
-        try:
-            index = random.randint(start, start + increment)
-            keep.append(time_gluc[index])
-            start += increment
-        except:
-            break
-    return keep
+#annotation codes for out of range readings
+HIGH, LOW = 1, 2
+ANNOTATIONS = [None,
+               [{"code": "bg/out-of-range", "threshold": 600, "value": "high"}],
+               [{"code": "bg/out-of-range", "threshold": 20, "value": "low"}]]
 
-def smbg(gluc, timesteps, stick_freq, zonename):
+#relative chance of a fingerstick in each local hour, few sticks happen at night
+DEFAULT_PROFILE = [0.2] * 7 + [1.0] * 17
+
+def stick_times(first_time, last_time, sticks_per_day, zonename, rng=random, profile=None):
+    """ Draw fingerstick times, sticks_per_day on every local day
+        The day is split into sticks_per_day parts of equal probability under the profile, and
+        a stick is drawn within each part, so sticks are spread over the day.
+        first_time, last_time -- epoch times of the first and last glucose readings
+        sticks_per_day -- an integer reflecting number of fingersticks per day
+        zonename -- name of timezone in effect
+        rng -- random number generator to draw from
+        profile -- relative chance of a stick in equal parts of the local day, such as
+                   DEFAULT_PROFILE with one weight for each hour
+        Returns a sorted numpy array of epoch times from first_time to last_time.
+    """
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    table = zone_table(zonename)
+    first_day = (first_time + table.utc_offset(first_time) * 60) // 86400
+    last_day = (last_time + table.utc_offset(last_time) * 60) // 86400
+    days = np.arange(first_day, last_day + 1)
+    weights = np.asarray(profile, dtype=float)
+    cdf = np.concatenate(([0], np.cumsum(weights))) / weights.sum()
+    draws = np.random.RandomState(rng.getrandbits(32))
+    quantiles = (np.arange(sticks_per_day) + draws.uniform(0, 1, (len(days), sticks_per_day))) / sticks_per_day
+    part = np.searchsorted(cdf, quantiles, side='right') - 1
+    within = (quantiles - cdf[part]) / (cdf[part + 1] - cdf[part])
+    local_seconds = (days[:, np.newaxis] * 86400 + (part + within) * 86400 / len(weights)).ravel()
+    times = np.sort(local_seconds - table.local_offsets(local_seconds) * 60)
+    return times[(times >= first_time) & (times <= last_time)]
+
+def smbg(gluc, timesteps, stick_freq, zonename, rng=random, profile=None):
     """ construct smbg events
         gluc -- a list of glucose values at each timestep
         timesteps -- a list of epoch times 
         stick_freq -- an integer reflecting number of fingersticks per day
         zonename -- name of timezone in effect 
+        rng -- random number generator to draw from
+        profile -- relative chance of a stick in equal parts of the local day, see stick_times
+    """
+    return smbg_table(gluc, timesteps, stick_freq, zonename, rng, profile).to_list()
+
+def smbg_table(gluc, timesteps, stick_freq, zonename, rng=random, profile=None):
+    """ construct smbg events in columnar form
+        gluc -- a list of glucose values at each timestep
+        timesteps -- a list of epoch times 
+        stick_freq -- an integer reflecting number of fingersticks per day
+        zonename -- name of timezone in effect 
+        rng -- random number generator to draw from
+        profile -- relative chance of a stick in equal parts of the local day, see stick_times
     """
-    smbg_data = []
-    remove_night = remove_night_smbg(gluc, timesteps, zonename)   
-    time_gluc = randomize_smbg(remove_night, stick_freq)
-    for value, timestamp in time_gluc:
-        smbg_reading = {}
-        smbg_reading = common_fields.add_common_fields('smbg', smbg_reading, timestamp, zonename)
-        #add a randomized value to smbg value so cbg and smbg are not always identical
-        smbg_reading["value"] = tools.convert_to_mmol(value) + random.uniform(-1.5, 1.5) 
-        if value > 600:
-            smbg_reading["annotation"] = [{"code": "bg/out-of-range", "threshold": 600, "value": "high"}]
-            smbg_reading["value"] = tools.convert_to_mmol(601)
-        elif value < 20:
-            smbg_reading["annotation"] = [{"code": "bg/out-of-range", "threshold": 20, "value": "low"}]
-            smbg_reading["value"] = tools.convert_to_mmol(19)        
-        smbg_reading["units"] = "mmol/L"
-        smbg_data.append(smbg_reading)
-    return smbg_data
\ No newline at end of file
+    gluc = np.asarray(gluc, dtype=float)
+    timesteps = np.asarray(timesteps, dtype=float)
+    index = np.array([], dtype=int)
+    if len(timesteps):
+        sticks = stick_times(timesteps[0], timesteps[-1], stick_freq, zonename, rng, profile)
+        #each stick reads the latest glucose value
+        index = np.unique(np.searchsorted(timesteps, sticks, side='right') - 1)
+    value = gluc[index]
+    #add a randomized value to smbg value so cbg and smbg are not always identical
+    draws = np.random.RandomState(rng.getrandbits(32))
+    values = tools.convert_to_mmol(value) + draws.uniform(-1.5, 1.5, len(index))
+    annotations = np.zeros(len(index), dtype=np.int8)
+    high, low = value > 600, value < 20
+    annotations[high] = HIGH
+    values[high] = tools.convert_to_mmol(601)
+    annotations[low] = LOW
+    values[low] = tools.convert_to_mmol(19)
+    smbg_readings = EventTable('smbg', timesteps[index], zonename, columns={"value": values},
+                               constants={"units": "mmol/L"}, rng=rng)
+    smbg_readings.add_category("annotation", annotations, ANNOTATIONS)
+    return smbg_readings
@@ -0,0 +1,113 @@
+import numpy as np
+
+BLOCK_SIZE = 4096 #number of points fit at once
+
+def neighbors(frac, n):
+    """ Return the number of neighbors in each local regression, as statsmodels lowess does"""
+    return min(max(int(frac * n + 1e-10), 2), n)
+
+def neighborhoods(x, k):
+    """ Return the index of the leftmost of the k nearest neighbors of every point of sorted x
+        As in statsmodels lowess, it is the first window of k points whose midpoint is not
+        to the left of the point.
+    """
+    n = len(x)
+    midpoints = (x[:n - k] + x[k:]) / 2
+    return np.searchsorted(midpoints, x, side='left')
+
+def windowed_lowess(y, x, frac, it=3, block=BLOCK_SIZE, map_function=map):
+    """ Lowess smoothing of sorted data, fit over overlapping windows of nearest neighbors
+        Follows statsmodels lowess(y, x, frac, it, is_sorted=True): the same neighbors,
+        tricube weights, local linear regressions and robustifying iterations, so the result
+        only differs by floating point rounding. The regressions of a block of points are
+        solved at once, and only ever look at each point's own window of neighbors, so the
+        cost grows linearly with the number of points.
+        y -- a numpy array of values
+        x -- a sorted numpy array of values
+        frac -- fraction of all points used in each local regression
+        it -- number of robustifying iterations
+        block -- number of points fit at once
+        map_function -- a map function over the blocks, such as the map of a process pool,
+                        each block is sent with its own slice of the data, see block_task
+        Returns a two column numpy array of x and smoothed y values.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n == 0:
+        return np.empty((0, 2))
+    k = neighbors(frac, n)
+    left = neighborhoods(x, k)
+    resid_weights = np.ones(n)
+    for iteration in range(it + 1):
+        tasks = [block_task(y, x, resid_weights, left[start:start + block], start, k)
+                 for start in range(0, n, block)]
+        y_fit = np.concatenate(list(map_function(fit_block, tasks)))
+        if iteration < it:
+            resid_weights = residual_weights(y, y_fit)
+    return np.column_stack((x, y_fit))
+
+def block_task(y, x, resid_weights, left, start, k):
+    """ Return the task of fit_block for a block of points starting at index start
+        The task only holds the part of the data the block looks at, its points and their
+        windows of neighbors, with indices counted from the start of that part, so tasks
+        stay small when sent to another process.
+    """
+    first = min(left[0], start)
+    last = max(left[-1] + k, start + len(left))
+    return (y[first:last], x[first:last], resid_weights[first:last], left - first, start - first, k)
+
+def fit_block(task):
+    """ Solve the local regressions of a block of points, see windowed_lowess"""
+    y, x, resid_weights, left, start, k = task
+    points = np.arange(start, start + len(left))
+    index = left[:, np.newaxis] + np.arange(k)
+    xval = x[points][:, np.newaxis]
+    window_x = x[index]
+    distance = np.abs(window_x - xval)
+    radius = np.maximum(x[points] - x[left], x[left + k - 1] - x[points])[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = (1 - (distance / radius) ** 3) ** 3 * resid_weights[index]
+    weights = np.nan_to_num(weights)
+    regression_ok = np.count_nonzero(weights > 1e-12, axis=1) >= 2
+    weights /= np.where(regression_ok, weights.sum(axis=1), 1)[:, np.newaxis]
+    mean_x = (weights * window_x).sum(axis=1, keepdims=True)
+    deviation = window_x - mean_x
+    variance = np.maximum((weights * deviation ** 2).sum(axis=1, keepdims=True), 1e-12)
+    projection = weights * (1 + (xval - mean_x) * deviation / variance)
+    y_fit = (projection * y[index]).sum(axis=1)
+    return np.where(regression_ok, y_fit, y[points]) #points without a regression keep their value
+
+def residual_weights(y, y_fit):
+    """ Bisquare weights of the residuals for the next robustifying iteration"""
+    residuals = np.abs(y - y_fit)
+    median = np.median(residuals)
+    if median == 0:
+        scaled = (residuals > 0).astype(float)
+    else:
+        scaled = np.minimum(residuals / (6.0 * median), 1)
+    return (1 - scaled ** 2) ** 2
+
+def kernel_smooth(y, x, frac):
+    """ Tricube kernel smoothing of sorted data, a lightweight alternative to lowess
+        Every point is replaced by the tricube weighted average of its nearest neighbors,
+        chosen as in lowess, without local regression or robustifying iterations. Peaks
+        and the ends of the data are flattened more than by lowess.
+        y -- a numpy array of values
+        x -- a sorted numpy array of values
+        frac -- fraction of all points used in each average
+        Returns a two column numpy array of x and smoothed y values.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n == 0:
+        return np.empty((0, 2))
+    k = neighbors(frac, n)
+    index = neighborhoods(x, k)[:, np.newaxis] + np.arange(k)
+    distance = np.abs(x[index] - x[:, np.newaxis])
+    radius = np.maximum(distance.max(axis=1, keepdims=True), 1e-12)
+    weights = (1 - np.minimum(distance / radius, 1) ** 3) ** 3
+    totals = weights.sum(axis=1)
+    smoothed = np.where(totals > 0, (weights * y[index]).sum(axis=1) / np.maximum(totals, 1e-12), y)
+    return np.column_stack((x, smoothed))
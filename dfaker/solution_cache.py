@@ -0,0 +1,83 @@
+import hashlib
+import numpy as np
+import os
+import tempfile
+
+from . import bg_simulator
+from .streams import stage_rng
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024 #512 MB
+
+class SolutionCache(object):
+    """ On-disk cache of simulated glucose solutions
+        Solutions are stored as .npy files named after a hash of everything that determines
+        them, and are read back memory-mapped. Only seeded simulations can be cached, since
+        unseeded ones never repeat. When the cache grows over max_bytes, the least recently
+        used solutions are removed.
+        directory -- directory holding the cached solutions, created if needed
+        max_bytes -- maximum total size of the cached solutions
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, seed, num_days, method='analytic', initial_state=None):
+        """ Return the cache key of a simulation, as given to bg_simulator.simulate
+            The version of the glucose model is part of the key, so solutions cached before
+            a change to the model are not read back.
+        """
+        description = repr((bg_simulator.MODEL_VERSION, seed, num_days, method, initial_state))
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        """ Return a read-only memory-mapped solution, or None if it is not cached"""
+        path = self.path(key)
+        try:
+            os.utime(path, None) #mark as recently used
+            return np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError): #missing, or removed while being read
+            return None
+
+    def put(self, key, solution):
+        """ Store a solution, then evict old solutions if the cache is too big"""
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as file_object:
+            np.save(file_object, solution)
+        os.replace(file_object.name, self.path(key)) #readers never see a partial file
+        self.evict()
+
+    def evict(self):
+        """ Remove the least recently used solutions until the cache fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError: #removed by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def simulate(self, num_days, seed, method='analytic', initial_state=None):
+        """ Return the solution of bg_simulator.simulate for a seeded run, simulating it
+            only if it is not cached yet
+            seed -- seed of the run, as given to data_generator.generate_stages
+        """
+        key = self.key(seed, num_days, method, initial_state)
+        solution = self.get(key)
+        if solution is None:
+            solution = bg_simulator.simulate(num_days, method=method, initial_state=initial_state,
+                                             rng=stage_rng(seed, 'simulate'))
+            self.put(key, solution)
+        return solution
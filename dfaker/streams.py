@@ -0,0 +1,27 @@
+import random
+import uuid
+
+def stage_rng(seed, stage):
+    """ Return the random number generator of one stage of a run
+        Every stage of a seeded run draws from its own stream, so a stage always produces
+        the same data for the same seed, regardless of the other stages.
+        seed -- seed of the run, None draws every stage from the global random module
+        stage -- name of the stage
+    """
+    if seed is None:
+        return random
+    return random.Random(sub_seed(seed, stage))
+
+def sub_seed(seed, name):
+    """ Return the seed of a part of a run, such as one segment of a travel event"""
+    if seed is None:
+        return None
+    return '{}:{}'.format(seed, name)
+
+def make_id(rng=random):
+    """ Return a random uuid string
+        Ids are drawn from rng in seeded runs, and from the operating system otherwise.
+    """
+    if rng is random:
+        return str(uuid.uuid4())
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
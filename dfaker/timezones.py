@@ -0,0 +1,83 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from functools import lru_cache
+import numpy as np
+import pytz
+
+EPOCH = datetime(1970, 1, 1)
+
+class ZoneTable(object):
+    """ Precomputed DST transition table of a timezone
+        Timezone offsets are found with a binary search over the transition instants,
+        instead of localizing a datetime for every event.
+        zonename -- name of timezone
+    """
+    def __init__(self, zonename):
+        zone = pytz.timezone(zonename)
+        if zonename == 'UTC': #offsets in UTC are integers, as in tools.get_offset
+            self.instants = np.array([-np.inf])
+            self.offsets = np.zeros(1, dtype=int)
+        elif hasattr(zone, '_utc_transition_times'):
+            self.instants = np.array([(transition - EPOCH).total_seconds()
+                                      for transition in zone._utc_transition_times])
+            self.offsets = np.array([utcoffset.total_seconds() / 60
+                                     for utcoffset, dst, name in zone._transition_info])
+        else: #zones without daylight saving time
+            self.instants = np.array([-np.inf])
+            self.offsets = np.array([zone.utcoffset(EPOCH).total_seconds() / 60])
+        self._instants = self.instants.tolist()
+        self._offsets = self.offsets.tolist()
+        self._build_local_table(zone)
+
+    def _build_local_table(self, zone):
+        """ Find the local times at which the offset changes
+            Around each transition, local times in the window between the old and the new
+            offset are either ambiguous or non-existent. Every local time in the window
+            resolves to the same offset, which is taken from pytz once per window.
+        """
+        breakpoints, local_offsets = [], [self._offsets[0]]
+        for i in range(1, len(self._instants)):
+            before, after = self._offsets[i - 1] * 60, self._offsets[i] * 60
+            window_start = self._instants[i] + min(before, after)
+            window_end = self._instants[i] + max(before, after)
+            midpoint = EPOCH + timedelta(seconds=(window_start + window_end) / 2)
+            breakpoints += [window_start, window_end]
+            local_offsets += [localized_offset(zone, midpoint), self._offsets[i]]
+        self.local_breakpoints = np.array(breakpoints, dtype=float)
+        self.breakpoint_offsets = np.array(local_offsets, dtype=self.offsets.dtype)
+        self._local_breakpoints = breakpoints
+        self._breakpoint_offsets = local_offsets
+
+    def utc_offset(self, timestamp):
+        """ Return the offset (in minutes) from UTC in effect at an epoch time"""
+        return self._offsets[max(bisect_right(self._instants, timestamp) - 1, 0)]
+
+    def utc_offsets(self, timestamps):
+        """ Return a numpy array of offsets (in minutes) from UTC for an array of epoch times"""
+        index = np.searchsorted(self.instants, np.asarray(timestamps, dtype=float), side='right') - 1
+        return self.offsets[np.maximum(index, 0)]
+
+    def local_offset(self, date):
+        """ Return the offset (in minutes) from UTC in effect at a timezone naive local datetime
+            Ambiguous and non-existent local times resolve like tools.is_dst and pytz do.
+        """
+        local_seconds = (date - EPOCH).total_seconds()
+        return self._breakpoint_offsets[bisect_right(self._local_breakpoints, local_seconds)]
+
+    def local_offsets(self, local_seconds):
+        """ Return a numpy array of offsets (in minutes) from UTC for an array of local times,
+            given in seconds since 1970-01-01 00:00 local time
+        """
+        index = np.searchsorted(self.local_breakpoints, np.asarray(local_seconds, dtype=float),
+                                side='right')
+        return self.breakpoint_offsets[index]
+
+def localized_offset(zone, date):
+    """ Return the offset (in minutes) pytz gives a timezone naive local datetime"""
+    dst = zone.localize(date).dst() != timedelta(0)
+    return zone.utcoffset(date, is_dst=dst).total_seconds() / 60
+
+@lru_cache(maxsize=None)
+def zone_table(zonename):
+    """ Return the transition table of a timezone, built once per timezone"""
+    return ZoneTable(zonename)
@@ -1,23 +1,25 @@
+from bisect import bisect_right
+import math
+import numpy as np
 import pytz
 from datetime import datetime, timedelta 
 
+from .timezones import zone_table
+
 def is_dst(zonename, date):
     local_tz = pytz.timezone(zonename)
     localized_time = local_tz.localize(date)
     return localized_time.dst() != timedelta(0)
 
 def get_offset(zonename, date):
-    local_tz = pytz.timezone(zonename) 
-    if zonename == 'UTC':
-        return 0
-    elif is_dst(zonename, date):
-        return local_tz.utcoffset(date, is_dst=True).total_seconds() / 60
-    else:
-        return local_tz.utcoffset(date, is_dst=False).total_seconds() / 60
+    """ Return the offset (in minutes) from UTC of a timezone naive local datetime
+        Offsets are looked up in a table of DST transitions built once per timezone.
+    """
+    return zone_table(zonename).local_offset(date)
 
 def convert_to_mmol(iterable):
     conversion_factor = 18.01559
-    if isinstance(iterable, float) or isinstance(iterable, int):
+    if isinstance(iterable, float) or isinstance(iterable, int) or isinstance(iterable, np.ndarray):
         return iterable / conversion_factor
     return [reading / conversion_factor for reading in iterable]
 
@@ -25,7 +27,11 @@ def round_to(n, precision=0.005):
     """ The round function can take positive or negative values
         and round them to a certain precision.
         In the fake data generator, only positive values are being passed into it
+        n -- a number, or a numpy array of numbers
     """
+    if isinstance(n, np.ndarray):
+        result = np.trunc(n / precision + np.where(n >= 0, 0.5, -0.5)) * precision
+        return np.round(result, 3)
     if n >= 0:
         correction = 0.5 
     else:
@@ -63,26 +69,51 @@ def get_rate_from_settings(schedule, time, name):
        Returned results are in mmol/L.
     """
     t = datetime.strptime(time, '%Y-%m-%dT%H:%M:%S')
-    if name == "basalSchedules": #account for variation in naming 
-        value_name = "rate" #set initial rate
-    else:
-        value_name = "amount"
     ms_since_midnight = t.hour*60*60*1000 + t.minute*60*1000 + t.second*1000
-    last_segment = schedule[len(schedule)-1]
-    full_day = 86400000 #24 hours in ms
-    rate = schedule[0][value_name] #set initial rate
-    initial_start = ms_since_midnight #set initial start time
-    for segment in schedule:
-        end = segment["start"]
-        if ms_since_midnight < segment["start"]:
-            break
-        elif ms_since_midnight >= last_segment["start"]:
-            start = last_segment["start"]
-            end = full_day
-            rate = last_segment[value_name]
-            break
-        start = segment["start"]
-        rate = segment[value_name] #update rate to next segment rate
+    rate, start, end = Schedule(schedule, name).lookup(ms_since_midnight)
     if name == "basalSchedules":
-        return rate, start, initial_start, end 
-    return rate #only rate needed for insulin sensitivity/carb ratio events
\ No newline at end of file
+        return rate, start, ms_since_midnight, end 
+    return rate #only rate needed for insulin sensitivity/carb ratio events
+
+def ms_since_midnight(timestamp, offset):
+    """ Return the number of milliseconds since local midnight
+        timestamp -- an epoch time in utc, or a numpy array of them
+        offset -- timezone offset in minutes, or a numpy array of them
+    """
+    if isinstance(timestamp, np.ndarray) or isinstance(offset, np.ndarray):
+        local_seconds = np.floor(timestamp + np.asarray(offset) * 60).astype(np.int64)
+        return local_seconds % 86400 * 1000
+    return math.floor(timestamp + offset * 60) % 86400 * 1000
+
+class Schedule(object):
+    """ A settings schedule compiled into a sorted array of segment start times
+        Lookups take milliseconds since local midnight and use a binary search.
+        schedule -- a list of segments from settings, sorted by start time (in ms since midnight)
+        name -- basalSchedules segments hold a rate, carbRatio and insulinSensitivity segments
+                hold an amount
+    """
+    full_day = 86400000 #24 hours in ms
+
+    def __init__(self, schedule, name):
+        if name == "basalSchedules": #account for variation in naming 
+            value_name = "rate"
+        else:
+            value_name = "amount"
+        self.starts = [segment["start"] for segment in schedule]
+        self.ends = self.starts[1:] + [self.full_day]
+        self.values = [segment[value_name] for segment in schedule]
+        self._np_starts = np.array(self.starts)
+
+    def lookup(self, ms_since_midnight):
+        """ Return the value, start and end (in ms since midnight) of the segment in effect"""
+        index = max(bisect_right(self.starts, ms_since_midnight) - 1, 0)
+        return self.values[index], self.starts[index], self.ends[index]
+
+    def value_at(self, ms_since_midnight):
+        """ Return the value of the segment in effect"""
+        return self.values[max(bisect_right(self.starts, ms_since_midnight) - 1, 0)]
+
+    def values_at(self, ms_since_midnight):
+        """ Return a numpy array of values for an array of times in ms since midnight"""
+        index = np.searchsorted(self._np_starts, ms_since_midnight, side='right') - 1
+        return np.array(self.values)[np.maximum(index, 0)]
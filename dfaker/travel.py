@@ -2,37 +2,100 @@ from . import tools
 import math
 import random
 from datetime import timedelta
-from .data_generator import dfaker
+from .data_generator import generate_stages
 from .device_event import make_time_change_event 
+from .pipeline import merge_by_time
+from .streams import stage_rng, sub_seed
 
-def travel(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name):
-    """ Arrange travel simulation over the courseo of num_days
+def travel(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name, seed=None, solution_cache=None,
+           time_ordered=False):
+    """ Arrange travel simulation over the course of num_days
         If num days is greater than 30, allow for multiple travel events
+        seed -- makes the output reproducible, see data_generator.generate_stages
+        solution_cache -- a SolutionCache to reuse glucose simulations from
+        time_ordered -- return the events in time order, segments in different timezones may
+                        overlap in utc time, so every segment is merged with the others
     """
+    stages = travel_stages(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name, seed,
+                           solution_cache)
+    if time_ordered:
+        return list(merge_by_time(list(stages)))
     result = []
-    if num_days <= 30: #generate only 1 travel event
-        result = travel_event(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name)
-    else:
-        times_travelled = random.randint(2, math.ceil(num_days / 30))
-        segment = num_days / times_travelled
-        for _ in range(0, times_travelled):
-            result += travel_event(segment, start_date, curr_zone, gaps, smbg_freq, pump_name)
-            start_date += timedelta(days=segment)
+    for stage in stages:
+        result.extend(stage)
     return result
 
-def travel_event(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name): 
+def travel_stages(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name, seed=None,
+                  solution_cache=None):
+    """ Arrange travel simulation over the course of num_days
+        Yields the output of each datatype for every travel segment as soon as it is generated
+    """
+    itinerary = travel_itinerary(num_days, start_date, curr_zone, seed)
+    yield from itinerary_stages(itinerary, gaps, smbg_freq, pump_name, solution_cache)
+
+def travel_itinerary(num_days, start_date, curr_zone, seed=None):
+    """ Plan every travel event over the course of num_days, before generating any data
+        If num days is greater than 30, allow for multiple travel events
+        Returns a list of steps in time order, either ('segment', (num_days, zonename, start date, seed))
+        for a range of days spent in a single timezone, or ('events', [time change event]).
+        Every segment has its own seed, so segments can be generated in any order, or in
+        parallel (see parallel.generate_patients).
+    """
+    if num_days <= 30: #generate only 1 travel event
+        return travel_event_itinerary(num_days, start_date, curr_zone, sub_seed(seed, 0))
+    itinerary = []
+    times_travelled = stage_rng(seed, 'travel').randint(2, math.ceil(num_days / 30))
+    segment = num_days / times_travelled
+    for travel_index in range(0, times_travelled):
+        itinerary.extend(travel_event_itinerary(segment, start_date, curr_zone, sub_seed(seed, travel_index)))
+        start_date += timedelta(days=segment)
+    return itinerary
+
+def itinerary_stages(itinerary, gaps, smbg_freq, pump_name, solution_cache=None):
+    """ Generate the segments of an itinerary one after another
+        Yields the output of each datatype for every segment, and the time change events
+    """
+    for kind, details in itinerary:
+        if kind == 'segment':
+            num_days, zonename, start_date, seed = details
+            yield from generate_stages(num_days, zonename, start_date, gaps, smbg_freq, pump_name,
+                                       seed=seed, solution_cache=solution_cache)
+        else:
+            yield details
+
+def travel_event(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name, seed=None,
+                 solution_cache=None): 
     """ Simulate a single travel event over the course of num_days
     """
     result = []
-    
+    for stage in travel_event_stages(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name, seed,
+                                     solution_cache):
+        result.extend(stage)
+    return result
+
+def travel_event_stages(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name, seed=None,
+                        solution_cache=None): 
+    """ Simulate a single travel event over the course of num_days
+        Yields the output of each datatype for the segments before, during and after travelling
+        seed -- each segment is generated with its own seed derived from seed
+    """
+    itinerary = travel_event_itinerary(num_days, start_date, curr_zone, seed)
+    yield from itinerary_stages(itinerary, gaps, smbg_freq, pump_name, solution_cache)
+
+def travel_event_itinerary(num_days, start_date, curr_zone, seed=None):
+    """ Plan a single travel event over the course of num_days, see travel_itinerary
+        Returns the segments before, during and after travelling, and a time change event
+        between each of them.
+    """
+    rng = stage_rng(seed, 'travel')
     #set max travelling days according to num_days 
     if num_days / 3 < 6:
         maxDays = 6
     else:
         maxDays = int(num_days / 3)
-    travel_days = random.randint(5, maxDays)
-    travel_zone = select_travel_destination(curr_zone)
-    travel_start_date = start_date + timedelta(days=random.randint(2, int(num_days - travel_days - 1)))
+    travel_days = rng.randint(5, maxDays)
+    travel_zone = select_travel_destination(curr_zone, rng)
+    travel_start_date = start_date + timedelta(days=rng.randint(2, int(num_days - travel_days - 1)))
 
     #count number of days before and after travelling event     
     days_before = (travel_start_date - start_date).days + (travel_start_date - start_date).seconds / (60*60*24)
@@ -45,33 +108,30 @@ def travel_event(num_days, start_date, curr_zone, gaps, smbg_freq, pump_name):
 
     end_travel = travel_start_date + timedelta(days=travel_days)
 
-    #generate data for each segment
-    before_travel = dfaker(days_before, curr_zone, start_date, gaps, smbg_freq, pump_name)
-    during_travel = dfaker(travel_days, travel_zone, start_travel, gaps, smbg_freq, pump_name)
-    after_travel = dfaker(days_after, curr_zone, end_travel, gaps, smbg_freq, pump_name)
-
-    #add device meta event for each timechange
+    #a segment for each timezone, with a device meta event for each timechange
+    itinerary = [('segment', (days_before, curr_zone, start_date, sub_seed(seed, 'before')))]
     timestamp = tools.convert_ISO_to_epoch(str(travel_start_date - timedelta(minutes=curr_zone_offset)), '%Y-%m-%d %H:%M:%S')
-    time_change_meta_event = make_time_change_event(timestamp, curr_zone, travel_start_date, start_travel, travel_zone)
-    before_travel.append(time_change_meta_event)
+    itinerary.append(('events', [make_time_change_event(timestamp, curr_zone, travel_start_date, start_travel,
+                                                         travel_zone, rng)]))
 
+    itinerary.append(('segment', (travel_days, travel_zone, start_travel, sub_seed(seed, 'during'))))
     timestamp = tools.convert_ISO_to_epoch(str(end_travel - timedelta(minutes=new_zone_offset)), '%Y-%m-%d %H:%M:%S')
     end_travel_in_timezone = start_travel + timedelta(days=travel_days)
-    time_change_meta_event = make_time_change_event(timestamp, travel_zone,end_travel_in_timezone, end_travel, curr_zone)
-    during_travel.append(time_change_meta_event)
+    itinerary.append(('events', [make_time_change_event(timestamp, travel_zone, end_travel_in_timezone, end_travel,
+                                                         curr_zone, rng)]))
 
-    result += before_travel + during_travel + after_travel
-    return result
+    itinerary.append(('segment', (days_after, curr_zone, end_travel, sub_seed(seed, 'after'))))
+    return itinerary
 
-def select_travel_destination(curr_zone):
+def select_travel_destination(curr_zone, rng=random):
     """Select a random travel destination for each travel event"""
     possible_destinations = ['US/Pacific', 'US/Mountain', 'US/Central', 'US/Eastern', 
                             'Mexico/General', 'Australia/Sydney', 'Europe/London', 
                             'Europe/Moscow', 'Europe/Copenhagen', 'Japan', 'Singapore']
     #randomley select a destination
-    random_index = random.randint(0, len(possible_destinations) - 1)
+    random_index = rng.randint(0, len(possible_destinations) - 1)
     destination = possible_destinations[random_index]
     #make sure destination does not match curr_zone
     if destination == curr_zone:
-        destination = select_travel_destination(curr_zone)
+        destination = select_travel_destination(curr_zone, rng)
     return destination
@@ -1,119 +1,198 @@
+import numpy as np
 import random
 
-from .bolus import (square_bolus, normal_bolus, dual_square_bolus,
-                    check_bolus_time)
+from .bolus import (NORMAL, DUAL_SQUARE, SQUARE, bolus_amounts, fill_bolus)
 from . import common_fields
 from . import insulin_on_board
-from .pump_settings import make_pump_settings
+from .intervals import IntervalIndex
+from .pump_settings import PumpSettings
+from .streams import make_id
 from . import tools
 
 
 def wizard(start_time, gluc, carbs, timesteps, bolus_data, no_wizard,
-           zonename, pump_name):
+           zonename, pump_name, pump_settings=None, rng=random):
     """ Construct a wizard event
+        Events are built in two passes: the random choices of every wizard
+        and its bolus are drawn first, in the order the single-event bolus
+        functions draw them, then settings, insulin on board and the
+        recommended doses are computed for all timestamps at once.
         start_time -- a datetime object with a timezone
         gluc -- a list of glucose values at each timestep
         carbs -- a list of carb events at each timestep
         timesteps -- a list of epoch times
         bolus_data -- of list of bolus data dictionaries to calculate IOB
-        no_wizard -- a list of lists of start and end times (in epoch time)
-                     during which there should be no bolus events, for example,
-                     if the pump is suspended
+        no_wizard -- an IntervalIndex of times during which there should be
+                     no bolus events, for example, if the pump is suspended,
+                     or a list of lists of start and end times (in epoch time)
         zonename -- name of timezone in effect
+        pump_settings -- a PumpSettings object shared by every datatype,
+                         created if not given
+        rng -- random number generator to draw from
     """
+    if pump_settings is None:
+        pump_settings = PumpSettings(start_time, zonename, pump_name, rng)
+    if not isinstance(no_wizard, IntervalIndex):
+        no_wizard = IntervalIndex(no_wizard)
+    timesteps = np.asarray(timesteps, dtype=float)
+    keep = ~no_wizard.mask(timesteps)
+    gluc = np.asarray(gluc, dtype=float)[keep]
+    carbs = np.asarray(carbs, dtype=float)[keep]
+    timesteps = timesteps[keep]
+
+    # first pass: random choices
+    draws = draw_wizard_boluses(carbs.tolist(), rng)
+
+    # second pass: settings, boluses and insulin on board of every event
+    offsets = common_fields.get_offsets(timesteps, zonename)
+    ms_since_midnight = tools.ms_since_midnight(timesteps, offsets)
+    carb_ratio = pump_settings.carb_ratio_schedule.values_at(
+        ms_since_midnight)
+    sensitivity = pump_settings.sensitivity_schedule.values_at(
+        ms_since_midnight)
+    insulin = np.trunc(draws["value"]) / carb_ratio
+    amounts = bolus_amounts(insulin, draws["subtype"], draws["split"],
+                            draws["delivered_fraction"], draws["duration"],
+                            draws["interruption_time"])
+    columns = [draws["subtype"], draws["interrupted"],
+               draws["interrupt_normal"], draws["duration"]]
+    columns += list(amounts[:3]) + [draws["interruption_time"], amounts[3]]
+    bolus_events = common_fields.make_common_fields(
+        'bolus', timesteps, offsets, draws["bolus_id"])
+    associated_boluses = [
+        fill_bolus(bolus_entry, *row) for bolus_entry, row in
+        zip(bolus_events, zip(*[column.tolist() for column in columns]))]
+
+    iob_index = insulin_on_board.IOBIndex(bolus_data,
+                                          pump_settings.action_time)
+    iob = running_insulin_on_board(iob_index, associated_boluses, timesteps)
+    insulin_on_board_mmol = tools.convert_to_mmol(iob)
+    carb_input = np.trunc(carbs).astype(np.int64)
+    recommended_carb = tools.round_to(carb_input / carb_ratio)
+    net = (recommended_carb + 0) - tools.round_to(insulin_on_board_mmol)
+    bg_target = wizard_bg_target(pump_settings.settings, pump_name)
+
     wizard_data = []
-    pump_settings = make_pump_settings(start_time, zonename, pump_name)[0]
-    iob_dict = insulin_on_board.create_iob_dict(bolus_data,
-                                                pump_settings["actionTime"])
-    for gluc_val, carb_val, timestamp in zip(gluc, carbs, timesteps):
-        if check_bolus_time(timestamp, no_wizard):
-            wizard_reading = {}
-            wizard_reading = common_fields.add_common_fields('wizard',
-                                                             wizard_reading,
-                                                             timestamp,
-                                                             zonename)
-            wizard_reading["bgInput"] = tools.convert_to_mmol(gluc_val)
-            wizard_reading["carbInput"] = int(carb_val)
-            iob = insulin_on_board.insulin_on_board(iob_dict, int(timestamp))
-            wizard_reading["insulinOnBoard"] = tools.convert_to_mmol(iob)
+    wizard_events = common_fields.make_common_fields(
+        'wizard', timesteps, offsets, draws["wizard_id"])
+    rows = zip(wizard_events, associated_boluses,
+               tools.convert_to_mmol(gluc).tolist(), carb_input.tolist(),
+               insulin_on_board_mmol.tolist(), sensitivity.tolist(),
+               carb_ratio.tolist(), recommended_carb.tolist(), net.tolist())
+    for (wizard_reading, associated_bolus, bg_input, carb_value, iob_value,
+         sensitivity_value, carb_ratio_value, carb, net_value) in rows:
+        wizard_reading["bgInput"] = bg_input
+        wizard_reading["carbInput"] = carb_value
+        wizard_reading["insulinOnBoard"] = iob_value
+        if bg_target is not None:
+            wizard_reading["bgTarget"] = dict(bg_target)
+        wizard_reading["insulinSensitivity"] = sensitivity_value
+        wizard_reading["insulinCarbRatio"] = carb_ratio_value
+        wizard_reading["recommended"] = {"carb": carb, "correction": 0,
+                                         "net": net_value}
+        wizard_reading["units"] = "mmol/L"
+        wizard_reading["bolus"] = associated_bolus["id"]
+        wizard_data.append(associated_bolus)
+        wizard_data.append(wizard_reading)
+    return wizard_data, iob_index
 
-            # pump specific input:
-            if pump_name == 'Medtronic' or pump_name == 'OmniPod':
-                carb_ratio_sched = pump_settings["carbRatio"]
-                sensitivity_sched = pump_settings["insulinSensitivity"]
 
-                if pump_name == 'Medtronic':
-                    wizard_reading["bgTarget"] = {
-                        "high": pump_settings["bgTarget"][0]["high"],
-                        "low": pump_settings["bgTarget"][0]["low"]
-                    }
-                elif pump_name == 'OmniPod':
-                    wizard_reading["bgTarget"] = {
-                        "high": pump_settings["bgTarget"][0]["high"],
-                        "target": pump_settings["bgTarget"][0]["target"]
-                    }
-            elif pump_name == 'Tandem':
-                target = pump_settings["bgTargets"]["standard"][0]["target"]
-                wizard_reading["bgTarget"] = {"target": target}
-                carb_ratio_sched = pump_settings["carbRatios"]["standard"]
-                sensitivity_sched = \
-                    pump_settings["insulinSensitivities"]["standard"]
+def draw_wizard_boluses(carbs, rng=random):
+    """ Draw the random choices of every wizard event and its bolus
+        The draws happen in the same order as when each wizard event called
+        a single-event bolus function, so a seeded run is not changed by
+        batching. Uniform draws are kept as fractions, to be scaled once the
+        carb ratios are known.
+        carbs -- a list of carb values
+        Returns a dictionary of numpy arrays, and of lists for the ids.
+    """
+    names = ["subtype", "value", "split", "delivered_fraction", "duration",
+             "interrupted", "interrupt_normal", "interruption_time"]
+    rows, wizard_ids, bolus_ids = [], [], []
+    for carb_val in carbs:
+        wizard_ids.append(make_id(rng))
+        normal_or_square = rng.randint(0, 9)
+        if normal_or_square == 1 or normal_or_square == 2:
+            subtype = DUAL_SQUARE
+        elif normal_or_square == 3:
+            subtype = SQUARE
+        else:
+            subtype = NORMAL
+        value = override_wizard_random(carb_val, rng) or carb_val
+        bolus_id = make_id(rng)
+        split, delivered_fraction, duration = 0.0, 0.0, 0
+        interrupted, interrupt_normal, interruption_time = False, False, 0
+        if subtype == DUAL_SQUARE:
+            split = rng.random()
+            duration = rng.randrange(1800000, 5400000, 300000)
+            interrupted = rng.randint(0, 9) == 1
+            if interrupted:
+                interrupt_normal = rng.randint(0, 1) == 1
+                bolus_id = make_id(rng)
+                if interrupt_normal:
+                    delivered_fraction = rng.random()
+                else:
+                    interruption_time = rng.randrange(300000, duration,
+                                                      300000)
+        elif subtype == SQUARE:
+            duration = rng.randrange(1800000, 5400000, 300000)
+        else:
+            interrupted = rng.randint(0, 9) == 1
+            if interrupted:
+                bolus_id = make_id(rng)
+                delivered_fraction = rng.random()
+        bolus_ids.append(bolus_id)
+        rows.append((subtype, value, split, delivered_fraction, duration,
+                     interrupted, interrupt_normal, interruption_time))
+    draws = {"wizard_id": wizard_ids, "bolus_id": bolus_ids}
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    for name, column in zip(names, columns):
+        draws[name] = np.array(column)
+    draws["subtype"] = draws["subtype"].astype(int)
+    draws["value"] = draws["value"].astype(float)
+    draws["duration"] = draws["duration"].astype(np.int64)
+    draws["interrupted"] = draws["interrupted"].astype(bool)
+    draws["interrupt_normal"] = draws["interrupt_normal"].astype(bool)
+    draws["interruption_time"] = draws["interruption_time"].astype(np.int64)
+    return draws
 
-            sensitivity = tools.get_rate_from_settings(
-                              sensitivity_sched, wizard_reading["deviceTime"],
-                              "insulinSensitivity")
-            carb_ratio = tools.get_rate_from_settings(
-                             carb_ratio_sched, wizard_reading["deviceTime"],
-                             "carbRatio")
-            wizard_reading["insulinSensitivity"] = sensitivity
-            wizard_reading["insulinCarbRatio"] = carb_ratio
 
-            wizard_reading["recommended"] = {}
-            carb = (wizard_reading["carbInput"] /
-                    wizard_reading["insulinCarbRatio"])
-            wizard_reading["recommended"]["carb"] = tools.round_to(carb)
-            wizard_reading["recommended"]["correction"] = 0
-            corrected_carb = (wizard_reading["recommended"]["carb"] +
-                              wizard_reading["recommended"]["correction"])
-            iob = tools.round_to(wizard_reading["insulinOnBoard"])
-            wizard_reading["recommended"]["net"] = (corrected_carb - iob)
-            wizard_reading["units"] = "mmol/L"
-            normal_or_square = random.randint(0, 9)
-            if normal_or_square == 1 or normal_or_square == 2:
-                bolus_func = dual_square_bolus
-            elif normal_or_square == 3:
-                bolus_func = square_bolus
-            else:
-                bolus_func = normal_bolus
+def running_insulin_on_board(iob_index, associated_boluses, timesteps):
+    """ Return the insulin on board of each wizard event
+        Each wizard event sees the boluses in iob_index, and the boluses of
+        the wizard events before it, but not its own or those of the events
+        after it, even when events are not in time order. The boluses of all
+        events are added in one merge, numbered by event, and every event is
+        looked up at once.
+        iob_index -- an IOBIndex, updated with the associated boluses
+        associated_boluses -- a list with the bolus of each wizard event
+        timesteps -- a numpy array of epoch times
+    """
+    sources = list(range(len(associated_boluses)))
+    iob_index.add_boluses(associated_boluses, sources)
+    return iob_index.insulin_on_board_many(np.trunc(timesteps), sources)
 
-            override = override_wizard_random(carb_val)
-            if override:
-                associated_bolus = bolus_func(
-                                       override, timestamp, start_time,
-                                       no_wizard, zonename, pump_name)
-                wizard_reading["bolus"] = associated_bolus["id"]
-                wizard_data.append(associated_bolus)
-            else:
-                associated_bolus = bolus_func(
-                                       carb_val, timestamp, start_time,
-                                       no_wizard, zonename, pump_name)
-                wizard_reading["bolus"] = associated_bolus["id"]
-                wizard_data.append(associated_bolus)
 
-            iob_dict = insulin_on_board.update_iob_dict(
-                           iob_dict, [associated_bolus],
-                           pump_settings["actionTime"])
-            wizard_data.append(wizard_reading)
-    return wizard_data, iob_dict
+def wizard_bg_target(settings, pump_name):
+    """ Return the bgTarget of wizard events, which depends on the pump"""
+    if pump_name == 'Medtronic':
+        return {"high": settings["bgTarget"][0]["high"],
+                "low": settings["bgTarget"][0]["low"]}
+    elif pump_name == 'OmniPod':
+        return {"high": settings["bgTarget"][0]["high"],
+                "target": settings["bgTarget"][0]["target"]}
+    elif pump_name == 'Tandem':
+        return {"target": settings["bgTargets"]["standard"][0]["target"]}
+    return None
 
 
-def override_wizard_random(carb_val):
+def override_wizard_random(carb_val, rng=random):
     """ Returns a new carb value when the user overrides the recommended bolus
         Otherwise returns False
     """
-    override = random.randint(0, 4)
+    override = rng.randint(0, 4)
     if override == 3:
-        user_overridden_bolus = carb_val + random.randrange(-30, 30, 5)
+        user_overridden_bolus = carb_val + rng.randrange(-30, 30, 5)
         if user_overridden_bolus >= 1:
             return user_overridden_bolus
     return False
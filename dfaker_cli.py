@@ -1,5 +1,7 @@
 #usage: dfaker_cli.py [-h] [-z ZONE] [-d DATE] [-t TIME] [-n NUM_DAYS]
-#                     [-f FILE] [-m] [-g] [-s SMBG_FREQ] [-r] [-p PUMP]
+#                     [-f FILE] [-m] [-g] [-s SMBG_FREQ] [-r] [-p PUMP] [-j]
+#                     [-N PATIENTS] [-P PROCESSES] [-c CHUNK_DAYS] [-S SEED]
+#                     [-C CACHE_DIR] [-M CACHE_SIZE] [-o]
 #
 #optional arguments:
 # -h,           --help               show this help message and exit
@@ -13,15 +15,30 @@
 # -s SMBG_FREQ, --smbg SMBG_FREQ     Freqency of fingersticks a day: high, average or low
 # -r,           --travel             Add travel option
 # -p PUMP,      --pump PUMP          Specify pump name
+# -j,           --ndjson             Write one json event per line
+# -N PATIENTS,  --patients PATIENTS  Number of patients, each written to a numbered output file
+# -P PROCESSES, --processes PROCESSES
+#                                    Number of worker processes generating data in parallel
+# -c CHUNK_DAYS, --chunk_days CHUNK_DAYS
+#                                    Split each patient into ranges of days generated in parallel
+# -S SEED,      --seed SEED          Seed that makes the output reproducible
+# -C CACHE_DIR, --cache_dir CACHE_DIR
+#                                    Directory caching glucose simulations of seeded runs
+# -M CACHE_SIZE, --cache_size CACHE_SIZE
+#                                    Maximum size of the cache in megabytes
+# -o,           --time_ordered       Write events in time order instead of grouped by datatype
 
 from datetime import datetime
 import pytz
-import json
 import argparse 
+import os
 import sys
 
-from dfaker.data_generator import dfaker
-from dfaker.travel import travel
+from dfaker.data_generator import make_pipeline
+from dfaker.json_writer import JSONArrayWriter, NDJSONWriter
+from dfaker.parallel import iter_patient_events
+from dfaker.pipeline import merge_by_time
+from dfaker.solution_cache import SolutionCache
 
 def parse(args, params):
     if args.date:
@@ -52,12 +69,29 @@ def parse(args, params):
     if args.num_days:
         try:
             params['num_days'] = int(args.num_days)
-        except:
+        except ValueError:
             print('Wrong input, num_days argument should be an integer')
             sys.exit(1)
+        if params['num_days'] <= 0:
+            print('Wrong input, num_days argument should be a positive integer')
+            sys.exit(1)
+
+    if args.ndjson:
+        params['ndjson'] = True
+
+    for name in ['patients', 'processes', 'chunk_days', 'cache_size']:
+        value = getattr(args, name)
+        if value:
+            try:
+                params[name] = int(value)
+            except ValueError:
+                params[name] = 0
+            if params[name] <= 0:
+                print('Wrong input, {:s} argument should be a positive integer'.format(name))
+                sys.exit(1)
 
     if args.file:
-        if args.file[-5:] != '.json':
+        if args.file[-5:] != '.json' and not (args.ndjson and args.file[-7:] == '.ndjson'):
             print('Output file name should have a .json extension')
             sys.exit(1)
         params['file'] = args.file
@@ -65,6 +99,9 @@ def parse(args, params):
     if args.minify:
         params['minify'] = True
 
+    if args.time_ordered:
+        params['time_ordered'] = True
+
     if args.gaps:
         params['gaps'] = True
 
@@ -82,6 +119,15 @@ def parse(args, params):
     if args.travel:
         params['travel'] = True
 
+    if args.seed:
+        params['seed'] = args.seed
+
+    if args.cache_dir:
+        if not args.seed:
+            print('The cache option requires a seed, unseeded simulations are never reused')
+            sys.exit(1)
+        params['cache_dir'] = args.cache_dir
+
     if args.pump:
         if args.pump == 'OmniPod':
             params['pump_name'] = 'OmniPod'
@@ -108,7 +154,15 @@ def main():
         'gaps' : False, #randomized gaps in data, off by default 
         'smbg_freq' : 6, #default number of fingersticks per day
         'travel': False, #no travelling takes place by default 
-        'pump_name': 'Medtronic' #default pump name
+        'pump_name': 'Medtronic', #default pump name
+        'ndjson': False, #json array output by default
+        'patients': 1, #number of patients to generate data for
+        'processes': None, #data is generated in a single process by default
+        'chunk_days': None, #patients are not split into ranges of days by default
+        'seed': None, #output is not reproducible by default
+        'cache_dir': None, #glucose simulations are not cached by default
+        'cache_size': 512, #maximum size of the cache in megabytes
+        'time_ordered': False #events are grouped by datatype by default
     }
 
     parser = argparse.ArgumentParser()
@@ -122,27 +176,112 @@ def main():
     parser.add_argument('-s', '--smbg', dest='smbg_freq', help='Freqency of fingersticks a day: high, average or low')
     parser.add_argument('-r', '--travel', dest='travel', action='store_true', help='Add travel option')
     parser.add_argument('-p', '--pump', dest='pump', help='Specify pump name')
+    parser.add_argument('-j', '--ndjson', dest='ndjson', action='store_true', help='Write one json event per line')
+    parser.add_argument('-N', '--patients', dest='patients', help='Number of patients, each written to a numbered output file')
+    parser.add_argument('-P', '--processes', dest='processes', help='Number of worker processes generating data in parallel')
+    parser.add_argument('-c', '--chunk_days', dest='chunk_days', help='Split each patient into ranges of days generated in parallel')
+    parser.add_argument('-S', '--seed', dest='seed', help='Seed that makes the output reproducible')
+    parser.add_argument('-C', '--cache_dir', dest='cache_dir', help='Directory caching glucose simulations of seeded runs')
+    parser.add_argument('-M', '--cache_size', dest='cache_size', help='Maximum size of the cache in megabytes')
+    parser.add_argument('-o', '--time_ordered', dest='time_ordered', action='store_true',
+                        help='Write events in time order instead of grouped by datatype')
     args = parser.parse_args()
     params = parse(args, params)
+    if params['cache_dir']:
+        params['solution_cache'] = SolutionCache(params['cache_dir'], max_bytes=params['cache_size'] * 1024 * 1024)
+    else:
+        params['solution_cache'] = None
+
+    #if travelling occurs during simulation, the segments in each timezone are generated in parallel
+    if params['patients'] > 1 or params['processes'] or params['chunk_days'] or params['travel']:
+        write_patients(params)
+        sys.exit(0)
 
-    #if travelling occurs during simulation, generate data in multiple timezones 
-    if params['travel']:
-        result = (travel(params['num_days'], params['datetime'],params['zone'], 
-                params['gaps'], params['smbg_freq'], params['pump_name']))
     #if not travelling, generate data within a single timezone
-    else:
-        result = (dfaker(params['num_days'], params['zone'], params['datetime'], params['gaps'],
-                 params['smbg_freq'], params['pump_name']))
+    pipeline = (make_pipeline(params['num_days'], params['zone'], params['datetime'], params['gaps'],
+                params['smbg_freq'], params['pump_name'], seed=params['seed'],
+                solution_cache=params['solution_cache']))
 
-    #write to json file
-    file_object = open(params['file'], mode='w')
-    if params['minify']: #for most compact file: separators=(',', ':')
-        json.dump(result, fp=file_object, sort_keys=True, separators=(',', ':'))
-    else:
-        json.dump(result, fp=file_object, sort_keys=True, indent=4) 
-    file_object.close()
+    #write to json file as each event is generated, moved into place once complete
+    file_object = open_output(params['file'])
+    try:
+        writer = make_writer(file_object, params)
+        pipeline.drain(writer, time_ordered=params['time_ordered'])
+        writer.close()
+    except BaseException:
+        discard_output(file_object)
+        raise
+    close_output(file_object, params['file'])
 
     sys.exit(0)
 
+def open_output(file_name):
+    """ Open a temporary file next to file_name, so that a failed run leaves no partial output
+        The file is moved into place by close_output, or removed by discard_output.
+    """
+    return open('{:s}.{:d}.tmp'.format(file_name, os.getpid()), mode='w')
+
+def close_output(file_object, file_name):
+    file_object.close()
+    os.replace(file_object.name, file_name)
+
+def discard_output(file_object):
+    file_object.close()
+    os.remove(file_object.name)
+
+def make_writer(file_object, params):
+    if params['ndjson']:
+        return NDJSONWriter(file_object, minify=params['minify'])
+    #for most compact file: separators=(',', ':')
+    return JSONArrayWriter(file_object, minify=params['minify'])
+
+def patient_file_name(file_name, patient_index, patients):
+    """ Number output files when generating several patients: device-data-1.json, ..."""
+    if patients == 1:
+        return file_name
+    base, extension = file_name.rsplit('.', 1)
+    return '{:s}-{:d}.{:s}'.format(base, patient_index + 1, extension)
+
+def write_patients(params):
+    """ Generate patients in a pool of worker processes, writing each range of days as it arrives"""
+    patient = {
+        'num_days': params['num_days'],
+        'zonename': params['zone'],
+        'date_time': params['datetime'],
+        'gaps': params['gaps'],
+        'smbg_freq': params['smbg_freq'],
+        'pump_name': params['pump_name'],
+        'travel': params['travel'],
+        'time_ordered': params['time_ordered']
+    }
+    patients = [patient] * params['patients']
+    file_object, file_name, writer, current, ranges = None, None, None, None, []
+    try:
+        for patient_index, events in iter_patient_events(patients, processes=params['processes'],
+                                                         chunk_days=params['chunk_days'], seed=params['seed'],
+                                                         solution_cache=params['solution_cache']):
+            if patient_index != current: #ranges arrive in patient order
+                if writer:
+                    close_patient(file_object, file_name, writer, ranges)
+                file_name = patient_file_name(params['file'], patient_index, params['patients'])
+                file_object = open_output(file_name)
+                writer = make_writer(file_object, params)
+                current, ranges = patient_index, []
+            if params['time_ordered']: #ranges of days or travel segments may overlap, merged once all arrived
+                ranges.append(events)
+            else:
+                writer.write_all(events)
+        close_patient(file_object, file_name, writer, ranges)
+    except BaseException:
+        if file_object and not file_object.closed: #patients already written are kept
+            discard_output(file_object)
+        raise
+
+def close_patient(file_object, file_name, writer, ranges):
+    """ Write the time ordered merge of the ranges of days of a patient, if any, and move its file into place"""
+    writer.write_all(merge_by_time(ranges))
+    writer.close()
+    close_output(file_object, file_name)
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
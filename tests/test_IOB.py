@@ -115,6 +115,59 @@ class Test_IOB(Chai):
         expected_boundry_output = 5.0
         self.assertEqual(expected_boundry_output, insulin_on_board.insulin_on_board(curr_dict, boundry_time))
 
+    def test_iob_index(self):
+        """ Check insulin on board from the interval index, including incremental updates"""
+        start_time = tools.convert_ISO_to_epoch('2015-03-03T00:00:00.000Z', '%Y-%m-%dT%H:%M:%S.000Z')
+        bolus_data = [{"normal": 6, "subType": "normal", "time": "2015-03-03T00:00:00.000Z"}]
+        iob_index = insulin_on_board.IOBIndex(bolus_data, action_time=1)
+        self.assertEqual(iob_index.insulin_on_board(start_time - 60), 0)
+        self.assertEqual(iob_index.insulin_on_board(start_time), 6.0)
+        self.assertEqual(iob_index.insulin_on_board(start_time + 30*60), 3.0)
+        self.assertEqual(iob_index.insulin_on_board(start_time + 60*60), 0)
+
+        #a second bolus 15 minutes later adds to the first one
+        iob_index.add_boluses([{"normal": 4, "subType": "normal", "time": "2015-03-03T00:15:00.000Z"}])
+        self.assertEqual(iob_index.insulin_on_board(start_time + 45*60), 1.5 + 2.0)
+
+    def test_iob_index_matches_dict(self):
+        """ Check that the interval index agrees with the iob dict"""
+        bolus_data = [{"normal": 6, "subType": "normal", "time": "2015-03-03T00:00:00.000Z"},
+                      {"normal": 3, "extended": 2, "duration": 1800000, "subType": "dual/square",
+                       "time": "2015-03-03T01:00:00.000Z"}]
+        iob_dict = insulin_on_board.create_iob_dict(bolus_data, action_time=3)
+        iob_index = insulin_on_board.IOBIndex(bolus_data, action_time=3)
+        #the dict drops the last five minutes of each dose, compare before those
+        last_time = tools.convert_ISO_to_epoch('2015-03-03T02:55:00.000Z', '%Y-%m-%dT%H:%M:%S.000Z')
+        timestamps = [timestamp for timestamp in sorted(iob_dict.keys())[::7] if timestamp < last_time]
+        for timestamp in timestamps:
+            self.assertAlmostEqual(iob_dict[timestamp], iob_index.insulin_on_board(timestamp))
+
+    def test_iob_index_batch(self):
+        """ Check that batched queries match single queries"""
+        bolus_data = [{"normal": 6, "subType": "normal", "time": "2015-03-03T00:00:00.000Z"},
+                      {"normal": 2, "subType": "normal", "time": "2015-03-03T02:30:00.000Z"},
+                      {"extended": 2, "duration": 3600000, "subType": "square",
+                       "time": "2015-03-03T03:00:00.000Z"}]
+        iob_index = insulin_on_board.IOBIndex(bolus_data, action_time=3)
+        start_time = tools.convert_ISO_to_epoch('2015-03-03T00:00:00.000Z', '%Y-%m-%dT%H:%M:%S.000Z')
+        timestamps = [start_time + minutes*60 for minutes in range(-10, 400, 7)]
+        expected = [iob_index.insulin_on_board(timestamp) for timestamp in timestamps]
+        self.assertEqual(expected, iob_index.insulin_on_board_many(timestamps).tolist())
+
+    def test_iob_index_extended(self):
+        """ Check that an extended bolus is summed as its doses given every minute"""
+        bolus_data = [{"normal": 1, "extended": 3, "duration": 5430000, "subType": "dual/square",
+                       "time": "2015-03-03T00:00:00.000Z"}]
+        iob_index = insulin_on_board.IOBIndex(bolus_data, action_time=2)
+        doses = insulin_on_board.format_bolus_for_iob_calc(bolus_data)
+        self.assertEqual(len(doses), 1 + 91)
+        start_time = tools.convert_ISO_to_epoch('2015-03-03T00:00:00.000Z', '%Y-%m-%dT%H:%M:%S.000Z')
+        for minutes in range(-5, 240, 11):
+            timestamp = start_time + minutes*60 + 17
+            expected = sum(dose - dose / 2 * (timestamp - time) / 3600 for time, dose in doses
+                           if time <= timestamp < time + 2*60*60)
+            self.assertAlmostEqual(expected, iob_index.insulin_on_board(timestamp))
+
 def suite():
     """ Gather all the tests from this module in a test suite """
     test_suite = unittest.TestSuite()
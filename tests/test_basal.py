@@ -68,6 +68,31 @@ class Test_Basal(Chai):
                     else:
                         self.assertEqual(entry['rate'], rate_nine)
 
+    def test_tile_schedule_dst(self):
+        """ Test that the schedule follows local time across a time change"""
+        schedule = tools.Schedule([{"start": 0, "rate": 0.5}, {"start": 12 * 3600000, "rate": 1.0}],
+                                  "basalSchedules")
+        first_time = tools.convert_ISO_to_epoch('2015-03-07 08:00:00', '%Y-%m-%d %H:%M:%S')
+        end_time = first_time + 3 * 24 * 60 * 60
+        starts, ends, rates = basal.tile_schedule(schedule, 'US/Pacific', first_time, end_time)
+        durations = ((ends - starts) / 3600).tolist()
+        self.assertEqual(durations[:4], [12, 12, 11, 12]) #the morning of March 8th is an hour short
+        self.assertEqual(rates.tolist()[:4], [0.5, 1.0, 0.5, 1.0])
+
+    def test_basal_continuous(self):
+        """ Test that every basal starts when the previous one ends, overrides included"""
+        start_time = datetime(2015, 3, 1, 0, 0, 0)
+        res_dict, suspend_pump = basal.scheduled_basal(start_time, 20, 'US/Pacific', 'Medtronic')
+        next_time = None
+        for entry in res_dict:
+            if entry["type"] == "basal":
+                entry_time = tools.convert_ISO_to_epoch(entry["time"][:19], '%Y-%m-%dT%H:%M:%S')
+                if next_time is not None:
+                    self.assertAlmostEqual(entry_time, next_time, delta=1)
+                next_time = entry_time + entry["duration"] / 1000
+        self.assertEqual(len(suspend_pump),
+                         len([entry for entry in res_dict if entry.get("status") == "suspended"]))
+
 def suite():
     """ Gather all the tests from this module in a test suite """
     test_suite = unittest.TestSuite()
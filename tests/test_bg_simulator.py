@@ -0,0 +1,41 @@
+from chai import Chai
+import random
+import numpy as np
+
+import dfaker.bg_simulator as bg_simulator
+
+
+class Test_BG_Simulator(Chai):
+
+    def test_analytic_matches_odeint(self):
+        """ Test that the batch analytic engine produces the same curves as odeint"""
+        random.seed(7)
+        odeint_solution = bg_simulator.simulate(10, method='odeint')
+        random.seed(7)
+        analytic_solution = bg_simulator.simulate(10, method='analytic')
+        self.assertEqual(odeint_solution.shape, analytic_solution.shape)
+        self.assertTrue(np.allclose(odeint_solution, analytic_solution, atol=1e-3))
+
+    def test_batch_matches_simulator(self):
+        """ Test that a batch of segments matches the single segment simulator"""
+        segments = [[120, 100, 0.05, 0.01, 150, 0],
+                    [-80, 140, 0.07, 0.07, 103, 155], #equal rates
+                    [40, 90, 0.04, 0.03, 5, 263]] #single point
+        expected = np.concatenate([bg_simulator.simulator(*segment) for segment in segments])
+        result = bg_simulator.batch_simulator(segments)
+        self.assertEqual(expected.shape, result.shape)
+        self.assertTrue(np.allclose(expected, result, atol=1e-4))
+
+    def test_unknown_method(self):
+        """ Test that an unknown simulation method is rejected"""
+        self.assertRaises(ValueError, bg_simulator.simulate, 1, 'euler')
+
+    def test_state_continues_simulation(self):
+        """ Test that simulate_state ends in the state of a full simulation"""
+        random.seed(11)
+        solution = bg_simulator.simulate(3)
+        random.seed(11)
+        sugar, last_carbs, sugar_in_range = bg_simulator.simulate_state(3)
+        self.assertAlmostEqual(solution[-1][1], sugar, places=6)
+        continued = bg_simulator.simulate(1, initial_state=(sugar, last_carbs, sugar_in_range))
+        self.assertEqual(continued[0][1], sugar) #first point of the next simulation
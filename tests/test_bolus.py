@@ -4,6 +4,8 @@ import numpy as np
 
 import dfaker.tools as tools
 import dfaker.bolus as bolus
+from dfaker.pump_settings import PumpSettings
+from datetime import datetime
 
 
 class Test_Bolus(Chai):
@@ -29,6 +31,37 @@ class Test_Bolus(Chai):
         result_kept = bolus.remove_night_boluses(test_high_night_event, zonemane) 
         self.assertEqual(expected_kept_event, np.ndarray.tolist(result_kept))
 
+    def test_bolus_or_wizard(self):
+        """ Test that meals are split between plain boluses and wizard events"""
+        meals = np.column_stack((np.arange(6000), np.arange(6000), np.arange(6000)))
+        bolus_events, wizard_events = bolus.bolus_or_wizard(meals)
+        self.assertEqual(6000, len(bolus_events) + len(wizard_events))
+        self.assertTrue(1700 < len(bolus_events) < 2300) #about 2 in 6
+        self.assertEqual(list(range(6000)), sorted(bolus_events[:, 0].tolist() + wizard_events[:, 0].tolist()))
+        self.assertEqual((0, 3), bolus.bolus_or_wizard([])[0].shape)
+
+    def test_batched_boluses(self):
+        """ Test that boluses are built in one batch, skipping suspended times"""
+        start_time = datetime(2015, 1, 1, 0, 0, 0)
+        pump_settings = PumpSettings(start_time, 'US/Pacific', 'Medtronic')
+        timesteps = 1420099200 + np.arange(1000) * 3600.0
+        carbs = np.full(1000, 60.0)
+        suspended = [[timesteps[10], timesteps[19]]]
+        result = bolus.bolus(start_time, carbs, timesteps, suspended, 'US/Pacific', 'Medtronic', pump_settings)
+        self.assertEqual(990, len(result))
+        subtypes = [entry["subType"] for entry in result]
+        self.assertTrue(600 < subtypes.count("normal") < 800)
+        self.assertTrue(50 < subtypes.count("square") < 150)
+        for entry in result:
+            carb_ratio = pump_settings.carb_ratio(tools.convert_ISO_to_epoch(entry["time"], '%Y-%m-%dT%H:%M:%S.000Z'),
+                                                  entry["timezoneOffset"])
+            if entry["subType"] == "square":
+                self.assertEqual(tools.round_to(60 / carb_ratio), entry["extended"])
+            elif entry["subType"] == "normal":
+                self.assertEqual(tools.round_to(60 / carb_ratio), entry.get("expectedNormal", entry["normal"]))
+            elif "expectedDuration" in entry:
+                self.assertTrue(entry["duration"] < entry["expectedDuration"])
+
 def suite():
     """ Gather all the tests from this module in a test suite """
     test_suite = unittest.TestSuite()
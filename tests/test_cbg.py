@@ -0,0 +1,26 @@
+from chai import Chai
+import numpy as np
+
+from dfaker import tools
+from dfaker.cbg import cbg, cbg_table
+
+
+class Test_Cbg(Chai):
+
+    def test_out_of_range(self):
+        """ Test values, annotations and low alarms of out of range readings"""
+        gluc = np.array([120, 450, 30, 400, 40])
+        timesteps = [0, 300, 600, 900, 1200]
+        events = cbg(gluc, timesteps, 'UTC')
+        readings = [event for event in events if event["type"] == "cbg"]
+        alarms = [event for event in events if event["type"] == "deviceEvent"]
+        expected = [tools.convert_to_mmol(value) for value in [120, 401, 39, 400, 40]]
+        self.assertEqual(expected, [reading["value"] for reading in readings])
+        self.assertEqual("high", readings[1]["annotation"][0]["value"])
+        self.assertEqual("low", readings[2]["annotation"][0]["value"])
+        self.assertEqual(["annotation" in reading for reading in readings], [False, True, True, False, False])
+        self.assertEqual(1, len(alarms))
+        self.assertEqual(readings[2]["time"], alarms[0]["time"])
+
+    def test_empty(self):
+        self.assertEqual([], cbg_table([], [], 'UTC').to_list())
@@ -7,3 +7,18 @@ from dfaker.data_generator import dfaker
 class Test_Pump_Settings(Chai):
     def test_smoke(self):
         pass
+
+    def test_seeded_output(self):
+        """ Test that a seed reproduces the same data, ids included"""
+        first = dfaker(3, 'US/Pacific', datetime(2015, 3, 1), True, 6, 'Medtronic', seed=42)
+        second = dfaker(3, 'US/Pacific', datetime(2015, 3, 1), True, 6, 'Medtronic', seed=42)
+        self.assertEqual(first, second)
+        other = dfaker(3, 'US/Pacific', datetime(2015, 3, 1), True, 6, 'Medtronic', seed=43)
+        self.assertNotEqual(first, other)
+
+    def test_independent_stages(self):
+        """ Test that stages draw from their own streams, unaffected by the other stages"""
+        def cbg_events(pump_name):
+            data = dfaker(3, 'US/Pacific', datetime(2015, 3, 1), False, 6, pump_name, seed=7)
+            return [event for event in data if event["type"] == "cbg"]
+        self.assertEqual(cbg_events('Medtronic'), cbg_events('Tandem'))
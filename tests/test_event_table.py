@@ -0,0 +1,43 @@
+from chai import Chai
+
+from dfaker.event_table import EventTable, MergedTables
+import dfaker.common_fields as common_fields
+import dfaker.tools as tools
+
+
+class Test_Event_Table(Chai):
+
+    def test_events_match_common_fields(self):
+        """ Test that events built from a table match events built one by one"""
+        timestamps = [tools.convert_ISO_to_epoch('2015-03-03 00:00:00', '%Y-%m-%d %H:%M:%S'),
+                      tools.convert_ISO_to_epoch('2015-07-03 12:30:00', '%Y-%m-%d %H:%M:%S')]
+        zonename = 'US/Pacific'
+        table = EventTable('cbg', timestamps, zonename, columns={"value": [5.5, 7.25]},
+                           constants={"units": "mmol/L"})
+        events = table.to_list()
+        self.assertEqual(len(events), 2)
+        for event, timestamp, value in zip(events, timestamps, [5.5, 7.25]):
+            expected = common_fields.add_common_fields('cbg', {}, timestamp, zonename)
+            for key in ['type', 'time', 'deviceTime', 'timezoneOffset', 'deviceId',
+                        'uploadId', 'conversionOffset']:
+                self.assertEqual(event[key], expected[key])
+            self.assertEqual(event["value"], value)
+            self.assertEqual(event["units"], "mmol/L")
+
+    def test_categories(self):
+        """ Test that category fields are only added for events with a value"""
+        table = EventTable('smbg', [0, 300], 'UTC')
+        table.add_category("annotation", [0, 1], [None, [{"value": "high"}]])
+        events = table.to_list()
+        self.assertFalse("annotation" in events[0])
+        self.assertEqual(events[1]["annotation"], [{"value": "high"}])
+        self.assertEqual(events[0]["timezoneOffset"], 0)
+
+    def test_merged_tables(self):
+        """ Test that merged tables yield events in time order, keeping table order for ties"""
+        readings = EventTable('cbg', [0, 300, 600], 'UTC')
+        alarms = EventTable('deviceEvent', [300], 'UTC')
+        merged = MergedTables(alarms, readings)
+        types = [event["type"] for event in merged]
+        self.assertEqual(len(merged), 4)
+        self.assertEqual(types, ['cbg', 'deviceEvent', 'cbg', 'cbg'])
@@ -0,0 +1,42 @@
+from chai import Chai
+import unittest
+import numpy as np
+
+from dfaker.intervals import IntervalIndex
+import dfaker.bolus as bolus
+
+class Test_Intervals(Chai):
+
+    def test_merge(self):
+        """ Test that overlapping and touching windows are merged"""
+        index = IntervalIndex([[50, 60], [10, 20.5], [15, 30], [31, 40], [70, 65]])
+        self.assertEqual([[10, 40], [50, 60]], list(index))
+
+    def test_contains(self):
+        """ Test point queries against the range check they replace"""
+        windows = [[100.7, 200.2], [150, 250], [400, 500], [1000, 1000]]
+        index = IntervalIndex(windows)
+        timestamps = np.arange(0, 1100, 0.5)
+        expected = [any(int(t) in range(int(start), int(end) + 1) for start, end in windows)
+                    for t in timestamps]
+        self.assertEqual(expected, [index.contains(t) for t in timestamps])
+        self.assertEqual(expected, index.mask(timestamps).tolist())
+        self.assertEqual(expected, [not bolus.check_bolus_time(t, windows) for t in timestamps])
+
+    def test_empty(self):
+        """ Test that nothing is within an empty index"""
+        index = IntervalIndex([])
+        self.assertFalse(5 in index)
+        self.assertEqual([False, False], index.mask([1, 2]).tolist())
+        self.assertEqual([[1, 2]], list(index.union([[1, 2]])))
+
+def suite():
+    """ Gather all the tests from this module in a test suite """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(Test_Intervals))
+    return test_suite
+
+mySuit = suite()
+
+runner = unittest.TextTestRunner()
+runner.run(mySuit)
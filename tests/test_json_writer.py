@@ -0,0 +1,34 @@
+from chai import Chai
+import io
+import json
+
+from dfaker.json_writer import JSONArrayWriter, NDJSONWriter
+
+
+class Test_JSON_Writer(Chai):
+
+    def setUp(self):
+        super(Test_JSON_Writer, self).setUp()
+        self.events = [{"type": "cbg", "value": 5.5, "annotation": [{"code": "bg/out-of-range"}]},
+                       {"type": "smbg", "value": 7.0}]
+
+    def write(self, writer_class, events, minify):
+        file_object = io.StringIO()
+        writer = writer_class(file_object, minify=minify)
+        writer.write_all(events)
+        writer.close()
+        return file_object.getvalue()
+
+    def test_array_matches_json_dump(self):
+        """ Test that streamed output is identical to a single json.dump"""
+        for events in [self.events, []]:
+            expected = json.dumps(events, sort_keys=True, indent=4)
+            self.assertEqual(expected, self.write(JSONArrayWriter, events, minify=False))
+            expected = json.dumps(events, sort_keys=True, separators=(',', ':'))
+            self.assertEqual(expected, self.write(JSONArrayWriter, events, minify=True))
+
+    def test_ndjson(self):
+        """ Test that every event is written on its own line"""
+        lines = self.write(NDJSONWriter, self.events, minify=False).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual([json.loads(line) for line in lines], self.events)
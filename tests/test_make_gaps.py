@@ -0,0 +1,39 @@
+from chai import Chai
+import numpy as np
+import random
+
+from dfaker import make_gaps
+
+
+class Test_Make_Gaps(Chai):
+
+    def test_matches_list_removal(self):
+        """ Test that the mask removes the same rows as removing gaps one at a time"""
+        data = np.arange(300).reshape(100, 3)
+        gap_list = [[80, 90], [40, 52], [3, 13]] #sorted in reverse, as create_gap_list returns
+        expected = data.tolist()
+        for start, end in gap_list:
+            expected = make_gaps.remove_gaps(expected, start, end)
+        result = data[make_gaps.keep_mask(len(data), gap_list)]
+        self.assertEqual(expected, result.tolist())
+
+    def test_overlapping_gaps(self):
+        """ Test that overlapping gaps remove their union, and that gaps are clipped to the data"""
+        mask = make_gaps.keep_mask(10, [[1, 4], [2, 6], [8, 15], [9, 5]])
+        expected = [True, False, False, False, False, False, True, True, False, False]
+        self.assertEqual(expected, mask.tolist())
+        self.assertEqual([True] * 3, make_gaps.keep_mask(3, []).tolist())
+
+    def test_gap_model(self):
+        """ Test the arrival rate, lengths and warm-up gaps of a gap model"""
+        rng = random.Random(3)
+        model = make_gaps.GapModel(rate=4, min_length=2, max_length=6)
+        readings = int(make_gaps.READINGS_PER_DAY * 100)
+        gap_list = model.gap_list(readings, rng)
+        self.assertTrue(300 < len(gap_list) < 500) #about 400 gaps over 100 days
+        self.assertTrue(all(2 <= end - start <= 6 for start, end in gap_list))
+
+        model = make_gaps.GapModel(rate=0, sensor_days=10, warmup_length=24)
+        gap_list = model.gap_list(readings, rng)
+        self.assertEqual(10, len(gap_list))
+        self.assertEqual([2880, 2904], gap_list[1])
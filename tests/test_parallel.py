@@ -0,0 +1,75 @@
+from chai import Chai
+from datetime import datetime
+
+from dfaker.parallel import generate_patients, make_tasks
+from dfaker.streams import sub_seed
+from dfaker.travel import travel
+
+
+class Test_Parallel(Chai):
+
+    def setUp(self):
+        super(Test_Parallel, self).setUp()
+        self.patient = {'num_days': 6, 'zonename': 'US/Pacific', 'date_time': datetime(2015, 3, 1),
+                        'gaps': False, 'smbg_freq': 6, 'pump_name': 'Medtronic'}
+
+    def test_chunk_tasks(self):
+        """ Test that a patient is split into contiguous day ranges sharing pump settings"""
+        tasks = make_tasks(0, self.patient, 4, seed=1)
+        self.assertEqual(2, len(tasks))
+        first, second = tasks
+        self.assertEqual(4, first[1]['num_days'])
+        self.assertEqual(2, second[1]['num_days'])
+        self.assertEqual(datetime(2015, 3, 5), second[1]['date_time'])
+        self.assertEqual(None, first[3])
+        self.assertEqual(3, len(second[3])) #glucose state carried over
+        self.assertTrue(first[4] is second[4])
+        self.assertEqual([True, False], [first[5], second[5]])
+
+    def test_seeded_patients(self):
+        """ Test that seeded patients are reproducible and only emit settings once"""
+        patients = [self.patient, dict(self.patient, pump_name='Tandem')]
+        result = generate_patients(patients, processes=1, chunk_days=4, seed=5)
+        repeated = generate_patients(patients, processes=1, chunk_days=4, seed=5)
+        self.assertEqual(2, len(result))
+        for events, repeated_events in zip(result, repeated):
+            self.assertEqual(events, repeated_events)
+            settings = [event for event in events if event['type'] == 'pumpSettings']
+            self.assertEqual(1, len(settings))
+
+    def test_chunk_boundaries(self):
+        """ Test that day ranges do not repeat the reading they meet at"""
+        for chunk_days in [2, 4]:
+            events = generate_patients([self.patient], processes=1, chunk_days=chunk_days, seed=5)[0]
+            times = [event['time'] for event in events if event['type'] == 'cbg']
+            self.assertEqual(len(times), len(set(times)))
+            smbg_times = [event['time'] for event in events if event['type'] == 'smbg']
+            self.assertEqual(len(smbg_times), len(set(smbg_times)))
+            #the reading on the minute a range starts is only emitted by that range
+            self.assertEqual(1, times.count('2015-03-05T08:00:00.000Z'))
+
+    def test_travel_segments(self):
+        """ Test that a travelling patient is generated segment by segment, as travel does"""
+        patient = dict(self.patient, num_days=20, travel=True)
+        tasks = make_tasks(0, patient, None, seed=3)
+        self.assertEqual(5, len(tasks)) #before, time change, during, time change, after
+        self.assertEqual(['US/Pacific', 'US/Pacific'], [tasks[0][1]['zonename'], tasks[4][1]['zonename']])
+        self.assertEqual(1, len(tasks[1][1]['events']))
+        result = generate_patients([patient], processes=2, seed=3)
+        expected = travel(20, datetime(2015, 3, 1), 'US/Pacific', False, 6, 'Medtronic', seed=sub_seed(3, 0))
+        self.assertEqual(expected, result[0])
+
+    def test_time_ordered(self):
+        """ Test that time ordered patients are merged across day ranges and travel segments"""
+        patients = [dict(self.patient, time_ordered=True), dict(self.patient, num_days=20, travel=True)]
+        result = generate_patients(patients, processes=1, chunk_days=4, seed=5)
+        grouped = generate_patients([dict(patient, time_ordered=False) for patient in patients],
+                                    processes=1, chunk_days=4, seed=5)
+        self.assertEqual(sorted(grouped[0], key=lambda event: event['time']), result[0])
+        self.assertEqual(grouped[1], result[1])
+        travelling = generate_patients([dict(self.patient, num_days=20, travel=True, time_ordered=True)],
+                                       processes=1, seed=5)
+        expected = travel(20, datetime(2015, 3, 1), 'US/Pacific', False, 6, 'Medtronic', seed=sub_seed(5, 0),
+                          time_ordered=True)
+        self.assertEqual(expected, travelling[0])
+        self.assertEqual(sorted(expected, key=lambda event: event['time']), expected)
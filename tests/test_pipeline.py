@@ -0,0 +1,69 @@
+from chai import Chai
+import unittest
+from datetime import datetime
+import io
+import json
+
+from dfaker.pipeline import Pipeline, merge_by_time
+from dfaker.data_generator import dfaker, generate_stages, make_pipeline
+from dfaker.json_writer import NDJSONWriter
+
+class Test_Pipeline(Chai):
+
+    def test_lazy_stages(self):
+        """ Test that a stage only runs once the events before it are consumed"""
+        calls = []
+        def first(state):
+            calls.append('first')
+            state['count'] = 2
+            return [{'stage': 'first'}]
+        def second(state):
+            calls.append('second')
+            return ({'stage': 'second', 'index': index} for index in range(state.pop('count')))
+        pipeline = Pipeline().add_stage('first', first).add_stage('second', second)
+        self.assertEqual(['first', 'second'], pipeline.names())
+        events = iter(pipeline)
+        self.assertEqual([], calls)
+        self.assertEqual({'stage': 'first'}, next(events))
+        self.assertEqual(['first'], calls)
+        self.assertEqual([{'stage': 'second', 'index': 0}, {'stage': 'second', 'index': 1}], list(events))
+        self.assertEqual({}, pipeline.state)
+
+    def test_drain(self):
+        """ Test that draining the data pipeline writes the events of every stage in order"""
+        args = (3, 'US/Pacific', datetime(2015, 3, 1), True, 6, 'Medtronic')
+        pipeline = make_pipeline(*args, seed=5)
+        self.assertEqual(['simulate', 'settings', 'basal', 'bolus', 'wizard', 'cbg', 'smbg'], pipeline.names())
+        file_object = io.StringIO()
+        count = pipeline.drain(NDJSONWriter(file_object))
+        written = [json.loads(line) for line in file_object.getvalue().splitlines()]
+        expected = [event for stage in generate_stages(*args, seed=5) for event in stage]
+        self.assertEqual(len(expected), count)
+        self.assertEqual(json.loads(json.dumps(expected)), written)
+
+    def test_merge_by_time(self):
+        """ Test that sorted streams are merged as a stable sort of their concatenation"""
+        streams = [[{'time': '2015-03-01T00:00:00.000Z', 'id': 'a'}, {'time': '2015-03-01T00:05:00.000Z', 'id': 'b'}],
+                   iter([{'time': '2015-03-01T00:00:00.000Z', 'id': 'c'}, {'time': '2015-03-01T00:02:00.000Z', 'id': 'd'},
+                         {'time': '2015-03-01T00:05:00.000Z', 'id': 'e'}]),
+                   []]
+        merged = [event['id'] for event in merge_by_time(streams)]
+        self.assertEqual(['a', 'c', 'd', 'b', 'e'], merged)
+
+    def test_time_ordered(self):
+        """ Test that time ordered output matches sorting the output grouped by datatype"""
+        args = (4, 'US/Pacific', datetime(2015, 3, 7), True, 6, 'OmniPod')
+        grouped = dfaker(*args, seed=11)
+        ordered = dfaker(*args, seed=11, time_ordered=True)
+        self.assertEqual(sorted(grouped, key=lambda event: event['time']), ordered)
+
+def suite():
+    """ Gather all the tests from this module in a test suite """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(Test_Pipeline))
+    return test_suite
+
+mySuit = suite()
+
+runner = unittest.TextTestRunner()
+runner.run(mySuit)
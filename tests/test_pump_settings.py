@@ -1,7 +1,7 @@
 from chai import Chai
 from datetime import datetime
 
-from dfaker.pump_settings import make_pump_settings
+from dfaker.pump_settings import make_pump_settings, PumpSettings
 
 
 class Test_Pump_Settings(Chai):
@@ -13,3 +13,18 @@ class Test_Pump_Settings(Chai):
         settings_data = settings_list[0]
 
         self.assert_equals(settings_data['type'], 'pumpSettings')
+
+    def test_shared_settings(self):
+        """ Test that lookups from shared settings match the emitted settings event"""
+        start_time = datetime(2015, 1, 1, 0, 0, 0)
+        zone_name = 'UTC'
+        for pump_name in ['Medtronic', 'OmniPod', 'Tandem']:
+            pump_settings = PumpSettings(start_time, zone_name, pump_name)
+            settings_data = pump_settings.settings_data[0]
+            if pump_name == 'Tandem':
+                carb_ratio = settings_data["carbRatios"]["standard"]
+            else:
+                carb_ratio = settings_data["carbRatio"]
+            timestamp = 1420113600 #2015-01-01 12:00 UTC
+            self.assert_equals(pump_settings.carb_ratio(timestamp, 0), carb_ratio[1]["amount"])
+            self.assert_equals(pump_settings.action_time, settings_data["actionTime"])
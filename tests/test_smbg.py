@@ -0,0 +1,46 @@
+from chai import Chai
+import unittest
+import numpy as np
+
+import dfaker.smbg as smbg
+import dfaker.tools as tools
+
+class Test_Smbg(Chai):
+
+    def test_sticks_per_day(self):
+        """ Test that each local day gets the requested number of fingersticks"""
+        first_time = tools.convert_ISO_to_epoch('2015-03-01 08:00:00', '%Y-%m-%d %H:%M:%S') #local midnight
+        last_time = first_time + 14 * 24 * 60 * 60 - 1
+        times = smbg.stick_times(first_time, last_time, 5, 'US/Pacific')
+        self.assertEqual(14 * 5, len(times))
+        self.assertTrue(np.all(np.diff(times) > 0))
+
+    def test_profile(self):
+        """ Test that no stick is drawn in the hours the profile leaves out"""
+        first_time = tools.convert_ISO_to_epoch('2015-01-01 00:00:00', '%Y-%m-%d %H:%M:%S')
+        last_time = first_time + 30 * 24 * 60 * 60
+        profile = [0] * 12 + [1] * 12 #afternoon and evening only
+        times = smbg.stick_times(first_time, last_time, 4, 'UTC', profile=profile)
+        hours = (times % 86400) // 3600
+        self.assertTrue(np.all(hours >= 12))
+
+    def test_smbg_readings(self):
+        """ Test that fingersticks read the glucose value at their time"""
+        timesteps = 1420070400 + np.arange(288 * 3) * 300.0
+        gluc = np.full(len(timesteps), 700.0)
+        readings = smbg.smbg(gluc, timesteps, 6, 'UTC')
+        self.assertEqual(18, len(readings))
+        for reading in readings:
+            self.assertEqual(tools.convert_to_mmol(601), reading["value"])
+            self.assertEqual("high", reading["annotation"][0]["value"])
+
+def suite():
+    """ Gather all the tests from this module in a test suite """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(Test_Smbg))
+    return test_suite
+
+mySuit = suite()
+
+runner = unittest.TextTestRunner()
+runner.run(mySuit)
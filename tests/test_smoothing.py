@@ -0,0 +1,62 @@
+from chai import Chai
+import numpy as np
+from multiprocessing import Pool
+import random
+import statsmodels.api as sm
+
+from dfaker import bg_simulator
+from dfaker import smoothing
+from dfaker.cbg import apply_loess
+
+
+class Test_Smoothing(Chai):
+
+    def setUp(self):
+        super(Test_Smoothing, self).setUp()
+        random.seed(5)
+        self.solution = bg_simulator.simulate(4)
+        self.frac = (1.5 / (4 * 60 * 24)) * 100
+
+    def test_windowed_matches_lowess(self):
+        """ Test that the windowed lowess matches statsmodels lowess"""
+        gluc, time = self.solution[:, 1], self.solution[:, 2]
+        expected = sm.nonparametric.lowess(gluc, time, frac=self.frac, is_sorted=True)
+        for block in [100, smoothing.BLOCK_SIZE]:
+            result = smoothing.windowed_lowess(gluc, time, frac=self.frac, block=block)
+            self.assertTrue(np.allclose(expected, result, rtol=0, atol=1e-8))
+
+    def test_no_robustifying_iterations(self):
+        """ Test the windowed lowess without robustifying iterations"""
+        gluc, time = self.solution[:, 1], self.solution[:, 2]
+        expected = sm.nonparametric.lowess(gluc, time, frac=0.05, it=0, is_sorted=True)
+        result = smoothing.windowed_lowess(gluc, time, frac=0.05, it=0)
+        self.assertTrue(np.allclose(expected, result, rtol=0, atol=1e-8))
+
+    def test_block_tasks(self):
+        """ Test that each block is sent with its own slice of the data, in a process pool too"""
+        gluc, time = self.solution[:, 1], self.solution[:, 2]
+        sizes = []
+        def sized_map(function, tasks):
+            sizes.extend(len(task[0]) for task in tasks)
+            return map(function, tasks)
+        expected = smoothing.windowed_lowess(gluc, time, frac=self.frac, block=100)
+        result = smoothing.windowed_lowess(gluc, time, frac=self.frac, block=100, map_function=sized_map)
+        self.assertTrue(np.array_equal(expected, result))
+        self.assertTrue(max(sizes) < 100 + 2 * smoothing.neighbors(self.frac, len(time)))
+        with Pool(2) as pool:
+            pooled = smoothing.windowed_lowess(gluc, time, frac=self.frac, block=100, map_function=pool.map)
+        self.assertTrue(np.array_equal(expected, pooled))
+
+    def test_kernel_smooth(self):
+        """ Test that the kernel smoother keeps the times and stays close to lowess"""
+        gluc, time = self.solution[:, 1], self.solution[:, 2]
+        result = smoothing.kernel_smooth(gluc, time, frac=self.frac)
+        expected = sm.nonparametric.lowess(gluc, time, frac=self.frac, is_sorted=True)
+        self.assertTrue(np.array_equal(time, result[:, 0]))
+        self.assertTrue(np.median(np.abs(result[:, 1] - expected[:, 1])) < 5)
+        constant = smoothing.kernel_smooth(np.full(10, 120.0), np.arange(10.0), frac=0.5)
+        self.assertTrue(np.allclose(120, constant[:, 1]))
+
+    def test_unknown_smoother(self):
+        """ Test that an unknown smoother is rejected"""
+        self.assertRaises(ValueError, apply_loess, self.solution, 4, False, smoother='spline')
@@ -0,0 +1,60 @@
+from chai import Chai
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from dfaker import bg_simulator
+from dfaker.solution_cache import SolutionCache
+from dfaker.streams import stage_rng
+
+
+class Test_Solution_Cache(Chai):
+
+    def setUp(self):
+        super(Test_Solution_Cache, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(Test_Solution_Cache, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_cached_solution(self):
+        """ Test that a cached solution matches a new simulation and is read back from disk"""
+        cache = SolutionCache(self.directory)
+        expected = bg_simulator.simulate(2, rng=stage_rng('seed', 'simulate'))
+        first = cache.simulate(2, 'seed')
+        self.assertTrue(np.array_equal(expected, first))
+        self.mock(bg_simulator, 'simulate') #a cache hit does not simulate again
+        second = cache.simulate(2, 'seed')
+        self.assertTrue(isinstance(second, np.memmap))
+        self.assertTrue(np.array_equal(expected, second))
+
+    def test_different_keys(self):
+        """ Test that the key depends on every simulation argument"""
+        cache = SolutionCache(self.directory)
+        keys = set([cache.key('seed', 2), cache.key('other', 2), cache.key('seed', 3),
+                    cache.key('seed', 2, method='odeint'), cache.key('seed', 2, initial_state=(100, 0, []))])
+        self.assertEqual(5, len(keys))
+        key = cache.key('seed', 2)
+        version = bg_simulator.MODEL_VERSION
+        try:
+            bg_simulator.MODEL_VERSION = version + 1 #a changed model does not read old solutions
+            self.assertNotEqual(key, cache.key('seed', 2))
+        finally:
+            bg_simulator.MODEL_VERSION = version
+
+    def test_evict_least_recently_used(self):
+        """ Test that the least recently used solutions are removed first"""
+        solution = np.zeros((100, 3))
+        cache = SolutionCache(self.directory, max_bytes=10 ** 6)
+        for index, key in enumerate(['a', 'b', 'c']):
+            cache.put(key, solution)
+            os.utime(cache.path(key), (index, index))
+        cache.get('a') #a becomes the most recently used
+        size = os.path.getsize(cache.path('a'))
+        cache.max_bytes = 2 * size
+        cache.evict()
+        self.assertEqual(None, cache.get('b'))
+        self.assertTrue(cache.get('a') is not None)
+        self.assertTrue(cache.get('c') is not None)
@@ -0,0 +1,102 @@
+from chai import Chai
+from datetime import datetime, timedelta
+import numpy as np
+import pytz
+import time
+
+from dfaker.timezones import zone_table
+import dfaker.common_fields as common_fields
+import dfaker.tools as tools
+
+
+class Test_Timezones(Chai):
+
+    def test_offsets_around_time_change(self):
+        """ Test offsets right before and after the spring forward and fall back instants"""
+        table = zone_table('US/Pacific')
+        spring_forward = tools.convert_ISO_to_epoch('2015-03-08 10:00:00', '%Y-%m-%d %H:%M:%S')
+        fall_back = tools.convert_ISO_to_epoch('2015-11-01 09:00:00', '%Y-%m-%d %H:%M:%S')
+        self.assertEqual(table.utc_offset(spring_forward - 1), -480)
+        self.assertEqual(table.utc_offset(spring_forward), -420)
+        self.assertEqual(table.utc_offset(fall_back - 1), -420)
+        self.assertEqual(table.utc_offset(fall_back), -480)
+
+        timestamps = [spring_forward - 1, spring_forward, fall_back - 1, fall_back]
+        self.assertEqual(table.utc_offsets(timestamps).tolist(), [-480, -420, -420, -480])
+
+    def test_zones_without_transitions(self):
+        """ Test offsets for UTC and for a fixed offset zone"""
+        self.assertEqual(zone_table('UTC').utc_offsets([0, 1e9]).tolist(), [0, 0])
+        self.assertEqual(zone_table('Etc/GMT+5').utc_offset(1e9), -300)
+
+    def test_bulk_formatting(self):
+        """ Test bulk formatted offsets and times against pytz, around every time change"""
+        for zonename in ZONES:
+            timestamps = np.array(utc_samples(zonename))
+            offsets = common_fields.get_offsets(timestamps, zonename)
+            times = common_fields.format_times(timestamps)
+            device_times = common_fields.format_device_times(timestamps, offsets)
+            for i, timestamp in enumerate(timestamps.tolist()):
+                offset = pytz_utc_offset(zonename, timestamp)
+                self.assertEqual(offset, offsets[i], (zonename, timestamp))
+                self.assertEqual(time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp)), times[i])
+                self.assertEqual(time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp + offset * 60)),
+                                 device_times[i])
+
+    def test_local_offsets_match_pytz(self):
+        """ Test offsets of local times against pytz, including ambiguous and non-existent ones"""
+        for zonename in ZONES:
+            table = zone_table(zonename)
+            local_seconds = local_samples(zonename)
+            dates = [EPOCH + timedelta(seconds=seconds) for seconds in local_seconds]
+            expected = [pytz_local_offset(zonename, date) for date in dates]
+            self.assertEqual(expected, [tools.get_offset(zonename, date) for date in dates], zonename)
+            self.assertEqual(expected, table.local_offsets(local_seconds).tolist(), zonename)
+
+ZONES = ['US/Pacific', 'Europe/London', 'Australia/Sydney', 'Australia/Lord_Howe',
+         'America/St_Johns', 'Asia/Kolkata', 'UTC']
+EPOCH = datetime(1970, 1, 1)
+
+def pytz_local_offset(zonename, date):
+    """ Offset (in minutes) of a timezone naive local datetime, as tools.get_offset first defined it"""
+    local_tz = pytz.timezone(zonename)
+    if zonename == 'UTC':
+        return 0
+    is_dst = local_tz.localize(date).dst() != timedelta(0)
+    return local_tz.utcoffset(date, is_dst=is_dst).total_seconds() / 60
+
+def pytz_utc_offset(zonename, timestamp):
+    """ Offset (in minutes) from UTC in effect at an epoch time, according to pytz"""
+    utc_time = pytz.utc.localize(datetime.utcfromtimestamp(timestamp))
+    offset = utc_time.astimezone(pytz.timezone(zonename)).utcoffset().total_seconds() / 60
+    return 0 if zonename == 'UTC' else offset
+
+def transitions(zonename):
+    """ Epoch times of the time changes of a timezone from 2014 to 2016, with the offsets
+        (in minutes) before and after each of them
+    """
+    zone = pytz.timezone(zonename)
+    result = []
+    for i, transition in enumerate(getattr(zone, '_utc_transition_times', [])):
+        if i and datetime(2014, 1, 1) <= transition < datetime(2017, 1, 1):
+            before = zone._transition_info[i - 1][0].total_seconds() / 60
+            after = zone._transition_info[i][0].total_seconds() / 60
+            result.append(((transition - EPOCH).total_seconds(), before, after))
+    return result
+
+def utc_samples(zonename):
+    """ Epoch times right around each time change, and random ones from 2000 to 2030"""
+    samples = [instant + delta for instant, before, after in transitions(zonename)
+               for delta in [-3601, -1, -0.5, 0, 0.5, 1, 1799, 3600]]
+    return samples + np.random.RandomState(4).uniform(946684800, 1893456000, 500).tolist()
+
+def local_samples(zonename):
+    """ Local times (in seconds since 1970-01-01 local time) around each time change: before,
+        within and after the window of local times that are ambiguous or do not exist
+    """
+    samples = []
+    for instant, before, after in transitions(zonename):
+        start = instant + min(before, after) * 60
+        end = instant + max(before, after) * 60
+        samples += [start - 60, start - 1, start, start + 1, (start + end) / 2, end - 1, end, end + 1, end + 60]
+    return samples + np.random.RandomState(5).randint(946684800, 1893456000, 500).tolist()
@@ -1,9 +1,11 @@
 from chai import Chai
+import numpy as np
 import pytz
 import unittest
 from datetime import datetime
 
 import dfaker.tools as tools
+from dfaker.timezones import zone_table
 
 class Test_Tools(Chai):
 
@@ -34,6 +36,26 @@ class Test_Tools(Chai):
         expected_offset = 720
         self.assertEqual(expected_offset, tools.get_offset(nz_zone, no_dst_date))
 
+    def test_ambiguous_and_missing_offsets(self):
+        """ Test that ambiguous and non-existent local times resolve to standard time"""
+        pacific_zone = 'US/Pacific'
+        non_existent_date = datetime(2015, 3, 8, 2, 30, 0) #03/08/2015 2:30 AM is skipped
+        ambiguous_date = datetime(2015, 11, 1, 1, 30, 0) #11/01/2015 1:30 AM happens twice
+        expected_offset = -480
+        self.assertEqual(expected_offset, tools.get_offset(pacific_zone, non_existent_date))
+        self.assertEqual(expected_offset, tools.get_offset(pacific_zone, ambiguous_date))
+
+    def test_batch_offsets(self):
+        """ Test that batch offset queries match single queries"""
+        pacific_zone = 'US/Pacific'
+        dates = [datetime(2015, 3, 8, 1, 59, 0), datetime(2015, 3, 8, 2, 30, 0),
+                 datetime(2015, 3, 8, 3, 0, 0), datetime(2015, 11, 1, 0, 59, 0),
+                 datetime(2015, 11, 1, 1, 30, 0), datetime(2015, 11, 1, 2, 0, 0)]
+        local_seconds = [tools.convert_ISO_to_epoch(str(date), '%Y-%m-%d %H:%M:%S') for date in dates]
+        expected = [tools.get_offset(pacific_zone, date) for date in dates]
+        result = zone_table(pacific_zone).local_offsets(local_seconds)
+        self.assertEqual(expected, result.tolist())
+
     def test_mmol_conversion(self):
         """ Test conversion from mg/dL to mmol for an iterable and for individual floats or integers"""
         input_list = [180, 150, 110, 80, 50]
@@ -83,6 +105,34 @@ class Test_Tools(Chai):
         self.assertEqual(expected_5min_output, tools.make_timesteps(start_time, offset, time_list_every_5min))
         self.assertEqual(expected_hourly_output, tools.make_timesteps(start_time, offset, time_list_every_hour))
 
+    def test_compiled_schedule(self):
+        """ Test that compiled schedule lookups match get_rate_from_settings"""
+        schedule = [{"amount": 10, "start": 0},
+                    {"amount": 12, "start": 36000000},
+                    {"amount": 15, "start": 72000000}]
+        compiled = tools.Schedule(schedule, "carbRatio")
+        device_times = ['2015-01-01T00:00:00', '2015-01-01T09:59:59', '2015-01-01T10:00:00',
+                        '2015-01-01T19:59:59', '2015-01-01T20:00:00', '2015-01-01T23:59:59']
+        ms = [tools.convert_ISO_to_epoch(device_time, '%Y-%m-%dT%H:%M:%S') % 86400 * 1000
+              for device_time in device_times]
+        expected = [tools.get_rate_from_settings(schedule, device_time, "carbRatio")
+                    for device_time in device_times]
+        self.assertEqual(expected, [compiled.value_at(time) for time in ms])
+        self.assertEqual(expected, compiled.values_at(ms).tolist())
+
+        basal_schedule = [{"rate": 0.9, "start": 0}, {"rate": 0.6, "start": 3600000}]
+        compiled_basal = tools.Schedule(basal_schedule, "basalSchedules")
+        self.assertEqual((0.9, 0, 3600000), compiled_basal.lookup(1800000))
+        self.assertEqual((0.6, 3600000, 86400000), compiled_basal.lookup(3600000))
+
+    def test_ms_since_midnight(self):
+        """ Test milliseconds since local midnight for single values and arrays"""
+        timestamp = tools.convert_ISO_to_epoch('2015-01-01 08:30:00', '%Y-%m-%d %H:%M:%S')
+        offset = -480
+        self.assertEqual(1800000, tools.ms_since_midnight(timestamp, offset))
+        timestamps = np.array([timestamp, timestamp + 3600.5])
+        self.assertEqual([1800000, 5400000], tools.ms_since_midnight(timestamps, offset).tolist())
+
 def suite():
     """ Gather all the tests from this module in a test suite """
     test_suite = unittest.TestSuite()
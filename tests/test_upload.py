@@ -0,0 +1,135 @@
+from chai import Chai
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import io
+import json
+import threading
+
+from dfaker.json_writer import JSONArrayWriter, NDJSONWriter
+from upload import BatchUploader, iter_batches, iter_records
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """ Local upload server, fails the first request of each batch listed in flaky with a 503,
+        and every request containing a record marked bad with a 400
+    """
+    daemon_threads = True
+
+    def __init__(self, flaky=()):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.batches = []
+        self.clients = set()
+        self.flaky = set(flaky)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' #keep connections alive
+
+    def do_POST(self):
+        batch = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        with self.server.lock:
+            self.server.clients.add(self.client_address)
+            first_id = batch[0]['id']
+            if first_id in self.server.flaky:
+                self.server.flaky.remove(first_id)
+                status = 503
+            elif any(record.get('bad') for record in batch):
+                status = 400
+            else:
+                status = 200
+                self.server.batches.append(batch)
+        body = json.dumps({'status': status}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Test_Upload(Chai):
+
+    def setUp(self):
+        super(Test_Upload, self).setUp()
+        self.records = [{'id': index, 'value': index * 1.5, 'type': 'cbg'} for index in range(250)]
+
+    def serve(self, flaky=()):
+        server = StubServer(flaky)
+        thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01})
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, 'http://127.0.0.1:{:d}/upload/data'.format(server.server_address[1])
+
+    def test_iter_records(self):
+        """ Test that json arrays and ndjson files are streamed record by record"""
+        for writer_class, minify in [(JSONArrayWriter, False), (JSONArrayWriter, True), (NDJSONWriter, True)]:
+            file_object = io.StringIO()
+            writer = writer_class(file_object, minify=minify)
+            writer.write_all(self.records + [12345, 'text', True, None])
+            writer.close()
+            file_object.seek(0)
+            records = list(iter_records(file_object, chunk_size=7))
+            self.assertEqual(self.records + [12345, 'text', True, None], records)
+        self.assertEqual([], list(iter_records(io.StringIO('[]'))))
+
+    def test_iter_batches(self):
+        batches = list(iter_batches(iter(self.records), 100))
+        self.assertEqual([100, 100, 50], [len(batch) for batch in batches])
+
+    def test_upload(self):
+        """ Test batched concurrent uploads over reused connections, with a retried batch"""
+        server, url = self.serve(flaky=[100])
+        uploader = BatchUploader(url, batch_size=50, workers=2, backoff=0.01)
+        stats = uploader.upload(iter(self.records))
+        self.assertEqual(5, stats.batches)
+        self.assertEqual(250, stats.records)
+        self.assertEqual(1, stats.retries)
+        self.assertEqual([], stats.errors)
+        received = sorted((record for batch in server.batches for record in batch),
+                          key=lambda record: record['id'])
+        self.assertEqual(self.records, received)
+        self.assertTrue(len(server.clients) <= 2) #one connection per worker at most
+        self.assertTrue(stats.to_dict()['records_per_second'] > 0)
+
+    def test_batch_errors(self):
+        """ Test that a rejected batch is reported without stopping the upload or retrying"""
+        server, url = self.serve()
+        self.records[120]['bad'] = True
+        uploader = BatchUploader(url, batch_size=50, workers=3, backoff=0.01)
+        stats = uploader.upload(self.records)
+        self.assertEqual(200, stats.records)
+        self.assertEqual(0, stats.retries)
+        self.assertEqual(1, stats.failed_batches)
+        self.assertEqual(50, stats.failed_records)
+        error = stats.errors[0]
+        self.assertEqual((2, 100, 50, 1, 400), (error['batch'], error['first_record'], error['records'],
+                                                error['attempts'], error['status']))
+
+    def test_connection_errors(self):
+        """ Test that batches are retried, then reported, when the server cannot be reached"""
+        server, url = self.serve()
+        server.shutdown()
+        server.server_close()
+        uploader = BatchUploader(url, batch_size=100, workers=2, retries=2, backoff=0.01)
+        stats = uploader.upload(self.records)
+        self.assertEqual(0, stats.records)
+        self.assertEqual(3, stats.failed_batches)
+        self.assertEqual([3, 3, 3], [error['attempts'] for error in stats.errors])
+        self.assertEqual([None, None, None], [error['status'] for error in stats.errors])
+
+def suite():
+    """ Gather all the tests from this module in a test suite """
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(unittest.makeSuite(Test_Upload))
+    return test_suite
+
+mySuit = suite()
+
+runner = unittest.TextTestRunner()
+runner.run(mySuit)
@@ -1,8 +1,11 @@
 from chai import Chai
+import random
 import unittest
+import numpy as np
 from datetime import datetime
 
 import dfaker.wizard as wizard
+import dfaker.insulin_on_board as insulin_on_board
 import dfaker.tools as tools
 
 
@@ -178,6 +181,48 @@ class Test_Wizard(Chai):
         # should remain
         self.assertEqual(len(res_dict), 4)
 
+    def test_running_iob(self):
+        """ Test that each wizard event sees the boluses of the events before
+            it, whether or not the events are in time order"""
+        start_time = datetime(2015, 1, 1, 0, 0, 0)
+        first = tools.convert_ISO_to_epoch('2015-01-01 12:00:00',
+                                           '%Y-%m-%d %H:%M:%S')
+        for timesteps in ([first, first + 3600], [first, first]):
+            rng = random.Random(4)
+            res_dict, iob_index = wizard.wizard(start_time, [100, 100],
+                                                [60, 60], timesteps, [], [],
+                                                'UTC', 'Medtronic', rng=rng)
+            self.assertEqual(0, res_dict[1]["insulinOnBoard"])
+            self.assertTrue(res_dict[3]["insulinOnBoard"] > 0)
+            first_bolus = insulin_on_board.IOBIndex([res_dict[0]],
+                                                    iob_index.action_time)
+            expected = first_bolus.insulin_on_board(timesteps[1])
+            self.assertEqual(tools.convert_to_mmol(expected),
+                             res_dict[3]["insulinOnBoard"])
+
+    def test_running_iob_out_of_order(self):
+        """ Test that events out of time order only see the boluses of the
+            events before them, as when adding each bolus to the index in turn"""
+        first = tools.convert_ISO_to_epoch('2015-01-01 12:00:00',
+                                           '%Y-%m-%d %H:%M:%S')
+        timesteps = np.array([first + 600, first, first, first + 1800.5,
+                              first + 900])
+        boluses = []
+        for index, timestamp in enumerate(timesteps.tolist()):
+            boluses.append({"subType": "dual/square", "normal": index + 1,
+                            "extended": 2, "duration": 1830000 * index,
+                            "time": datetime.utcfromtimestamp(
+                                int(timestamp)).strftime(
+                                    '%Y-%m-%dT%H:%M:%S.000Z')})
+        iob_index = insulin_on_board.IOBIndex([], action_time=3)
+        iob = wizard.running_insulin_on_board(iob_index, boluses, timesteps)
+        expected_index = insulin_on_board.IOBIndex([], action_time=3)
+        expected = []
+        for timestamp, bolus in zip(timesteps.tolist(), boluses):
+            expected.append(expected_index.insulin_on_board(int(timestamp)))
+            expected_index.add_boluses([bolus])
+        self.assertEqual(expected, iob.tolist())
+        self.assertEqual(len(expected_index), len(iob_index))
 
 def suite():
     """ Gather all the tests from this module in a test suite """
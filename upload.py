@@ -1,10 +1,182 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import argparse
 import requests
+from requests.adapters import HTTPAdapter
 from pymongo import MongoClient
 import json
+import time
+
+RETRY_STATUS = (429, 500, 502, 503, 504) #responses worth sending a batch again for
 
 def print_formatted(data):
     print(json.dumps(data, indent=4, sort_keys=True))
 
+def iter_records(file_object, chunk_size=1 << 16):
+    """ Yield the records of a json array, or of newline delimited json, one at a time
+        The file is read chunk_size characters at a time, so only the records being parsed
+        are held in memory. Both outputs of json_writer.py can be read.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, done = '', 0, False
+    while True:
+        #skip whitespace and the brackets and commas between records
+        while position < len(buffer) and buffer[position] in ' \t\r\n[],':
+            position += 1
+        if position == len(buffer):
+            if done:
+                return
+            buffer, position = file_object.read(chunk_size), 0
+            done = not buffer
+            continue
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if done:
+                raise
+            chunk = file_object.read(chunk_size) #record continues in the next chunk
+            buffer, position = buffer[position:] + chunk, 0
+            done = not chunk
+            continue
+        if end == len(buffer) and not done:
+            #a number at the end of the buffer may be cut short, parse it again with more data
+            chunk = file_object.read(chunk_size)
+            if chunk:
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            done = True
+        yield record
+        position = end
+
+def iter_batches(records, batch_size):
+    """ Group an iterable of records into lists of at most batch_size records"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def make_session(pool_size):
+    """ Create a requests session keeping up to pool_size connections alive for reuse"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class UploadStats(object):
+    """ Throughput and errors of an upload
+        errors -- a dictionary for each batch that could not be uploaded, with its index, the
+                  index of its first record, its number of records, the number of attempts,
+                  and the status code (None without a response) and text of the last one
+    """
+    def __init__(self):
+        self.batches = 0
+        self.records = 0
+        self.bytes_sent = 0
+        self.retries = 0
+        self.failed_batches = 0
+        self.failed_records = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    def records_per_second(self):
+        return self.records / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {'batches': self.batches, 'records': self.records, 'bytes_sent': self.bytes_sent,
+                'retries': self.retries, 'failed_batches': self.failed_batches,
+                'failed_records': self.failed_records, 'seconds': round(self.seconds, 3),
+                'records_per_second': round(self.records_per_second(), 1)}
+
+
+class BatchUploader(object):
+    """ Upload records in batches, over a pool of keep-alive connections, from a pool of threads
+        Each batch is posted as a json array. A batch that fails with a connection error, a
+        timeout or a status in RETRY_STATUS is sent again after backoff, 2*backoff, 4*backoff...
+        seconds, up to retries times; other failures are reported without retrying. A failed
+        batch does not stop the upload, see UploadStats.errors.
+        url -- url the batches are posted to
+        headers -- a dictionary of headers sent with every batch, such as the session token
+        batch_size -- number of records in each batch
+        workers -- number of batches uploaded at the same time
+        retries -- number of times a batch is sent again after failing
+        backoff -- seconds to wait before the first retry
+        timeout -- seconds to wait for a response
+        session -- a requests session to upload with, created by make_session if not given
+    """
+    def __init__(self, url, headers=None, batch_size=100, workers=4, retries=3, backoff=0.5,
+                 timeout=30, session=None):
+        self._url = url
+        self._headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        self._batch_size = batch_size
+        self._workers = workers
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = timeout
+        self._session = session or make_session(workers)
+
+    def upload(self, records):
+        """ Upload an iterable of records, read from it as batches are sent
+            At most twice as many batches as workers are held in memory at once.
+            Returns an UploadStats.
+        """
+        stats = UploadStats()
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            pending, first_record = set(), 0
+            for batch_index, batch in enumerate(iter_batches(records, self._batch_size)):
+                if len(pending) >= 2 * self._workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect(done, stats)
+                pending.add(executor.submit(self._send, batch_index, first_record, batch))
+                first_record += len(batch)
+            self._collect(pending, stats)
+        stats.errors.sort(key=lambda error: error['batch'])
+        stats.seconds = time.time() - start_time
+        return stats
+
+    def _collect(self, futures, stats):
+        for future in futures:
+            result = future.result()
+            stats.batches += 1
+            stats.bytes_sent += result['bytes_sent']
+            stats.retries += result['attempts'] - 1
+            if result['status'] is not None and 200 <= result['status'] < 300:
+                stats.records += result['records']
+            else:
+                stats.failed_batches += 1
+                stats.failed_records += result['records']
+                stats.errors.append({'batch': result['batch'], 'first_record': result['first_record'],
+                                     'records': result['records'], 'attempts': result['attempts'],
+                                     'status': result['status'], 'error': result['error']})
+
+    def _send(self, batch_index, first_record, batch):
+        """ Post a batch, retrying with backoff, runs in a worker thread"""
+        body = json.dumps(batch, separators=(',', ':')).encode('utf-8')
+        result = {'batch': batch_index, 'first_record': first_record, 'records': len(batch),
+                  'attempts': 0, 'bytes_sent': 0, 'status': None, 'error': None}
+        while True:
+            result['attempts'] += 1
+            result['bytes_sent'] += len(body)
+            try:
+                response = self._session.post(self._url, data=body, headers=self._headers,
+                                              timeout=self._timeout)
+                result['status'], result['error'] = response.status_code, response.text
+                retry = response.status_code in RETRY_STATUS
+            except requests.RequestException as error:
+                result['status'], result['error'] = None, repr(error)
+                retry = True
+            if result['status'] is not None and 200 <= result['status'] < 300:
+                result['error'] = None
+                return result
+            if not retry or result['attempts'] > self._retries:
+                return result
+            time.sleep(self._backoff * 2 ** (result['attempts'] - 1))
+
 class UploadManager(object):
     def __init__(self):
         self._base_url = 'http://localhost:8009'
@@ -17,29 +189,20 @@ class UploadManager(object):
         self._create_user()
         self._login()
 
-    def upload_data(self):
+    def upload_data(self, file_name='upload_data.json', batch_size=100, workers=4):
+        """ Upload the records of a json file, streamed in batches, see BatchUploader"""
         url = self._build_url('/upload/data')
         headers = {self._token_key: self._token}
+        uploader = BatchUploader(url, headers=headers, batch_size=batch_size, workers=workers)
 
-        with open('upload_data.json', 'r') as f:
-            upload_data = json.load(f)
+        with open(file_name, 'r') as f:
+            stats = uploader.upload(iter_records(f))
 
-        print(len(upload_data))
+        print_formatted(stats.to_dict())
+        for error in stats.errors:
+            print_formatted(error)
+        return stats
 
-        index = 0
-        for upload in upload_data:
-            response = requests.post(url, headers=headers, json=upload)
-            if response.status_code == 200:
-                response_data = response.json()
-            else:
-                print(index)
-                print_formatted(upload)
-                print(response)
-                print_formatted(response.text)
-                break
-            index += 1
-
- 
     def _clear_database(self):
         client = MongoClient('localhost', 27017)
         client.drop_database('user')
@@ -74,9 +237,17 @@ class UploadManager(object):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--file', dest='file', default='upload_data.json',
+                        help='Json or ndjson file of records to upload')
+    parser.add_argument('-b', '--batch_size', dest='batch_size', type=int, default=100,
+                        help='Number of records in each upload request')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=4,
+                        help='Number of requests sent at the same time')
+    args = parser.parse_args()
     upload_manager = UploadManager()
     upload_manager.prepare_for_uploads()
-    upload_manager.upload_data()
+    upload_manager.upload_data(args.file, batch_size=args.batch_size, workers=args.workers)
 
 if __name__ == '__main__':
     main()